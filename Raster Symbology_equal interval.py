@@ -1,16 +1,16 @@
 import arcpy
 import os
 import glob
-from arcpy.sa import *  # 引入 Spatial Analyst 模組
+
+from nodata_mask import mask_folder
+from raster_stats import load_or_compute_stats
+from symbology import DEFAULT_CLASSES, global_breaks
 
 def apply_rainfall_symbology_batch(raster_folder):
     """批次對資料夾中的所有 TIF 檔案套用降雨量符號設定"""
     
     print(f"正在處理資料夾: {raster_folder}")
     
-    # 檢查 Spatial Analyst 授權
-    arcpy.CheckOutExtension("Spatial")
-    
     # 創建輸出資料夾
     output_folder = os.path.join(raster_folder, "Raster Symbology")
     if not os.path.exists(output_folder):
@@ -21,6 +21,17 @@ def apply_rainfall_symbology_batch(raster_folder):
     raster_files = glob.glob(os.path.join(raster_folder, "*.tif"))
     print(f"找到 {len(raster_files)} 個柵格檔案")
     
+    # 將 -99.9 設為 NoData 並儲存到輸出資料夾 (取代逐檔 SetNull + save，不需 Spatial Analyst)
+    # 尚未設定 NoData 的柵格只改寫標頭，其餘以分塊改寫；各檔案同時處理
+    mask_folder(raster_folder, output_folder, workers=4)
+    
+    # 所有月份共用的等間隔分界點: 由整體統計 (rain_stats.json，-99.9 不列入) 計算一次，
+    # 不再逐檔讀取 raster.maximum / raster.minimum，不同月份的顏色代表相同的降雨量
+    stats, from_file = load_or_compute_stats(raster_folder)
+    breaks, min_value = global_breaks(stats, 'equal', DEFAULT_CLASSES)
+    print(f"{'沿用' if from_file else '已建立'}整體統計: 最小值 {min_value:.1f}，"
+          f"共用分界點 {', '.join(f'{b:.1f}' for b in breaks)}")
+    
     # 建立 ArcGIS Pro 專案
     aprx = arcpy.mp.ArcGISProject("CURRENT")
     
@@ -48,11 +59,6 @@ def apply_rainfall_symbology_batch(raster_folder):
             # 設定輸出檔案路徑
             output_raster = os.path.join(output_folder, base_filename)
             
-            # 使用 SetNull 將小於 0 的值設為 NoData，並儲存到輸出資料夾
-            outSetNull = SetNull(raster_path, raster_path, "VALUE = -99.9")
-            outSetNull.save(output_raster)
-            print(f"已將小於 0 的值設為 NoData 並儲存至: {output_raster}")
-            
             # 添加處理後的柵格到地圖
             lyr = m.addDataFromPath(output_raster)
             
@@ -67,18 +73,12 @@ def apply_rainfall_symbology_batch(raster_folder):
                 # 取得色彩設定器
                 colorizer = sym.colorizer
                 
-                # 設定分類方法為等間隔
-                colorizer.classificationMethod = "EqualInterval"
-                
-                # 取得柵格的最大值以便進行分組
-                raster = arcpy.Raster(output_raster)
-                max_value = raster.maximum
-                min_value = raster.minimum
+                # 以手動分界點套用共用的等間隔分界點 (EqualInterval 會依單一柵格重新分級)
+                colorizer.classificationMethod = "ManualInterval"
                 
-                print(f"柵格最小值: {min_value}, 最大值: {max_value}")
-                
-                # 設定分界點數量
-                colorizer.breakCount = 9
+                # 設定分界點
+                colorizer.breakCount = len(breaks)
+                colorizer.breakValues = breaks
                 
                 # 設定色彩方案
                 if color_ramp:
@@ -102,9 +102,6 @@ def apply_rainfall_symbology_batch(raster_folder):
             import traceback
             traceback.print_exc()
     
-    # 釋放 Spatial Analyst 授權
-    arcpy.CheckInExtension("Spatial")
-    
     print("\n所有柵格符號設定完成")
 
 # 使用方式
@@ -2,6 +2,8 @@ import arcpy
 import os
 import glob
 
+from nodata_mask import is_float_raster
+
 def apply_rainfall_symbology_batch(raster_folder):
     """批次對資料夾中的所有 TIF 檔案套用降雨量符號設定"""
     
@@ -34,12 +36,16 @@ def apply_rainfall_symbology_batch(raster_folder):
         try:
             print(f"\n處理柵格: {os.path.basename(raster_path)}")
             
-            # 先建立屬性表
-            try:
-                arcpy.management.BuildRasterAttributeTable(raster_path, "Overwrite")
-                print("已建立柵格屬性表")
-            except:
-                print("無法建立柵格屬性表，繼續處理...")
+            # 先建立屬性表 (只適用於整數柵格；連續數值的浮點數柵格不建立)
+            # 以 rasterio 讀取標頭判斷資料型別，不需建立 arcpy.Raster 物件
+            if not is_float_raster(raster_path):
+                try:
+                    arcpy.management.BuildRasterAttributeTable(raster_path, "Overwrite")
+                    print("已建立柵格屬性表")
+                except:
+                    print("無法建立柵格屬性表，繼續處理...")
+            else:
+                print("浮點數柵格，略過建立屬性表")
             
             # 添加柵格到地圖
             lyr = m.addDataFromPath(raster_path)
@@ -0,0 +1,111 @@
+"""比較 result.py 舊版逐列處理流程與向量化讀取引擎的執行時間
+
+使用方式:
+    python benchmarks/bench_ingest.py --stations 500 --years 60
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rain_ingest import find_input_files, ingest_files, merge_blocks  # noqa: E402
+from synthetic import write_yearly_files  # noqa: E402
+
+
+def legacy_result(input_files):
+    """舊版 result.py 的處理流程 (iterrows + 轉置 + resample)，作為比較基準"""
+    all_monthly_data = []
+    station_coordinates = {}
+    for in_file in input_files:
+        df = pd.read_csv(in_file, index_col=False)
+        df.columns = [s.strip() for s in df.columns]
+        df['ID'] = np.arange(df.shape[0])
+        for i, row in df.iterrows():
+            station_coordinates[f"Station_{i}"] = {'LON': row['LON'], 'LAT': row['LAT']}
+        df2 = df.T
+        df2 = df2.replace(-99.9, np.nan)
+        df2 = df2.drop(index=['LON', 'LAT', 'ID'])
+        date_pattern = re.compile(r'^\d{8}$')
+        df2 = df2.loc[[idx for idx in df2.index if date_pattern.match(str(idx))]]
+        df2.index = pd.to_datetime([f'{s[:4]}-{s[4:6]}-{s[6:]}' for s in df2.index])
+        df3 = df2.resample('ME').sum()
+        df3 = df3.replace(0, -99.9)
+        all_monthly_data.append(df3)
+
+    combined_data = pd.concat(all_monthly_data, axis=0)
+    station_coords_df = pd.DataFrame.from_dict(station_coordinates, orient='index')
+    station_coords_df.reset_index(inplace=True)
+    station_coords_df.rename(columns={'index': 'Station'}, inplace=True)
+    df_transposed = combined_data.T
+    df_transposed['Station'] = df_transposed.index.astype(str)
+    station_coords_df['Station'] = station_coords_df['Station'].str.replace('Station_', '', regex=True)
+    merged_data = pd.merge(station_coords_df, df_transposed, on='Station', how='inner')
+    return merged_data.drop(columns=['Station'])
+
+
+def vectorized_result(input_files, workers=1):
+    """向量化讀取引擎"""
+    return merge_blocks([block for _, block, _ in ingest_files(input_files, workers)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=500, help='測站數')
+    parser.add_argument('--years', type=int, default=60, help='年數')
+    parser.add_argument('--data-dir', help='合成資料資料夾 (預設使用暫存資料夾)')
+    parser.add_argument('--skip-legacy', action='store_true', help='不執行舊版流程')
+    parser.add_argument('--workers', type=int, nargs='*', default=[],
+                        help='額外測試的平行行程數，例如 --workers 2 4 8')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='rain_bench_')
+    input_files = find_input_files(data_dir)
+    if len(input_files) != args.years:
+        print(f"產生合成資料: {args.stations} 測站 × {args.years} 年 -> {data_dir}")
+        input_files = write_yearly_files(data_dir, args.stations, range(1960, 1960 + args.years))
+
+    start = time.perf_counter()
+    new = vectorized_result(input_files)
+    new_time = time.perf_counter() - start
+    print(f"向量化引擎: {new_time:.2f} 秒, 資料形狀: {new.shape}")
+
+    # 平行讀取的擴展性，並確認輸出與逐一處理逐位元組相同
+    serial_csv = new.to_csv(index=False)
+    for workers in args.workers:
+        start = time.perf_counter()
+        parallel = vectorized_result(input_files, workers)
+        parallel_time = time.perf_counter() - start
+        identical = parallel.to_csv(index=False) == serial_csv
+        print(f"{workers} 個行程: {parallel_time:.2f} 秒, "
+              f"加速 {new_time / parallel_time:.1f}x, 輸出相同: {identical}")
+
+    if args.skip_legacy:
+        return
+
+    start = time.perf_counter()
+    old = legacy_result(input_files)
+    old_time = time.perf_counter() - start
+    print(f"舊版流程: {old_time:.2f} 秒, 資料形狀: {old.shape}")
+
+    # 比對結果 (舊版的欄位名稱為 Timestamp)
+    # 舊版將缺值月份與降雨為 0 的月份都記為 -99.9，比對前先將新版結果換成相同的標記
+    old.columns = [str(col) for col in old.columns]
+    legacy_values = new.to_numpy(np.float64)
+    legacy_values[:, 2:] = np.where(np.isnan(legacy_values[:, 2:]) | (legacy_values[:, 2:] == 0),
+                                    -99.9, legacy_values[:, 2:])
+    same = np.allclose(old[new.columns].to_numpy(np.float64), legacy_values,
+                       atol=1e-3, equal_nan=True)
+    print(f"結果一致: {same}")
+    print(f"加速倍數: {old_time / new_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
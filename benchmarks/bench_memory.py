@@ -0,0 +1,81 @@
+"""以 tracemalloc 比較讀取單一年份檔案時的記憶體峰值
+
+串流模式 (ingest_file_streaming) 的峰值應只與分塊大小有關，不隨測站數 (檔案大小) 增加；
+整檔讀取 (ingest_file) 與舊版流程的峰值則與檔案大小成正比。
+輸出的月合計陣列本身 (測站 × 12 × 4 bytes) 不可避免，另外列出。
+
+使用方式:
+    python benchmarks/bench_memory.py --stations 5000 20000 --chunk-rows 256
+"""
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import legacy_result  # noqa: E402
+from rain_ingest import ingest_file, ingest_file_streaming  # noqa: E402
+from synthetic import write_yearly_files  # noqa: E402
+
+
+def peak_memory(func, *args):
+    """執行 func 並回傳 (結果, 記憶體峰值 MB)"""
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, nargs='+', default=[5000, 20000],
+                        help='測站數 (可指定多個，比較峰值是否隨檔案大小增加)')
+    parser.add_argument('--chunk-rows', type=int, default=256, help='串流模式每塊的測站數')
+    parser.add_argument('--skip-legacy', action='store_true', help='不執行舊版流程')
+    args = parser.parse_args()
+
+    # 舊版流程逐欄新增欄位的警告與記憶體量測無關
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_stations in args.stations:
+            folder = os.path.join(tmp, str(n_stations))
+            in_file = write_yearly_files(folder, n_stations, years=[2000])[0]
+            size = os.path.getsize(in_file) / 1024 / 1024
+            print(f"{n_stations} 測站 (檔案 {size:.1f} MB)")
+
+            if not args.skip_legacy:
+                _, peak = peak_memory(legacy_result, [in_file])
+                print(f"  舊版流程: {peak:.1f} MB")
+
+            whole, peak = peak_memory(ingest_file, in_file)
+            print(f"  整檔讀取: {peak:.1f} MB")
+
+            streamed, peak = peak_memory(ingest_file_streaming, in_file, args.chunk_rows)
+            output = streamed.sums.nbytes / 1024 / 1024
+            print(f"  串流讀取 (每塊 {args.chunk_rows} 測站): {peak:.1f} MB "
+                  f"(其中月合計輸出 {output:.1f} MB)")
+
+            same = (np.array_equal(whole.sums, streamed.sums, equal_nan=True)
+                    and np.array_equal(whole.counts, streamed.counts)
+                    and np.array_equal(whole.days, streamed.days)
+                    and np.array_equal(whole.lon, streamed.lon))
+            ok = ok and same
+            print(f"  結果一致: {same}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
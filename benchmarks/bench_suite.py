@@ -0,0 +1,389 @@
+"""以合成資料量測每個處理階段的執行時間與處理量，並與儲存的基準比較
+
+產生 CMB 寬格式的逐年逐日降雨檔 (synthetic.py)，依序量測：
+
+    ingest          result.py 的 build_result (讀取、月合計、合併並輸出 result.csv 與 result_store/)
+    split           month split.py 的 split_months (輸出 month/rain_YYYY_MM.csv)
+    idw_plan        IDW 權重矩陣 (KD-tree 查詢)
+    idw             以權重矩陣內插所有月份
+    idw_tiled       逐區塊 IDW 並寫入分塊 GeoTIFF
+    point           點轉柵格 (bincount) 所有月份
+    point_tiled     逐區塊點轉柵格並寫入分塊 GeoTIFF
+    kriging         擬合變異圖與普通克利金 (共用分解) 所有月份
+    rbf             薄板樣條所有月份
+    write_geotiff   逐月寫出單一波段 GeoTIFF
+    cube            寫出多波段 GeoTIFF 立方體
+
+每個階段執行 --repeat 次取最短時間，處理量以 測站月份/秒 (讀取與拆分) 或 像元/秒 (柵格) 表示。
+各階段的結果摘要 (總和、缺值數、檔案數) 與耗時存為基準 (--save-baseline)，之後的執行與基準比較：
+結果不同或耗時超過基準 (1 + --tolerance) 倍 (且多出 --min-delta 秒以上) 時視為退化，以結束代碼 1 結束。
+基準依測站數、年數、柵格大小、座標系統與亂數種子分開記錄；在不同機器上建立的基準只比較結果，耗時僅供參考。
+
+使用方式:
+    python benchmarks/bench_suite.py --save-baseline
+    python benchmarks/bench_suite.py --stations 500 --years 20 --stages ingest split idw
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GridSpec  # noqa: E402
+from idw import IdwPlan, idw_tile_renderer  # noqa: E402
+from instrument import peak_rss_mb  # noqa: E402
+from kriging import fit_variogram, kriging_plan, rbf_plan  # noqa: E402
+from month_writer import split_months  # noqa: E402
+from point_raster import rasterize, tile_renderer  # noqa: E402
+from projection import default_cell_size, normalize_crs  # noqa: E402
+from rain_store import STORE_DIR, open_store  # noqa: E402
+from raster_cube import CubeWriter  # noqa: E402
+from raster_io import TILE_SIZE, write_geotiff, write_tiled_geotiff  # noqa: E402
+from result import build_result  # noqa: E402
+from station_index import StationIndex  # noqa: E402
+from synthetic import write_yearly_files  # noqa: E402
+
+STAGES = ('ingest', 'split', 'idw_plan', 'idw', 'idw_tiled', 'point', 'point_tiled', 'kriging', 'rbf',
+          'write_geotiff', 'cube')
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# 結果摘要比較時的相對誤差 (不同 BLAS 的浮點運算順序不同)
+RESULT_RTOL = 1e-5
+
+
+def host_info():
+    """基準建立時的環境 (不同機器的耗時不可直接比較)"""
+    return {'machine': platform.machine(), 'system': platform.system(), 'cpus': os.cpu_count(),
+            'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def config_key(args):
+    return f"{args.stations}x{args.years}y_cell{args.cell_size:g}_{args.crs}_seed{args.seed}"
+
+
+def raster_summary(grids):
+    """柵格結果摘要: 有效像元的總和與缺值數"""
+    grids = np.asarray(grids, dtype=np.float64)
+    return {'sum': float(np.nansum(grids)), 'nan': int(np.isnan(grids).sum())}
+
+
+def file_summary(paths):
+    return {'files': len(paths), 'bytes': int(sum(os.path.getsize(p) for p in paths))}
+
+
+def raster_file_summary(paths):
+    """讀回 GeoTIFF 的像元值摘要 (壓縮後的檔案大小隨 GDAL 版本而異，不列入比較)"""
+    grids = []
+    for path in paths:
+        with rasterio.open(path) as src:
+            grids.append(src.read(1, masked=True).astype(np.float64).filled(np.nan))
+    return {'files': len(paths), **raster_summary(grids)}
+
+
+def timed(func, repeat):
+    """執行 repeat 次，回傳 (最短秒數, 最後一次的結果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class Suite:
+    """在工作資料夾中依序執行各階段，後面的階段使用前面階段的輸出"""
+
+    def __init__(self, work_dir, input_files, cell_size, crs, repeat, tiled_months):
+        self.work_dir = work_dir
+        self.input_files = input_files
+        self.cell_size = cell_size
+        self.crs = crs
+        self.repeat = repeat
+        self.tiled_months = tiled_months
+        self.grid = None
+        self._store = None
+        self._plan = None
+        self._grids = None
+
+    def path(self, *parts):
+        return os.path.join(self.work_dir, *parts)
+
+    @property
+    def store(self):
+        """result_store/ (必要時先執行讀取階段)"""
+        if self._store is None:
+            if not os.path.exists(self.path(STORE_DIR)):
+                self.run_ingest()
+            store = open_store(self.path(STORE_DIR))
+            index = StationIndex.from_lonlat(store.lon, store.lat, self.crs)
+            self._store = (store, index, np.asarray(store.rainfall, dtype=np.float64).T)
+            self.grid = GridSpec.from_points(index.x, index.y, self.cell_size, self.crs)
+        return self._store
+
+    @property
+    def station_months(self):
+        return self.store[2].size
+
+    @property
+    def raster_cells(self):
+        return self.grid.n_cells * self.store[2].shape[1]
+
+    def plan(self):
+        if self._plan is None:
+            _, index, _ = self.store
+            self._plan = IdwPlan.build(index.x, index.y, self.grid, index=index)
+        return self._plan
+
+    def grids(self):
+        if self._grids is None:
+            self._grids = self.plan().interpolate(self.store[2])
+        return self._grids
+
+    # 各階段回傳 (秒數, 處理量的數量, 單位, 結果摘要)
+
+    def run_ingest(self):
+        def ingest():
+            with contextlib.redirect_stdout(io.StringIO()):
+                failed = build_result(self.input_files, self.work_dir, output='both')
+            if failed:
+                raise RuntimeError(f"讀取失敗: {failed}")
+
+        seconds, _ = timed(ingest, self.repeat)
+        store = open_store(self.path(STORE_DIR))
+        values = np.asarray(store.rainfall, dtype=np.float64)
+        return seconds, values.size, '測站月份', {**raster_summary(values), **file_summary([self.path('result.csv')])}
+
+    def run_split(self):
+        store, _, values = self.store
+        years = store.months.astype('M8[Y]').astype(int) + 1970
+        months = store.months.astype(int) % 12 + 1
+        folder = self.path('month')
+
+        def split():
+            shutil.rmtree(folder, ignore_errors=True)
+            split_months(store.lon, store.lat, years, months, values, folder, log=lambda *a: None)
+
+        seconds, _ = timed(split, self.repeat)
+        paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith('.csv')]
+        return seconds, self.station_months, '測站月份', file_summary(paths)
+
+    def run_idw_plan(self):
+        _, index, _ = self.store
+        seconds, plan = timed(lambda: IdwPlan.build(index.x, index.y, self.grid, index=index), self.repeat)
+        self._plan = plan
+        return seconds, self.grid.n_cells, '像元', {'nnz': int(plan.weights.nnz),
+                                                    'sum': float(plan.weights.sum())}
+
+    def run_idw(self):
+        plan = self.plan()
+        seconds, grids = timed(lambda: plan.interpolate(self.store[2]), self.repeat)
+        self._grids = grids
+        return seconds, self.raster_cells, '像元', raster_summary(grids)
+
+    def _run_tiled(self, make_renderer, name):
+        _, _, values = self.store
+        months = range(min(self.tiled_months, values.shape[1]))
+        paths = [self.path(f'{name}_{m}.tif') for m in months]
+
+        def write():
+            for m, path in zip(months, paths):
+                write_tiled_geotiff(path, self.grid, make_renderer(values[:, m]), tile_size=TILE_SIZE)
+
+        seconds, _ = timed(write, self.repeat)
+        return seconds, self.grid.n_cells * len(paths), '像元', raster_file_summary(paths)
+
+    def run_idw_tiled(self):
+        _, index, _ = self.store
+        return self._run_tiled(lambda z: idw_tile_renderer(index.x, index.y, z, self.grid, index=index),
+                               'idw_tiled')
+
+    def run_point(self):
+        _, index, values = self.store
+        cells = index.cells(self.grid)
+        seconds, grids = timed(lambda: rasterize(cells, values, self.grid.n_rows, self.grid.n_cols), self.repeat)
+        return seconds, self.raster_cells, '像元', raster_summary(grids)
+
+    def run_point_tiled(self):
+        _, index, _ = self.store
+        cells = index.cells(self.grid)
+        return self._run_tiled(lambda z: tile_renderer(cells, z, self.grid, TILE_SIZE), 'point_tiled')
+
+    def run_kriging(self):
+        _, index, values = self.store
+
+        def krige():
+            variogram = fit_variogram(index.x, index.y, values)
+            return kriging_plan(index.x, index.y, self.grid, variogram).interpolate(values)
+
+        seconds, grids = timed(krige, self.repeat)
+        return seconds, self.raster_cells, '像元', raster_summary(grids)
+
+    def run_rbf(self):
+        _, index, values = self.store
+        seconds, grids = timed(lambda: rbf_plan(index.x, index.y, self.grid).interpolate(values), self.repeat)
+        return seconds, self.raster_cells, '像元', raster_summary(grids)
+
+    def run_write_geotiff(self):
+        grids = self.grids()
+        folder = self.path('raster')
+        os.makedirs(folder, exist_ok=True)
+        paths = [os.path.join(folder, f'rain_{m}.tif') for m in range(len(grids))]
+
+        def write():
+            for grid, path in zip(grids, paths):
+                write_geotiff(path, grid, self.grid)
+
+        seconds, _ = timed(write, self.repeat)
+        return seconds, self.raster_cells, '像元', {'files': len(paths)}
+
+    def run_cube(self):
+        grids = self.grids()
+        store, _, _ = self.store
+        labels = [str(m).replace('-', '_') for m in store.months]
+
+        def write():
+            with CubeWriter(self.path('cube.tif'), labels, self.grid) as writer:
+                writer.write(0, grids)
+
+        seconds, _ = timed(write, self.repeat)
+        return seconds, self.raster_cells, '像元', {'bands': len(labels)}
+
+
+def compare_results(current, expected):
+    """比較結果摘要；回傳不一致的欄位"""
+    different = []
+    for name, value in expected.items():
+        actual = current.get(name)
+        if isinstance(value, float):
+            same = actual is not None and np.isclose(actual, value, rtol=RESULT_RTOL, atol=1e-6)
+        else:
+            same = actual == value
+        if not same:
+            different.append(f"{name} {actual} (基準 {value})")
+    return different
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(path, baselines):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=200, help='測站數')
+    parser.add_argument('--years', type=int, default=5, help='年數 (由 1960 年起)')
+    parser.add_argument('--missing', type=float, default=0.02, help='零星缺值 (-99.9) 的比例')
+    parser.add_argument('--outage', type=float, default=0.02, help='測站整月停測的比例')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子')
+    parser.add_argument('--cell-size', type=float, default=None,
+                        help='柵格大小 (預設 0.0083；公尺座標系統預設 1000)')
+    parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS, help='網格的座標系統')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='執行的階段')
+    parser.add_argument('--repeat', type=int, default=5, help='每個階段的執行次數 (取最短時間，預設 5)')
+    parser.add_argument('--tiled-months', type=int, default=2, help='分塊寫出階段寫出的月份數')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='基準檔 (JSON)')
+    parser.add_argument('--save-baseline', action='store_true', help='以這次的結果更新基準')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='耗時超過基準 (1 + tolerance) 倍時視為退化 (預設 0.5)')
+    parser.add_argument('--min-delta', type=float, default=0.02,
+                        help='比基準多出的秒數小於此值時不視為退化 (避免極短階段的量測雜訊，預設 0.02)')
+    parser.add_argument('--work-dir', default=None, help='工作資料夾 (預設使用暫存資料夾並於結束時刪除)')
+    parser.add_argument('--output', default=None, help='將這次的量測結果寫入 JSON 檔')
+    args = parser.parse_args()
+    if args.cell_size is None:
+        args.cell_size = default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='rain_suite_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        years = range(1960, 1960 + args.years)
+        print(f"產生合成資料: {args.stations} 測站 × {args.years} 年 -> {work_dir}")
+        input_files = write_yearly_files(os.path.join(work_dir, 'ClimateData'), args.stations, years,
+                                         missing_rate=args.missing, seed=args.seed, outage_rate=args.outage)
+
+        suite = Suite(work_dir, input_files, args.cell_size, args.crs, args.repeat, args.tiled_months)
+        results = {}
+        for name in args.stages:
+            seconds, amount, unit, summary = getattr(suite, f'run_{name}')()
+            results[name] = {'seconds': seconds, 'amount': amount, 'unit': unit,
+                             'throughput': amount / seconds if seconds > 0 else float('inf'), 'result': summary}
+        grid = suite.store and suite.grid
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    key = config_key(args)
+    baselines = load_baselines(args.baseline)
+    baseline = baselines.get(key)
+    same_host = baseline is not None and baseline.get('host') == host_info()
+
+    print(f"\n設定 {key}，網格 {grid.n_rows} x {grid.n_cols}，峰值 RSS {peak_rss_mb() or 0:.0f} MB")
+    if baseline is None:
+        print(f"基準檔 {args.baseline} 中沒有此設定的基準")
+    elif not same_host:
+        print("基準建立於不同的環境，只比較結果，耗時僅供參考")
+    print(f"{'階段':<14}{'秒數':>10}{'處理量':>24}{'基準秒數':>10}{'比值':>8}  狀態")
+
+    regressions = []
+    for name, result in results.items():
+        expected = (baseline or {}).get('stages', {}).get(name)
+        ratio = ''
+        status = '新增'
+        if expected is not None:
+            ratio_value = result['seconds'] / expected['seconds'] if expected['seconds'] > 0 else 1.0
+            ratio = f"{ratio_value:.2f}"
+            different = compare_results(result['result'], expected['result'])
+            status = '正常'
+            if different:
+                status = '結果不同: ' + '; '.join(different)
+                regressions.append(name)
+            elif (same_host and ratio_value > 1 + args.tolerance
+                  and result['seconds'] - expected['seconds'] > args.min_delta):
+                status = f'變慢 (超過 {1 + args.tolerance:.2f} 倍)'
+                regressions.append(name)
+        base_seconds = f"{expected['seconds']:.3f}" if expected else ''
+        throughput = f"{result['throughput']:,.0f} {result['unit']}/秒"
+        print(f"{name:<14}{result['seconds']:>10.3f}{throughput:>24}{base_seconds:>10}{ratio:>8}  {status}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': key, 'host': host_info(), 'stages': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n已將量測結果保存到 {args.output}")
+
+    if args.save_baseline:
+        stages = dict((baseline or {}).get('stages', {}) if same_host else {})
+        stages.update(results)
+        baselines[key] = {'host': host_info(), 'stages': stages}
+        save_baselines(args.baseline, baselines)
+        print(f"\n已更新基準: {args.baseline} [{key}]")
+        sys.exit(0)
+
+    if regressions:
+        print(f"\n退化的階段: {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""比較整個網格與分塊寫出 (write_tiled_geotiff) 的記憶體峰值與執行時間
+
+整個網格: IdwPlan 權重矩陣 + 整個網格的陣列 + write_geotiff()
+分塊寫出: 每個區塊各自以 KD-tree 內插後直接寫入分塊 GeoTIFF
+柵格越細，整個網格的峰值隨像元數增加；分塊寫出的峰值只與區塊大小及同時計算的區塊數有關。
+(記憶體以 tracemalloc 量測 NumPy/SciPy 的配置，不含 GDAL 內部的區塊快取)
+
+使用方式:
+    python benchmarks/bench_tiled_writer.py --cell-size 0.002 0.001 0.0005
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import rasterio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from grid_spec import GridSpec  # noqa: E402
+from idw import IdwPlan, idw_tile_renderer  # noqa: E402
+from raster_io import TILE_SIZE, write_geotiff, write_tiled_geotiff  # noqa: E402
+from synthetic import make_station_table  # noqa: E402
+
+
+def measure(func, *args):
+    """執行 func，回傳 (秒數, 記憶體峰值 MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func(*args)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def whole_grid(path, x, y, z, grid):
+    plan = IdwPlan.build(x, y, grid)
+    write_geotiff(path, plan.interpolate(z), grid)
+
+
+def tiled(path, x, y, z, grid, tile_size, workers):
+    render = idw_tile_renderer(x, y, z, grid)
+    write_tiled_geotiff(path, grid, render, tile_size=tile_size, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=500, help='測站數')
+    parser.add_argument('--cell-size', type=float, nargs='+', default=[0.002, 0.001, 0.0005],
+                        help='柵格大小 (可指定多個)')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='區塊大小')
+    parser.add_argument('--workers', type=int, default=2, help='同時計算的區塊數')
+    parser.add_argument('--skip-whole', action='store_true',
+                        help='只執行分塊寫出 (網格大到整個網格的流程無法放入記憶體時)')
+    args = parser.parse_args()
+
+    stations = make_station_table(args.stations)
+    x = stations['LON'].to_numpy()
+    y = stations['LAT'].to_numpy()
+    z = np.random.default_rng(0).gamma(2.0, 100.0, len(x))
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for cell_size in args.cell_size:
+            grid = GridSpec.from_points(x, y, cell_size)
+            print(f"柵格大小 {cell_size}: {grid.n_rows} x {grid.n_cols} ({grid.n_cells / 1e6:.1f} M 像元)")
+
+            whole_path = os.path.join(tmp, 'whole.tif')
+            tiled_path = os.path.join(tmp, 'tiled.tif')
+            seconds, peak = measure(tiled, tiled_path, x, y, z, grid, args.tile_size, args.workers)
+            print(f"  分塊寫出 ({args.tile_size} x {args.tile_size}, {args.workers} 個區塊): "
+                  f"{seconds:.1f} 秒, 峰值 {peak:.0f} MB")
+            if args.skip_whole:
+                continue
+            seconds, peak = measure(whole_grid, whole_path, x, y, z, grid)
+            print(f"  整個網格: {seconds:.1f} 秒, 峰值 {peak:.0f} MB")
+
+            with rasterio.open(whole_path) as a, rasterio.open(tiled_path) as b:
+                diff = float(np.abs(a.read(1) - b.read(1)).max())
+                overviews = b.overviews(1)
+            same = diff < 1e-3
+            ok = ok and same
+            print(f"  結果一致: {same} (最大差異 {diff:.2e})，金字塔: {overviews}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
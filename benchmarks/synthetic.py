@@ -0,0 +1,58 @@
+"""產生 CMB 寬格式的合成逐日降雨資料，供效能測試使用"""
+import os
+
+import numpy as np
+import pandas as pd
+
+NODATA = -99.9
+
+
+def make_station_table(n_stations, seed=0):
+    """在宜蘭縣附近隨機產生測站經緯度"""
+    rng = np.random.default_rng(seed)
+    lon = np.round(rng.uniform(121.3, 121.95, n_stations), 4)
+    lat = np.round(rng.uniform(24.3, 24.99, n_stations), 4)
+    return pd.DataFrame({'LON': lon, 'LAT': lat})
+
+
+def make_yearly_frame(stations, year, missing_rate=0.02, seed=0, outage_rate=0.0):
+    """產生單一年份的寬格式資料：每列一個測站，欄位為 LON、LAT 與 YYYYMMDD
+
+    missing_rate 為零星缺值的比例；outage_rate 為測站整月停測 (整月 -99.9) 的比例。
+    """
+    rng = np.random.default_rng([seed, year])
+    days = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='D')
+    n_stations = len(stations)
+
+    # 約六成日數無降雨，其餘以 gamma 分佈模擬雨量，保留一位小數
+    wet = rng.random((n_stations, len(days))) < 0.4
+    values = np.where(wet, np.round(rng.gamma(0.8, 12.0, (n_stations, len(days))), 1), 0.0)
+
+    # 隨機挖出缺值
+    missing = rng.random(values.shape) < missing_rate
+    values[missing] = NODATA
+
+    # 整月停測: 該測站月份所有日數皆為缺值 (月合計為 NaN)
+    if outage_rate > 0:
+        outage = rng.random((n_stations, 12)) < outage_rate
+        values[outage[:, days.month - 1]] = NODATA
+
+    frame = pd.DataFrame(values, columns=days.strftime('%Y%m%d'))
+    frame.insert(0, 'LAT', stations['LAT'].to_numpy())
+    frame.insert(0, 'LON', stations['LON'].to_numpy())
+    return frame
+
+
+def write_yearly_files(folder, n_stations=500, years=range(1960, 2020),
+                       county='宜蘭縣', missing_rate=0.02, seed=0, outage_rate=0.0):
+    """將多年份的合成資料寫成 觀測_日資料_<縣市>_降雨量_YYYY.csv"""
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    stations = make_station_table(n_stations, seed)
+    paths = []
+    for year in years:
+        path = os.path.join(folder, f'觀測_日資料_{county}_降雨量_{year}.csv')
+        make_yearly_frame(stations, year, missing_rate, seed, outage_rate).to_csv(path, index=False)
+        paths.append(path)
+    return paths
@@ -0,0 +1,95 @@
+"""驗證留一交叉驗證的快速解與逐一移除測站後重新計算的結果一致，並比較執行時間
+
+IDW:               每個月份只查詢一次 KD-tree vs. 每個測站以暴力法重算 (idw_brute_force)
+克利金、薄板樣條:  閉合解 z_i - a_i / (A⁻¹)_ii vs. 移除測站後重新建立並分解線性系統
+
+使用方式:
+    python benchmarks/validate_cross_validation.py --stations 300 --months 24
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cross_validation import idw_loo  # noqa: E402
+from grid_spec import GridSpec  # noqa: E402
+from idw import idw_brute_force  # noqa: E402
+from kriging import fit_variogram, kriging_plan, rbf_plan  # noqa: E402
+from station_index import StationIndex  # noqa: E402
+from synthetic import make_station_table  # noqa: E402
+
+
+def refit_loo(make_plan, x, y, z):
+    """逐一移除測站、重新建立內插物件並在該測站位置預測"""
+    out = np.full(z.shape, np.nan)
+    for i in range(len(x)):
+        keep = np.arange(len(x)) != i
+        plan = make_plan(x[keep], y[keep])
+        a, b = plan.coefficients(z[keep])
+        out[i] = plan.predict_points(a, b, x[i:i + 1], y[i:i + 1])[0]
+    out[np.isnan(z)] = np.nan
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=300, help='測站數')
+    parser.add_argument('--months', type=int, default=24, help='月份數')
+    args = parser.parse_args()
+
+    stations = make_station_table(args.stations)
+    x = stations['LON'].to_numpy()
+    y = stations['LAT'].to_numpy()
+    rng = np.random.default_rng(0)
+    trend = 200 + 100 * np.sin(x * 7)[:, None] * np.cos(y * 5)[:, None]
+    z = trend * rng.gamma(4.0, 0.25, args.months)[None, :] + rng.normal(0, 10, (args.stations, args.months))
+    # 部分月份缺少一個測站
+    z[rng.integers(0, args.stations, args.months // 4), np.arange(args.months // 4)] = np.nan
+    grid = GridSpec.from_points(x, y, max(np.ptp(x), np.ptp(y)))
+    print(f"{args.stations} 個測站, {args.months} 個月份")
+
+    ok = True
+    # IDW (第一個月份)
+    powers, neighbor_counts = [1.0, 2.0], [4, 12]
+    start = time.perf_counter()
+    fast = idw_loo(StationIndex(x, y), z[:, 0], powers, neighbor_counts)
+    fast_time = time.perf_counter() - start
+    start = time.perf_counter()
+    diff = 0.0
+    for (p, k), values in fast.items():
+        for i in np.flatnonzero(~np.isnan(z[:, 0])):
+            keep = ~np.isnan(z[:, 0])
+            keep[i] = False
+            expected = idw_brute_force(x[keep], y[keep], z[keep, 0], x[i:i + 1], y[i:i + 1], p, k)[0]
+            diff = max(diff, abs(values[i] - expected))
+    slow_time = time.perf_counter() - start
+    same = diff < 1e-9
+    ok = ok and same
+    print(f"IDW ({len(fast)} 組參數): 暴力法 {slow_time:.2f} 秒, KD-tree 一次查詢 {fast_time:.4f} 秒, "
+          f"最大差異 {diff:.2e}, 結果一致: {same}")
+
+    variogram = fit_variogram(x, y, z)
+    for name, make_plan in [('克利金', lambda px, py: kriging_plan(px, py, grid, variogram)),
+                            ('薄板樣條', lambda px, py: rbf_plan(px, py, grid))]:
+        start = time.perf_counter()
+        fast = make_plan(x, y).loo_predictions(z)
+        fast_time = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = refit_loo(make_plan, x, y, z)
+        slow_time = time.perf_counter() - start
+        diff = np.nanmax(np.abs(fast - expected))
+        same = np.allclose(fast, expected, rtol=1e-6, atol=1e-6, equal_nan=True)
+        ok = ok and same
+        print(f"{name}: 逐一重新分解 {slow_time:.2f} 秒, 閉合解 {fast_time:.4f} 秒, "
+              f"加速 {slow_time / fast_time:.0f} 倍, 最大差異 {diff:.2e}, 結果一致: {same}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""驗證 NumPy IDW 引擎與暴力法基準的結果一致，並比較執行時間
+
+使用方式:
+    python benchmarks/validate_idw.py --stations 500 --cell-size 0.0083
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from grid_spec import GridSpec  # noqa: E402
+from idw import IdwPlan, idw_brute_force, idw_grid  # noqa: E402
+from synthetic import make_station_table  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=500, help='測站數')
+    parser.add_argument('--cell-size', type=float, default=0.0083, help='像元大小')
+    parser.add_argument('--tile-size', type=int, default=64, help='區塊大小')
+    args = parser.parse_args()
+
+    stations = make_station_table(args.stations)
+    x = stations['LON'].to_numpy()
+    y = stations['LAT'].to_numpy()
+    z = np.random.default_rng(1).gamma(2.0, 100.0, len(x))
+
+    grid_spec = GridSpec.from_points(x, y, args.cell_size)
+    n_rows, n_cols = grid_spec.shape
+    qx, qy = (a.ravel() for a in grid_spec.cell_centers())
+
+    ok = True
+    for power, n_neighbors, radius in [(2.0, 12, None), (1.0, 5, None), (3.0, 30, 0.05)]:
+        start = time.perf_counter()
+        grid = idw_grid(x, y, z, grid_spec, power=power, n_neighbors=n_neighbors, radius=radius,
+                        tile_size=args.tile_size)
+        fast_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reference = idw_brute_force(x, y, z, qx, qy, power, n_neighbors, radius)
+        brute_time = time.perf_counter() - start
+
+        same = np.allclose(grid.ravel(), reference, rtol=1e-5, equal_nan=True)
+        ok = ok and same
+        print(f"power={power}, neighbors={n_neighbors}, radius={radius}: "
+              f"網格 {n_rows} x {n_cols}, KD-tree {fast_time:.2f} 秒, 暴力法 {brute_time:.2f} 秒, "
+              f"結果一致: {same}")
+
+        # 權重矩陣: 無缺值時應與逐月計算相同
+        plan = IdwPlan.build(x, y, grid_spec, power, n_neighbors, radius, args.tile_size)
+        same = np.allclose(plan.interpolate(z), grid, rtol=1e-5, equal_nan=True)
+        ok = ok and same
+        print(f"  權重矩陣結果一致: {same}")
+
+        # 缺值測站: 權重矩陣與逐區塊計算都應等於只以有效測站計算的 IDW
+        # (第二種情況為一整區的測站缺值，部分像元的鄰近測站全部缺值)
+        for name, missing_mask in [('零星缺值', np.arange(len(x)) % 7 == 0),
+                                   ('整區缺值', x < np.quantile(x, 0.3))]:
+            missing = np.where(missing_mask, np.nan, z)
+            expected = idw_brute_force(x[~missing_mask], y[~missing_mask], z[~missing_mask], qx, qy,
+                                       power, n_neighbors, radius)
+            tiled = idw_grid(x, y, missing, grid_spec, power=power, n_neighbors=n_neighbors, radius=radius,
+                             tile_size=args.tile_size)
+            same = (np.allclose(plan.interpolate(missing).ravel(), expected, rtol=1e-5, equal_nan=True)
+                    and np.allclose(tiled.ravel(), expected, rtol=1e-5, equal_nan=True))
+            ok = ok and same
+            print(f"  {name}: 權重矩陣與逐區塊計算結果一致: {same}")
+
+    # 多個月份以一次稀疏矩陣乘積計算
+    months = np.random.default_rng(2).gamma(2.0, 100.0, (len(x), 120))
+    start = time.perf_counter()
+    batch = plan.interpolate(months)
+    batch_time = time.perf_counter() - start
+    same = np.allclose(batch[5], plan.interpolate(months[:, 5]), equal_nan=True)
+    ok = ok and same
+    print(f"120 個月份批次內插: {batch_time:.2f} 秒, 與逐月結果一致: {same}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""驗證 NumPy 橫麥卡托公式 (TWD97 TM2) 與 GDAL 的投影結果一致，並比較執行時間
+
+同時比較經緯度與公尺座標下的 IDW：以經緯度計算距離時，東西方向的距離被高估約 10% (緯度 24 度的 cos 約 0.91)。
+
+使用方式:
+    python benchmarks/validate_projection.py --points 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from rasterio.warp import transform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from projection import TM_PARAMS, TWD97, tm_forward  # noqa: E402
+from station_index import StationIndex  # noqa: E402
+from synthetic import make_station_table  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1000000, help='投影的點數')
+    parser.add_argument('--stations', type=int, default=500, help='比較 IDW 鄰近測站的測站數')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(119.9, 122.1, args.points)
+    lat = rng.uniform(21.8, 25.4, args.points)
+
+    start = time.perf_counter()
+    x, y = tm_forward(lon, lat, *TM_PARAMS[TWD97])
+    numpy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gx, gy = transform('EPSG:4326', TWD97, lon, lat)
+    gdal_time = time.perf_counter() - start
+
+    diff = max(np.abs(x - gx).max(), np.abs(y - gy).max())
+    ok = diff < 1e-3
+    print(f"{args.points} 個點: NumPy {numpy_time:.2f} 秒, GDAL {gdal_time:.2f} 秒, "
+          f"最大差異 {diff * 1000:.4f} 毫米, 結果一致: {ok}")
+
+    # 同一組查詢點在兩種座標下的 12 個最近測站有多少不同
+    stations = make_station_table(args.stations)
+    s_lon = stations['LON'].to_numpy()
+    s_lat = stations['LAT'].to_numpy()
+    degree_index = StationIndex(s_lon, s_lat)
+    metric_index = StationIndex.from_lonlat(s_lon, s_lat, TWD97)
+    q_lon = rng.uniform(s_lon.min(), s_lon.max(), 10000)
+    q_lat = rng.uniform(s_lat.min(), s_lat.max(), 10000)
+    q_x, q_y = tm_forward(q_lon, q_lat, *TM_PARAMS[TWD97])
+    degree_idx = np.sort(degree_index.nearest(q_lon, q_lat, 12)[1], axis=1)
+    metric_idx = np.sort(metric_index.nearest(q_x, q_y, 12)[1], axis=1)
+    changed = np.any(degree_idx != metric_idx, axis=1).mean()
+    print(f"以經緯度距離選出的 12 個鄰近測站與公尺座標不同的查詢點: {changed:.1%}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
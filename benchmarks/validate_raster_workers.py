@@ -0,0 +1,92 @@
+"""以 FakeRasterBackend 驗證柵格轉換的多行程排程 (不需 arcpy)
+
+檢查項目: 每個月份都產生輸出、各工作行程使用不同的暫存資料夾、
+暫存檔名稱沒有衝突、結果與依序處理相同，以及執行後暫存資料夾已清除。
+
+使用方式:
+    python benchmarks/validate_raster_workers.py --months 48 --workers 3
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from grid_spec import GridSpec  # noqa: E402
+from raster_workers import FakeRasterBackend, run_months  # noqa: E402
+from synthetic import make_station_table  # noqa: E402
+
+
+def make_jobs(stations, n_months, out_folder):
+    rng = np.random.default_rng(0)
+    for i in range(n_months):
+        year_month = f"{1960 + i // 12}_{i % 12 + 1:02d}"
+        df = stations.assign(RAINFALL=np.round(rng.gamma(2.0, 100.0, len(stations)), 1))
+        yield year_month, df, 'RAINFALL', os.path.join(out_folder, f"rain_{year_month}.tif")
+
+
+def read_records(folder):
+    records = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), encoding='utf-8') as f:
+            record = json.load(f)
+        records[record['year_month']] = record
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=200, help='測站數')
+    parser.add_argument('--months', type=int, default=48, help='月份數')
+    parser.add_argument('--workers', type=int, default=3, help='工作行程數')
+    args = parser.parse_args()
+
+    stations = make_station_table(args.stations)
+    grid = GridSpec.from_points(stations['LON'], stations['LAT'])
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for workers in (1, args.workers):
+            out_folder = os.path.join(tmp, f'out_{workers}')
+            scratch_root = os.path.join(tmp, 'scratch')
+            os.makedirs(out_folder)
+            failed = run_months(FakeRasterBackend(), make_jobs(stations, args.months, out_folder),
+                                grid, workers, scratch_root, log=lambda message: None)
+            records = read_records(out_folder)
+            results[workers] = records
+
+            scratch_by_pid = {}
+            for record in records.values():
+                scratch_by_pid.setdefault(record['pid'], set()).add(record['scratch'])
+            scratch_dirs = [d for dirs in scratch_by_pid.values() for d in dirs]
+
+            checks = {
+                '沒有失敗的月份': not failed,
+                '每個月份都有輸出': len(records) == args.months,
+                '每個行程只使用一個暫存資料夾': all(len(d) == 1 for d in scratch_by_pid.values()),
+                '各行程的暫存資料夾不同': len(set(scratch_dirs)) == len(scratch_dirs),
+                '暫存資料夾已清除': os.listdir(scratch_root) == [],
+            }
+            print(f"workers={workers}: {len(scratch_by_pid)} 個行程處理 {len(records)} 個月份")
+            for name, passed in checks.items():
+                print(f"  {name}: {passed}")
+                ok = ok and passed
+
+    same = all(
+        results[1][ym]['total'] == results[args.workers][ym]['total']
+        and results[1][ym]['n_points'] == results[args.workers][ym]['n_points']
+        for ym in results[1]
+    )
+    print(f"平行與依序處理結果一致: {same}")
+    ok = ok and same
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""內插方法的留一交叉驗證 (leave-one-out)：比較精度與計算成本
+
+對每個月份逐一移除各測站，以其餘測站預測該測站的降雨量，統計各方法與參數組合的 RMSE、MAE 與可預測比例：
+
+    idw      各 (power, neighbors)；每個月份只查詢一次 k 個最近測站 (KD-tree)，移除自己後直接重算權重
+    kriging  普通克利金；以閉合解 z_i - a_i / (A⁻¹)_ii 計算，不需重新分解 N 次 (kriging.py)
+    rbf      薄板樣條；同樣使用閉合解
+    point    點轉柵格 (Feature to Raster 相同)；移除測站後只有同一像元內的其他測站能提供值，依 cell size 而定
+
+連續曲面方法在測站位置預測，cell size 只影響 point 方法的精度與各方法的成本。
+成本為以 --cell-size 網格 (或各 cell size) 產生一個月份柵格的平均秒數 (以前幾個月份量測)。
+月份分段後以多個行程平行計算，結果依 RMSE 排序並標示精度與成本的柏拉圖最佳組合；
+指定 --max-rmse 時列出符合誤差預算的最低成本方法。
+
+使用方式:
+    python cross_validation.py --workers 4
+    python cross_validation.py --methods idw kriging --powers 1 2 3 --neighbors 4 8 12 --max-rmse 60
+"""
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GridSpec
+from idw import IdwPlan, idw_weighted
+from kriging import VARIOGRAM_MODELS, describe_variogram, fit_variogram, kriging_plan, rbf_plan, valid_mask
+from point_raster import rasterize
+from projection import default_cell_size, normalize_crs
+from rain_store import STORE_DIR, month_sources
+from station_index import StationIndex, index_file, load_or_build_index
+
+# 可比較的方法
+METHODS = ('idw', 'kriging', 'rbf', 'point')
+
+# 預設的參數組合
+DEFAULT_POWERS = (1.0, 2.0, 3.0)
+DEFAULT_NEIGHBOR_COUNTS = (4, 8, 12, 16)
+
+# 結果表的預設檔名
+RESULT_FILE = 'cv_results.csv'
+
+# 量測成本時使用的月份數
+COST_MONTHS = 12
+
+# 列入柏拉圖與誤差預算比較所需的可預測比例 (點轉柵格在像元內沒有其他測站時無法預測)
+MIN_COVERAGE = 0.99
+
+
+def method_configs(methods, powers, neighbor_counts, cell_sizes):
+    """所有 (方法, 參數) 組合: [(方法, power, neighbors, cell_size)]；不適用的參數為 None"""
+    configs = []
+    for method in methods:
+        if method == 'idw':
+            configs += [('idw', float(p), int(k), None) for p in powers for k in neighbor_counts]
+        elif method == 'point':
+            configs += [('point', None, None, float(c)) for c in cell_sizes]
+        else:
+            configs.append((method, None, None, None))
+    return configs
+
+
+def idw_loo(index, z, powers, neighbor_counts):
+    """IDW 的留一預測 {(power, neighbors): 預測值 (測站,)}
+
+    有效測站的 KD-tree 每個月份只查詢一次 (最多 neighbors + 1 個最近測站)，移除自己後各參數組合共用。
+    """
+    valid = valid_mask(z)
+    out = {(p, k): np.full(len(z), np.nan) for p in powers for k in neighbor_counts}
+    sub = index.subset(valid)
+    if sub.n < 2:
+        return out
+    values = z[valid]
+
+    k_max = min(max(neighbor_counts) + 1, sub.n)
+    dist, idx = sub.nearest(sub.x, sub.y, k_max)
+    # 每列移除自己 (位置重複的測站可能排在自己前面；自己不在結果中時移除最後一個)
+    is_self = idx == np.arange(sub.n)[:, None]
+    missing_self = ~is_self.any(axis=1)
+    is_self[missing_self, -1] = True
+    keep = ~is_self
+    dist = dist[keep].reshape(sub.n, k_max - 1)
+    idx = idx[keep].reshape(sub.n, k_max - 1)
+    neighbor_values = values[np.where(np.isfinite(dist), idx, 0)]
+
+    for p in powers:
+        for k in neighbor_counts:
+            out[(p, k)][valid] = idw_weighted(dist[:, :k], neighbor_values[:, :k], p)
+    return out
+
+
+def point_loo(index, z, cell_size):
+    """點轉柵格的留一預測: 同一像元內其他有效測站的平均值，沒有其他測站時為 NaN"""
+    valid = valid_mask(z)
+    grid = GridSpec.from_points(index.x, index.y, cell_size, index.crs)
+    cells = grid.cell_index(index.x, index.y)
+    cells = np.where(valid, cells, -1)
+    inside = cells >= 0
+    total = np.bincount(cells[inside], weights=z[inside], minlength=grid.n_cells)
+    count = np.bincount(cells[inside], minlength=grid.n_cells)
+
+    out = np.full(len(z), np.nan)
+    others = np.zeros(len(z))
+    others[inside] = count[cells[inside]] - 1
+    has_others = inside & (others > 0)
+    out[has_others] = (total[cells[has_others]] - z[has_others]) / others[has_others]
+    return out
+
+
+def evaluate_months(x, y, crs, z, configs, variogram=None):
+    """計算一段月份的誤差統計 {config: [平方誤差和, 絕對誤差和, 預測數, 測站月份數]}
+
+    z 為 測站 × 月份；x, y 為 (已投影的) 測站座標。克利金與薄板樣條的分解在這段月份之間共用。
+    """
+    index = StationIndex(x, y, crs)
+    totals = {config: np.zeros(4) for config in configs}
+    powers = sorted({c[1] for c in configs if c[0] == 'idw'})
+    neighbor_counts = sorted({c[2] for c in configs if c[0] == 'idw'})
+    # 留一預測不使用網格，以站點範圍建立一個像元的網格即可
+    grid = GridSpec.from_points(x, y, max(np.ptp(x), np.ptp(y), 1.0), crs)
+
+    predictions = {}
+    methods = {c[0] for c in configs}
+    if 'kriging' in methods:
+        predictions[('kriging', None, None, None)] = kriging_plan(x, y, grid, variogram).loo_predictions(z)
+    if 'rbf' in methods:
+        predictions[('rbf', None, None, None)] = rbf_plan(x, y, grid).loo_predictions(z)
+
+    for m in range(z.shape[1]):
+        column = z[:, m]
+        month_predictions = {config: values[:, m] for config, values in predictions.items()}
+        if powers:
+            for (p, k), values in idw_loo(index, column, powers, neighbor_counts).items():
+                month_predictions[('idw', p, k, None)] = values
+        for config in configs:
+            if config[0] == 'point':
+                month_predictions[config] = point_loo(index, column, config[3])
+
+        valid = valid_mask(column)
+        for config in configs:
+            error = month_predictions[config][valid] - column[valid]
+            predicted = ~np.isnan(error)
+            totals[config] += (np.sum(error[predicted] ** 2), np.sum(np.abs(error[predicted])),
+                               predicted.sum(), valid.sum())
+    return totals
+
+
+def _evaluate_chunk(args):
+    return evaluate_months(*args)
+
+
+def production_cost(config, x, y, z, grid, variogram_model='spherical'):
+    """以 grid 產生 z 各月份柵格的平均秒數 (含建立權重矩陣或分解；克利金含以 variogram_model 擬合變異圖)"""
+    method, power, n_neighbors, cell_size = config
+    start = time.perf_counter()
+    if method == 'idw':
+        IdwPlan.build(x, y, grid, power, n_neighbors).interpolate(z)
+    elif method == 'kriging':
+        kriging_plan(x, y, grid, fit_variogram(x, y, z, variogram_model)).interpolate(z)
+    elif method == 'rbf':
+        rbf_plan(x, y, grid).interpolate(z)
+    else:
+        rasterize(grid.cell_index(x, y), z, grid.n_rows, grid.n_cols)
+    return (time.perf_counter() - start) / z.shape[1]
+
+
+def pareto_front(table):
+    """可預測比例足夠且 RMSE 與成本都沒有被其他組合同時勝過的列"""
+    eligible = (table['coverage'] >= MIN_COVERAGE).to_numpy()
+    rmse = np.where(eligible, table['rmse'].to_numpy(), np.inf)
+    cost = table['seconds_per_month'].to_numpy()
+    front = np.zeros(len(table), dtype=bool)
+    for i in np.flatnonzero(eligible):
+        better = (rmse <= rmse[i]) & (cost <= cost[i]) & ((rmse < rmse[i]) | (cost < cost[i]))
+        front[i] = not better.any()
+    return front
+
+
+def cross_validate(groups, crs, configs, cell_size, workers=1, variogram_model='spherical', log=print):
+    """對各組測站 (x, y, 測站 × 月份) 執行留一交叉驗證並量測成本，回傳依 RMSE 排序的結果表"""
+    totals = {config: np.zeros(4) for config in configs}
+    costs = {config: [] for config in configs}
+
+    for x, y, z in groups:
+        variogram = None
+        if any(c[0] == 'kriging' for c in configs):
+            # 變異圖以這組測站的所有月份擬合一次，各月份共用
+            variogram = fit_variogram(x, y, z, variogram_model)
+            log(f"變異圖: {describe_variogram(variogram)}")
+
+        # 月份分段後平行計算，每段共用克利金與薄板樣條的分解
+        n_chunks = max(1, min(workers, z.shape[1]))
+        chunks = [(x, y, crs, z[:, cols], configs, variogram)
+                  for cols in np.array_split(np.arange(z.shape[1]), n_chunks)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_evaluate_chunk, chunks))
+        else:
+            results = [_evaluate_chunk(chunk) for chunk in chunks]
+        for result in results:
+            for config, values in result.items():
+                totals[config] += values
+
+        sample = z[:, :COST_MONTHS]
+        for config in configs:
+            grid = GridSpec.from_points(x, y, config[3] or cell_size, crs)
+            costs[config].append(production_cost(config, x, y, sample, grid, variogram_model) * z.shape[1])
+        log(f"已完成 {len(x)} 個測站、{z.shape[1]} 個月份")
+
+    n_months = sum(z.shape[1] for _, _, z in groups)
+    rows = []
+    for config in configs:
+        sse, sae, n_predicted, n_total = totals[config]
+        method, power, n_neighbors, config_cell_size = config
+        rows.append({
+            'method': method,
+            'power': power,
+            'neighbors': n_neighbors,
+            'cell_size': config_cell_size if config_cell_size else cell_size,
+            'rmse': np.sqrt(sse / n_predicted) if n_predicted else np.nan,
+            'mae': sae / n_predicted if n_predicted else np.nan,
+            'coverage': n_predicted / n_total if n_total else np.nan,
+            'seconds_per_month': sum(costs[config]) / n_months,
+        })
+    table = pd.DataFrame(rows)
+    table['pareto'] = pareto_front(table)
+    return table.sort_values(['rmse', 'seconds_per_month'], na_position='last').reset_index(drop=True)
+
+
+def load_groups(folder, crs):
+    """讀取 month/ 或 result_store/ 的所有月份，依測站座標分組: [(x, y, 測站 × 月份)]"""
+    month_inputs = month_sources(os.path.join(folder, 'month'), os.path.join(folder, STORE_DIR))
+    groups = {}
+    for _, source, load_month in month_inputs:
+        month = load_month(arrays=True)
+        lon = np.asarray(month.lon, dtype=np.float64)
+        lat = np.asarray(month.lat, dtype=np.float64)
+        group = groups.setdefault((lon.tobytes(), lat.tobytes()), (lon, lat, []))
+        group[2].append(np.asarray(month.rainfall, dtype=np.float64))
+
+    result = []
+    for lon, lat, columns in groups.values():
+        # 測站座標 (公尺座標系統時為投影後的座標，與空間索引一併快取)
+        index = load_or_build_index(os.path.join(folder, index_file(crs)), lon, lat, crs)[0]
+        result.append((index.x, index.y, np.column_stack(columns)))
+    return result, len(month_inputs)
+
+
+def print_table(table, max_rmse=None):
+    print(f"{'方法':<8}{'power':>6}{'鄰近數':>6}{'柵格大小':>10}{'RMSE':>10}{'MAE':>10}{'可預測':>8}{'秒/月':>10}  柏拉圖")
+    for row in table.itertuples():
+        power = '' if pd.isna(row.power) else f'{row.power:g}'
+        neighbors = '' if pd.isna(row.neighbors) else f'{int(row.neighbors)}'
+        print(f"{row.method:<8}{power:>6}{neighbors:>6}{row.cell_size:>10g}{row.rmse:>10.2f}{row.mae:>10.2f}"
+              f"{row.coverage:>8.1%}{row.seconds_per_month:>10.4f}  {'*' if row.pareto else ''}")
+
+    if max_rmse is not None:
+        meets = table[(table['rmse'] <= max_rmse) & (table['coverage'] >= MIN_COVERAGE)]
+        if len(meets) == 0:
+            print(f"\n沒有方法符合誤差預算 RMSE ≤ {max_rmse}")
+        else:
+            best = meets.sort_values('seconds_per_month').iloc[0]
+            params = ''.join(f' {name}={best[name]:g}' for name in ('power', 'neighbors') if not pd.isna(best[name]))
+            print(f"\n符合誤差預算 RMSE ≤ {max_rmse} 的最低成本方法: {best['method']}{params} "
+                  f"(RMSE {best['rmse']:.2f}, {best['seconds_per_month']:.4f} 秒/月)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以留一交叉驗證比較內插方法的精度與計算成本')
+    parser.add_argument('--folder', default='.', help='month/ 或 result_store/ 所在的資料夾')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS), help='比較的方法')
+    parser.add_argument('--powers', type=float, nargs='+', default=list(DEFAULT_POWERS), help='IDW 次方')
+    parser.add_argument('--neighbors', type=int, nargs='+', default=list(DEFAULT_NEIGHBOR_COUNTS),
+                        help='IDW 鄰近測站數')
+    parser.add_argument('--cell-sizes', type=float, nargs='+', default=None,
+                        help='點轉柵格比較的柵格大小 (預設為 --cell-size)')
+    parser.add_argument('--cell-size', type=float, default=None,
+                        help='量測成本的柵格大小 (預設 0.0083；公尺座標系統預設 1000)')
+    parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS,
+                        help='計算距離的座標系統 (預設 EPSG:4326；EPSG:3826 為 TWD97 公尺座標)')
+    parser.add_argument('--variogram', choices=VARIOGRAM_MODELS, default='spherical', help='克利金的變異圖模型')
+    parser.add_argument('--workers', type=int, default=1, help='平行計算的行程數 (月份分段)')
+    parser.add_argument('--max-rmse', type=float, default=None, help='誤差預算: 列出 RMSE 不超過此值的最低成本方法')
+    parser.add_argument('--output', default=RESULT_FILE, help='結果表 (CSV)')
+    args = parser.parse_args()
+
+    try:
+        cell_size = args.cell_size if args.cell_size is not None else default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+        groups, n_months = load_groups(args.folder, args.crs)
+        if n_months == 0:
+            print(f"錯誤: 在 '{args.folder}' 中找不到月份資料 (month/ 或 {STORE_DIR}/)")
+            exit(1)
+        print(f"找到 {n_months} 個月份，{len(groups)} 組測站")
+
+        configs = method_configs(args.methods, args.powers, args.neighbors, args.cell_sizes or [cell_size])
+        print(f"比較 {len(configs)} 種方法與參數組合")
+        start = time.perf_counter()
+        table = cross_validate(groups, args.crs, configs, cell_size, args.workers, args.variogram)
+        print(f"交叉驗證完成，耗時 {time.perf_counter() - start:.1f} 秒\n")
+
+        print_table(table, args.max_rmse)
+        table.to_csv(args.output, index=False)
+        print(f"\n已將結果保存到 {args.output}")
+    except Exception as e:
+        print(f"交叉驗證時發生錯誤: {str(e)}")
+        traceback.print_exc()
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
+import argparse
 import arcpy
-import numpy
-import pandas as pd
 import os
-import glob
+from rain_store import STORE_DIR, month_sources
+from point_loader import ArcpyPointBackend, load_points
+from instrument import add_arguments, configure, count, info, stage, verbose
+
+parser = argparse.ArgumentParser(description='將各月降雨資料轉換為 grid.gdb 中的點特徵類別')
+add_arguments(parser)
+args = parser.parse_args()
+configure(args)
 
 # 設定環境
 arcpy.env.workspace = "./grid/grid.gdb"
@@ -11,35 +17,35 @@ arcpy.env.overwriteOutput = True
 # 定義輸入資料夾路徑
 input_folder = './month'
 
-# 取得所有符合格式的 CSV 檔案
-csv_files = glob.glob(os.path.join(input_folder, 'rain_*.csv'))
-print(f"找到 {len(csv_files)} 個 CSV 檔案需要處理")
+# 取得所有月份的輸入資料 (result_store 二進位資料或 rain_*.csv 檔案)
+month_inputs = month_sources(input_folder, os.path.join('.', STORE_DIR))
+print(f"找到 {len(month_inputs)} 個月份需要處理")
 
 # 定義空間參考（假設所有檔案使用相同的空間參考）
 spatial_ref = arcpy.Describe("rain_1960_01").spatialReference
+point_backend = ArcpyPointBackend()
 
-# 處理每個 CSV 檔案
-for csv_file in csv_files:
+# 處理每個月份
+for year_month, source, load_month in month_inputs:
     try:
-        # 從檔名取得年月資訊
-        file_name = os.path.basename(csv_file)
-        base_name = os.path.splitext(file_name)[0]  # 移除副檔名
+        file_name = f"rain_{year_month}"
         
-        print(f"\n正在處理: {file_name}")
+        info(f"\n正在處理: {source}")
         
         # 簡化特徵類別名稱
-        year_month = file_name.replace("rain_", "").replace(".csv", "")
         feature_name = f"rain_{year_month}_pt"
         
         # 確保使用完整路徑
         gdb_path = arcpy.env.workspace
         outFC = os.path.join(gdb_path, feature_name)
         
-        print(f"輸出特徵類別路徑: {outFC}")
+        verbose(f"輸出特徵類別路徑: {outFC}")
         
-        # 讀取 CSV 檔案
-        df = pd.read_csv(csv_file)
-        print(f"資料形狀: {df.shape}")
+        # 讀取月份資料
+        with stage('load', month=year_month):
+            df = load_month()
+        count('station_months', len(df))
+        verbose(f"資料形狀: {df.shape}")
         
         # 確認資料欄位
         required_fields = ['LON', 'LAT', 'Value']
@@ -55,33 +61,14 @@ for csv_file in csv_files:
                 print("跳過此檔案")
                 continue
         
-        # 取得 LON 和 LAT 欄位的資料，轉換成 list of tuples
-        xy = list(df[['LON', 'LAT']].itertuples(index=False, name=None))
-        
-        # 取得 Value 欄位的資料，轉換成 list
-        v = list(df['Value'])
-        
-        # 組合座標和降雨量資料
-        data_list = list(zip(xy, v))
-        
-        # 建立 numpy 陣列
-        array = numpy.array(
-            data_list,
-            numpy.dtype([("XY", "<f8", 2), ("Value", "<f8")]),
-        )
-        
-        # 檢查輸出特徵類別是否存在，如果存在則刪除
-        if arcpy.Exists(outFC):
-            print(f'刪除已存在的特徵類別: {outFC}')
-            arcpy.Delete_management(outFC)
-        
-        # 將 numpy 陣列轉換為特徵類別
-        arcpy.da.NumPyArrayToFeatureClass(array, outFC, ["XY"], spatial_ref)
+        # 由欄位直接建立結構化陣列並轉換為特徵類別 (已存在時先刪除)
+        with stage('feature_class', month=year_month):
+            load_points(point_backend, df, outFC, spatial_ref, 'Value', out_field='Value')
         
-        print(f'已成功建立特徵類別: {outFC}')
+        info(f'已成功建立特徵類別: {outFC}')
         
     except Exception as e:
-        print(f"處理檔案 {csv_file} 時發生錯誤: {str(e)}")
+        print(f"處理檔案 {source} 時發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
 
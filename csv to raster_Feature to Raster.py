@@ -1,11 +1,29 @@
+import argparse
 import arcpy
-import numpy
-import pandas as pd
 import os
-import glob
+from rain_store import STORE_DIR, has_store, month_sources
+from point_loader import ArcpyPointBackend, load_points
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GRID_FILE, load_or_create_grid
+from projection import default_cell_size, epsg_code, normalize_crs
+from instrument import add_arguments, configure, count, info, is_verbose, stage, verbose
 import time  # 引入時間模組用於生成唯一的臨時檔案名稱
 from arcpy.sa import *
 
+parser = argparse.ArgumentParser(description='以 Feature To Raster 將各月降雨點資料轉換為柵格')
+parser.add_argument('--grid', default=GRID_FILE,
+                    help='共用網格定義檔 (不存在時由完整測站集合建立，預設 grid_spec.json)')
+parser.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                    default=None, help='以指定範圍重新建立網格定義')
+parser.add_argument('--cell-size', type=float, default=None,
+                    help='柵格大小 (預設 0.0083，約 1 公里；公尺座標系統預設 1000)')
+parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS,
+                    help='網格的座標系統 (預設 EPSG:4326；EPSG:3826 為 TWD97 公尺座標，測站經緯度只投影一次)')
+parser.add_argument('--workers', type=int, default=1,
+                    help='同時轉換的月份數 (工作行程數，預設 1)')
+add_arguments(parser)
+args = parser.parse_args()
+configure(args)
+
 # 檢查 Spatial Analyst 授權
 if arcpy.CheckExtension("Spatial") == "Available":
     arcpy.CheckOutExtension("Spatial")
@@ -24,7 +42,10 @@ arcpy.env.overwriteOutput = True
 
 # 定義輸入資料夾路徑 (使用絕對路徑)
 input_folder = os.path.join(current_dir, "month")
-if not os.path.exists(input_folder):
+
+# result.py --output store 產生的二進位資料，存在時直接讀取而不需 month 資料夾的 CSV
+store_folder = os.path.join(current_dir, STORE_DIR)
+if not os.path.exists(input_folder) and not has_store(store_folder):
     print(f"錯誤: 輸入資料夾 '{input_folder}' 不存在!")
     # 嘗試列出當前目錄下的所有資料夾
     print("當前目錄下的資料夾和檔案:")
@@ -44,10 +65,10 @@ if not os.path.exists(temp_folder):
     os.makedirs(temp_folder)
     print(f"已建立臨時檔案資料夾: {temp_folder}")
 
-# 取得所有符合格式的 CSV 檔案
-csv_files = glob.glob(os.path.join(input_folder, 'rain_*.csv'))
-print(f"找到 {len(csv_files)} 個 CSV 檔案需要處理")
-if len(csv_files) == 0:
+# 取得所有月份的輸入資料 (二進位資料或 rain_*.csv 檔案)
+month_inputs = month_sources(input_folder, store_folder)
+print(f"找到 {len(month_inputs)} 個月份需要處理")
+if len(month_inputs) == 0:
     print(f"警告: 在 '{input_folder}' 中找不到任何 'rain_*.csv' 檔案")
     # 列出資料夾中的所有檔案
     if os.path.exists(input_folder):
@@ -56,37 +77,56 @@ if len(csv_files) == 0:
             print(f"  - {item}")
     exit(1)
 
-# 使用 WGS 1984 空間參考
+# 所有月份共用的網格: 由完整測站集合 (或 --bbox) 計算一次並存檔，各柵格腳本輸出對齊
+cell_size = args.cell_size if args.cell_size is not None else default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+grid_spec, from_file = load_or_create_grid(args.grid, month_inputs, cell_size, args.bbox, args.crs)
+print(f"{'已讀取' if from_file else '已建立'}網格定義: {args.grid} "
+      f"({grid_spec.n_rows} x {grid_spec.n_cols}, 柵格大小 {grid_spec.cell_size})")
+
+# 點資料使用 WGS 1984 經緯度，輸出柵格使用網格的座標系統 (例如 TWD97，由 arcpy 投影)
 spatial_ref = arcpy.SpatialReference(4326)  # WGS 1984
+point_backend = ArcpyPointBackend()
+
+# 輸出範圍與柵格大小只設定一次，不再逐月由點資料範圍計算
+arcpy.env.extent = arcpy.Extent(*grid_spec.extent)
+arcpy.env.cellSize = grid_spec.cell_size
+arcpy.env.outputCoordinateSystem = arcpy.SpatialReference(epsg_code(grid_spec.crs))
 
-# 處理每個 CSV 檔案
-for csv_file in csv_files:
+# 多行程模式: 各工作行程使用自己的暫存資料夾與 arcpy 環境設定，月份平行轉換
+if args.workers > 1:
+    from raster_workers import ArcpyRasterBackend, month_jobs, run_months
+    print(f"使用 {args.workers} 個工作行程平行轉換")
+    raster_backend = ArcpyRasterBackend('feature')
+    with stage('run_months'):
+        failed = run_months(raster_backend, month_jobs(month_inputs, raster_folder), grid_spec,
+                            args.workers, os.path.join(current_dir, "scratch"))
+    print(f'\n*** 所有檔案處理完成 ({len(failed)} 個月份失敗) ***')
+    arcpy.CheckInExtension("Spatial")
+    exit(0)
+
+# 處理每個月份
+for year_month, source, load_month in month_inputs:
     try:
-        # 顯示完整檔案路徑
-        print(f"\n處理檔案: {csv_file}")
+        # 顯示完整資料來源
+        info(f"\n處理檔案: {source}")
         
-        # 從檔名取得年月資訊
-        file_name = os.path.basename(csv_file)
-        year_month = file_name.replace("rain_", "").replace(".csv", "")
+        file_name = f"rain_{year_month}"
         
         # 定義輸出名稱 (使用實際檔案路徑而非記憶體)
         point_fc = os.path.join(temp_folder, f"rain_{year_month}_pt.shp")
         raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
         
-        print(f"輸出點特徵類別: {point_fc}")
-        print(f"輸出柵格檔案: {raster_output}")
-        
-        # 檢查 CSV 檔案是否存在
-        if not os.path.exists(csv_file):
-            print(f"錯誤: CSV 檔案 '{csv_file}' 不存在!")
-            continue
+        verbose(f"輸出點特徵類別: {point_fc}")
+        verbose(f"輸出柵格檔案: {raster_output}")
         
-        # 讀取 CSV 檔案
-        print(f"讀取 CSV 檔案: {csv_file}")
-        df = pd.read_csv(csv_file)
-        print(f"資料形狀: {df.shape}")
-        print("資料前 5 筆:")
-        print(df.head())
+        # 讀取月份資料
+        verbose(f"讀取資料: {source}")
+        with stage('load', month=year_month):
+            df = load_month()
+        count('station_months', len(df))
+        verbose(f"資料形狀: {df.shape}")
+        verbose("資料前 5 筆:")
+        verbose(df.head())
         
         # 確認資料欄位
         if 'LON' not in df.columns or 'LAT' not in df.columns:
@@ -103,53 +143,24 @@ for csv_file in csv_files:
             print(f"錯誤: {file_name} 缺少降雨量欄位，跳過此檔案")
             continue
         
-        print(f"使用降雨量欄位: {rainfall_field}")
+        verbose(f"使用降雨量欄位: {rainfall_field}")
         
-        # 取得 LON 和 LAT 欄位的資料
-        lon_values = df['LON'].tolist()
-        lat_values = df['LAT'].tolist()
-        rainfall_values = df[rainfall_field].tolist()
+        # 以結構化陣列一次建立點特徵類別 (不再逐點使用 InsertCursor)
+        verbose("創建點特徵類別...")
+        with stage('feature_class', month=year_month):
+            load_points(point_backend, df, point_fc, spatial_ref, rainfall_field)
         
-        # 刪除已存在的特徵類別 (如果存在)
-        if arcpy.Exists(point_fc):
-            print(f'刪除已存在的特徵類別: {point_fc}')
-            arcpy.Delete_management(point_fc)
-        
-        # 創建空的點特徵類別
-        print("創建點特徵類別...")
-        arcpy.CreateFeatureclass_management(
-            out_path=temp_folder,
-            out_name=f"rain_{year_month}_pt.shp",
-            geometry_type="POINT",
-            spatial_reference=spatial_ref
-        )
-        
-        # 添加降雨量欄位
-        arcpy.AddField_management(point_fc, "RAINFALL", "DOUBLE")
-        
-        # 使用游標添加點
-        print("添加點資料...")
-        with arcpy.da.InsertCursor(point_fc, ["SHAPE@XY", "RAINFALL"]) as cursor:
-            for i in range(len(lon_values)):
-                cursor.insertRow([(lon_values[i], lat_values[i]), rainfall_values[i]])
-        
-        print(f'已成功建立特徵類別: {point_fc}')
+        verbose(f'已成功建立特徵類別: {point_fc}')
         
         # 步驟 2: 直接將點資料轉換為柵格 (使用 Feature To Raster)
-        print(f'開始將點資料直接轉換為柵格...')
+        verbose(f'開始將點資料直接轉換為柵格...')
         
         try:
-            # 定義柵格大小
-            cell_size = 0.0083  # 約 1 公里
-            
-            # 計算研究區域範圍 (從點資料中獲取)
-            extent = arcpy.Describe(point_fc).extent
-            
-            # 設定輸出範圍
-            arcpy.env.extent = extent
+            # 柵格大小與輸出範圍使用共用網格定義
+            cell_size = grid_spec.cell_size
             
             # 使用 Feature To Raster 工具直接將點轉換為柵格
-            print("使用 Feature To Raster 工具將點資料轉換為柵格...")
+            verbose("使用 Feature To Raster 工具將點資料轉換為柵格...")
             
             # 使用時間戳記建立唯一的臨時檔案名稱
             timestamp = int(time.time())
@@ -160,12 +171,13 @@ for csv_file in csv_files:
                 arcpy.Delete_management(temp_raster)
             
             # Feature To Raster 工具
-            arcpy.conversion.FeatureToRaster(
-                in_features=point_fc,
-                field="RAINFALL",
-                out_raster=temp_raster,
-                cell_size=cell_size
-            )
+            with stage('feature_to_raster', month=year_month):
+                arcpy.conversion.FeatureToRaster(
+                    in_features=point_fc,
+                    field="RAINFALL",
+                    out_raster=temp_raster,
+                    cell_size=cell_size
+                )
             
             # 檢查輸出柵格檔案是否已存在
             if os.path.exists(raster_output):
@@ -173,20 +185,23 @@ for csv_file in csv_files:
                 os.remove(raster_output)
             
             # 儲存柵格結果
-            arcpy.management.CopyRaster(temp_raster, raster_output)
+            with stage('copy_raster', month=year_month):
+                arcpy.management.CopyRaster(temp_raster, raster_output)
+            count('cells', grid_spec.n_cells)
             
             # 清理臨時資料
             if arcpy.Exists(temp_raster):
                 arcpy.Delete_management(temp_raster)
             
-            print(f'已成功建立柵格資料: {raster_output}')
+            info(f'已成功建立柵格資料: {raster_output}')
             
-            # 顯示柵格資訊
-            raster_desc = arcpy.Describe(raster_output)
-            print(f"柵格資訊:")
-            print(f"  - 寬度: {raster_desc.width} 像素")
-            print(f"  - 高度: {raster_desc.height} 像素")
-            print(f"  - 像素大小: {arcpy.Raster(raster_output).meanCellWidth} x {arcpy.Raster(raster_output).meanCellHeight}")
+            # 顯示柵格資訊 (需再次開啟柵格，只在 --log-level verbose 時讀取)
+            if is_verbose():
+                raster_desc = arcpy.Describe(raster_output)
+                print(f"柵格資訊:")
+                print(f"  - 寬度: {raster_desc.width} 像素")
+                print(f"  - 高度: {raster_desc.height} 像素")
+                print(f"  - 像素大小: {arcpy.Raster(raster_output).meanCellWidth} x {arcpy.Raster(raster_output).meanCellHeight}")
             
         except Exception as e:
             print(f"柵格轉換過程發生錯誤: {str(e)}")
@@ -194,7 +209,7 @@ for csv_file in csv_files:
             traceback.print_exc()
         
     except Exception as e:
-        print(f"處理檔案 {csv_file} 時發生錯誤: {str(e)}")
+        print(f"處理檔案 {source} 時發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
 
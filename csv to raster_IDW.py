@@ -1,29 +1,79 @@
-import arcpy
+import argparse
 import numpy
-import pandas as pd
 import os
-import glob
-from arcpy.sa import *
+from rain_store import STORE_DIR, has_store, month_sources
+from point_loader import ArcpyPointBackend, load_points
+from idw import DEFAULT_NEIGHBORS, DEFAULT_POWER
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GRID_FILE, load_or_create_grid
+from projection import default_cell_size, epsg_code, normalize_crs
+from station_index import index_file, load_or_build_index
+from instrument import add_arguments, configure, count, info, stage, verbose
 
-# 檢查 Spatial Analyst 授權
-if arcpy.CheckExtension("Spatial") == "Available":
-    arcpy.CheckOutExtension("Spatial")
-    print("已啟用 Spatial Analyst 擴充模組")
+# 選擇內插引擎: arcpy (Spatial Analyst Idw) 或 numpy (不需授權，可在 Linux 執行)
+parser = argparse.ArgumentParser(description='以 IDW 將各月降雨點資料內插為柵格')
+parser.add_argument('--backend', choices=['arcpy', 'numpy'], default='arcpy',
+                    help='內插引擎 (預設 arcpy)')
+parser.add_argument('--power', type=float, default=DEFAULT_POWER, help='IDW 次方 (預設 2)')
+parser.add_argument('--neighbors', type=int, default=DEFAULT_NEIGHBORS,
+                    help='搜尋的鄰近測站數 (預設 12)')
+parser.add_argument('--radius', type=float, default=None,
+                    help='最大搜尋距離 (與網格座標同單位，預設不限制)')
+parser.add_argument('--tile-size', type=int, default=512,
+                    help='numpy 引擎每次計算的區塊大小 (像元，分塊寫出時需為 16 的倍數)')
+parser.add_argument('--tiled', action='store_true',
+                    help='numpy 引擎: 逐區塊內插並直接寫入分塊、含金字塔的 GeoTIFF，不建立整個網格的權重矩陣 '
+                         '(網格很大時自動啟用)')
+parser.add_argument('--plan-cache', default=os.path.join('raster_IDW', '.idw_plan'),
+                    help='numpy 引擎 IDW 權重矩陣的快取資料夾')
+parser.add_argument('--cube', default=None,
+                    help='numpy 引擎: 將所有月份寫入此多波段 GeoTIFF (每個月份一個波段)，不輸出單月 TIF')
+parser.add_argument('--batch-size', type=int, default=32,
+                    help='立方體模式每批計算的月份數')
+parser.add_argument('--workers', type=int, default=1,
+                    help='arcpy 引擎同時轉換的月份數 (工作行程數)；numpy 分塊模式同時計算的區塊數 (預設 1)')
+parser.add_argument('--grid', default=GRID_FILE,
+                    help='共用網格定義檔 (不存在時由完整測站集合建立，預設 grid_spec.json)')
+parser.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                    default=None, help='以指定範圍重新建立網格定義')
+parser.add_argument('--cell-size', type=float, default=None,
+                    help='柵格大小 (預設 0.0083，約 1 公里；公尺座標系統預設 1000)')
+parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS,
+                    help='網格的座標系統 (預設 EPSG:4326；EPSG:3826 為 TWD97 公尺座標，測站經緯度只投影一次)')
+add_arguments(parser)
+args = parser.parse_args()
+configure(args)
+
+if args.backend == 'arcpy':
+    import arcpy
+    from arcpy.sa import *
+
+    # 檢查 Spatial Analyst 授權
+    if arcpy.CheckExtension("Spatial") == "Available":
+        arcpy.CheckOutExtension("Spatial")
+        print("已啟用 Spatial Analyst 擴充模組")
+    else:
+        print("警告: Spatial Analyst 擴充模組不可用，無法進行柵格插值")
+        exit(1)
 else:
-    print("警告: Spatial Analyst 擴充模組不可用，無法進行柵格插值")
-    exit(1)
+    from idw import idw_tile_renderer, load_or_build_plan, plan_key
+    from raster_io import LARGE_GRID_CELLS, write_geotiff, write_tiled_geotiff
+    print("使用 NumPy IDW 引擎")
 
 # 獲取當前工作目錄的絕對路徑
 current_dir = os.getcwd()
 print(f"當前工作目錄: {current_dir}")
 
 # 設定環境
-arcpy.env.workspace = "in_memory"  # 使用記憶體工作空間
-arcpy.env.overwriteOutput = True
+if args.backend == 'arcpy':
+    arcpy.env.workspace = "in_memory"  # 使用記憶體工作空間
+    arcpy.env.overwriteOutput = True
 
 # 定義輸入資料夾路徑 (使用絕對路徑)
 input_folder = os.path.join(current_dir, "month")
-if not os.path.exists(input_folder):
+
+# result.py --output store 產生的二進位資料，存在時直接讀取而不需 month 資料夾的 CSV
+store_folder = os.path.join(current_dir, STORE_DIR)
+if not os.path.exists(input_folder) and not has_store(store_folder):
     print(f"錯誤: 輸入資料夾 '{input_folder}' 不存在!")
     # 嘗試列出當前目錄下的所有資料夾
     print("當前目錄下的資料夾和檔案:")
@@ -37,10 +87,10 @@ if not os.path.exists(raster_folder):
     os.makedirs(raster_folder)
     print(f"已建立柵格輸出資料夾: {raster_folder}")
 
-# 取得所有符合格式的 CSV 檔案
-csv_files = glob.glob(os.path.join(input_folder, 'rain_*.csv'))
-print(f"找到 {len(csv_files)} 個 CSV 檔案需要處理")
-if len(csv_files) == 0:
+# 取得所有月份的輸入資料 (二進位資料或 rain_*.csv 檔案)
+month_inputs = month_sources(input_folder, store_folder)
+print(f"找到 {len(month_inputs)} 個月份需要處理")
+if len(month_inputs) == 0:
     print(f"警告: 在 '{input_folder}' 中找不到任何 'rain_*.csv' 檔案")
     # 列出資料夾中的所有檔案
     if os.path.exists(input_folder):
@@ -49,43 +99,128 @@ if len(csv_files) == 0:
             print(f"  - {item}")
     exit(1)
 
-# 使用 WGS 1984 空間參考
-spatial_ref = arcpy.SpatialReference(4326)  # WGS 1984
+# 所有月份共用的網格: 由完整測站集合 (或 --bbox) 計算一次並存檔，各柵格腳本輸出對齊
+cell_size = args.cell_size if args.cell_size is not None else default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+grid_spec, from_file = load_or_create_grid(args.grid, month_inputs, cell_size, args.bbox, args.crs)
+print(f"{'已讀取' if from_file else '已建立'}網格定義: {args.grid} "
+      f"({grid_spec.n_rows} x {grid_spec.n_cols}, 柵格大小 {grid_spec.cell_size})")
+
+# 點資料使用 WGS 1984 經緯度，輸出柵格使用網格的座標系統 (例如 TWD97，由 arcpy 投影)
+if args.backend == 'arcpy':
+    spatial_ref = arcpy.SpatialReference(4326)  # WGS 1984
+    point_backend = ArcpyPointBackend()
+
+    # 輸出範圍與柵格大小只設定一次，不再逐月由點資料範圍計算
+    arcpy.env.extent = arcpy.Extent(*grid_spec.extent)
+    arcpy.env.cellSize = grid_spec.cell_size
+    arcpy.env.outputCoordinateSystem = arcpy.SpatialReference(epsg_code(grid_spec.crs))
+
+# numpy 引擎的 IDW 權重矩陣；測站與網格不變時各月份共用
+plan = None
+plan_id = None
+
+# 測站空間索引 (result.csv 旁的 station_index.npz)；測站不變時各月份共用
+index_path = os.path.join(current_dir, index_file(grid_spec.crs))
+station_index = None
+
+# 大範圍或細網格: 逐區塊內插並寫出，記憶體用量只與區塊大小有關
+tiled = args.backend == 'numpy' and (args.tiled or grid_spec.n_cells > LARGE_GRID_CELLS)
+if tiled:
+    print(f"分塊模式: 每個區塊 {args.tile_size} x {args.tile_size} 像元，同時計算 {args.workers} 個區塊")
+
+# 立方體模式: 以一次批次計算所有月份，寫入單一多波段 GeoTIFF
+if args.cube:
+    if args.backend != 'numpy':
+        print("錯誤: --cube 僅支援 --backend numpy")
+        exit(1)
+    from raster_cube import CubeWriter
+
+    year_months = []
+    columns = []
+    lon_values = lat_values = None
+    for year_month, source, load_month in month_inputs:
+        with stage('load', month=year_month):
+            month = load_month(arrays=True)
+        count('station_months', len(month.lon))
+        lon = numpy.asarray(month.lon, dtype=numpy.float64)
+        lat = numpy.asarray(month.lat, dtype=numpy.float64)
+        if lon_values is None:
+            lon_values, lat_values = lon, lat
+        elif not (numpy.array_equal(lon, lon_values) and numpy.array_equal(lat, lat_values)):
+            print(f"錯誤: {source} 的測站與其他月份不同，無法寫入同一個立方體")
+            exit(1)
+        year_months.append(year_month)
+        columns.append(numpy.asarray(month.rainfall, dtype=numpy.float64))
 
-# 處理每個 CSV 檔案
-for csv_file in csv_files:
+    # 測站 × 月份
+    rainfall_matrix = numpy.column_stack(columns)
+    with stage('plan'):
+        station_index = load_or_build_index(index_path, lon_values, lat_values, grid_spec.crs)[0]
+        plan, from_cache = load_or_build_plan(
+            args.plan_cache, lon_values, lat_values, grid_spec,
+            args.power, args.neighbors, args.radius, tile_size=args.tile_size, index=station_index,
+        )
+    print(f"{'已讀取' if from_cache else '已建立'} IDW 權重矩陣: "
+          f"{plan.weights.shape[0]} 像元 × {plan.weights.shape[1]} 測站")
+
+    with CubeWriter(args.cube, year_months, grid_spec) as writer:
+        for start in range(0, len(year_months), args.batch_size):
+            stop = min(start + args.batch_size, len(year_months))
+            # 每批月份為一次稀疏矩陣與矩陣的乘積
+            with stage('interpolate', month=year_months[start]):
+                grids = plan.interpolate(rainfall_matrix[:, start:stop])
+                count('cells', grids.size)
+            with stage('write', month=year_months[start]):
+                writer.write(start, grids)
+            info(f"已寫入月份 {year_months[start]} 到 {year_months[stop - 1]}")
+
+    print(f"已成功建立柵格立方體: {args.cube} "
+          f"({len(year_months)} 個波段, {grid_spec.n_rows} x {grid_spec.n_cols})")
+    print('\n*** 所有檔案處理完成 ***')
+    exit(0)
+
+# 多行程模式: 各工作行程使用自己的暫存資料夾與 arcpy 環境設定，月份平行轉換
+if args.backend == 'arcpy' and args.workers > 1:
+    from raster_workers import ArcpyRasterBackend, month_jobs, run_months
+    print(f"使用 {args.workers} 個工作行程平行轉換")
+    raster_backend = ArcpyRasterBackend('idw', power=args.power, n_neighbors=args.neighbors,
+                                        radius=args.radius)
+    with stage('run_months'):
+        failed = run_months(raster_backend, month_jobs(month_inputs, raster_folder), grid_spec,
+                            args.workers, os.path.join(current_dir, "scratch"))
+    print(f'\n*** 所有檔案處理完成 ({len(failed)} 個月份失敗) ***')
+    arcpy.CheckInExtension("Spatial")
+    exit(0)
+
+# 處理每個月份
+for year_month, source, load_month in month_inputs:
     try:
-        # 顯示完整檔案路徑
-        print(f"\n處理檔案: {csv_file}")
-        
-        # 從檔名取得年月資訊
-        file_name = os.path.basename(csv_file)
-        year_month = file_name.replace("rain_", "").replace(".csv", "")
-        
+        # 顯示完整資料來源
+        info(f"\n處理檔案: {source}")
+
+        file_name = f"rain_{year_month}"
+
         # 定義輸出名稱
         point_fc = f"in_memory/rain_{year_month}_pt"
         raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
-        
-        print(f"輸出點特徵類別: {point_fc}")
-        print(f"輸出柵格檔案: {raster_output}")
-        
-        # 檢查 CSV 檔案是否存在
-        if not os.path.exists(csv_file):
-            print(f"錯誤: CSV 檔案 '{csv_file}' 不存在!")
-            continue
-        
-        # 讀取 CSV 檔案
-        print(f"讀取 CSV 檔案: {csv_file}")
-        df = pd.read_csv(csv_file)
-        print(f"資料形狀: {df.shape}")
-        print("資料前 5 筆:")
-        print(df.head())
-        
+
+        verbose(f"輸出點特徵類別: {point_fc}")
+        verbose(f"輸出柵格檔案: {raster_output}")
+
+        # 讀取月份資料
+        verbose(f"讀取資料: {source}")
+        with stage('load', month=year_month):
+            df = load_month()
+        count('station_months', len(df))
+        verbose(f"資料形狀: {df.shape}")
+        verbose("資料前 5 筆:")
+        verbose(df.head())
+
         # 確認資料欄位
         if 'LON' not in df.columns or 'LAT' not in df.columns:
             print(f"錯誤: {file_name} 缺少 LON 或 LAT 欄位，跳過此檔案")
             continue
-            
+
         # 確認降雨量欄位
         rainfall_field = None
         if 'RAINFALL' in df.columns:
@@ -95,71 +230,99 @@ for csv_file in csv_files:
         else:
             print(f"錯誤: {file_name} 缺少降雨量欄位，跳過此檔案")
             continue
-        
-        print(f"使用降雨量欄位: {rainfall_field}")
-        
-        # 取得 LON 和 LAT 欄位的資料
-        lon_values = df['LON'].tolist()
-        lat_values = df['LAT'].tolist()
-        rainfall_values = df[rainfall_field].tolist()
-        
-        # 刪除已存在的特徵類別 (如果存在)
-        if arcpy.Exists(point_fc):
-            print(f'刪除已存在的特徵類別: {point_fc}')
-            arcpy.Delete_management(point_fc)
-        
-        # 創建空的點特徵類別
-        print("創建點特徵類別...")
-        arcpy.CreateFeatureclass_management(
-            out_path="in_memory",
-            out_name=f"rain_{year_month}_pt",
-            geometry_type="POINT",
-            spatial_reference=spatial_ref
-        )
-        
-        # 添加降雨量欄位
-        arcpy.AddField_management(point_fc, "RAINFALL", "DOUBLE")
-        
-        # 使用游標添加點
-        print("添加點資料...")
-        with arcpy.da.InsertCursor(point_fc, ["SHAPE@XY", "RAINFALL"]) as cursor:
-            for i in range(len(lon_values)):
-                cursor.insertRow([(lon_values[i], lat_values[i]), rainfall_values[i]])
-        
-        print(f'已成功建立特徵類別: {point_fc}')
-        
-        # 步驟 2: 將點資料插值為柵格
-        print(f'開始將點資料插值為柵格...')
-        
+
+        verbose(f"使用降雨量欄位: {rainfall_field}")
+
         # 定義插值參數
         z_field = "RAINFALL"  # 要插值的欄位
-        cell_size = 0.0083  # 柵格大小
-        
+        cell_size = grid_spec.cell_size  # 柵格大小
+
+        if args.backend == 'numpy':
+            verbose(f'開始以 NumPy 將點資料插值為柵格...')
+            lon_values = df['LON'].to_numpy(dtype=numpy.float64)
+            lat_values = df['LAT'].to_numpy(dtype=numpy.float64)
+            rainfall_values = df[rainfall_field].to_numpy(dtype=numpy.float64)
+
+            # 測站改變時才重新取得空間索引 (優先由索引檔讀取)
+            if station_index is None or not station_index.matches(lon_values, lat_values):
+                with stage('index', month=year_month):
+                    station_index, from_file = load_or_build_index(index_path, lon_values, lat_values,
+                                                                   grid_spec.crs)
+                print(f"{'已讀取' if from_file else '已建立'}測站空間索引: {station_index.n} 個測站")
+
+            if tiled:
+                render = idw_tile_renderer(lon_values, lat_values, rainfall_values, grid_spec,
+                                           args.power, args.neighbors, args.radius, station_index)
+                with stage('interpolate_write_tiled', month=year_month):
+                    write_tiled_geotiff(raster_output, grid_spec, render, tile_size=args.tile_size,
+                                        workers=args.workers)
+                count('cells', grid_spec.n_cells)
+                info(f'已成功建立柵格資料: {raster_output} ({grid_spec.n_rows} x {grid_spec.n_cols}, 分塊)')
+                continue
+
+            plan_args = (lon_values, lat_values, grid_spec, args.power, args.neighbors, args.radius)
+
+            # 測站改變時才重新取得權重矩陣 (優先由磁碟快取讀取)
+            if plan_key(*plan_args) != plan_id:
+                with stage('plan', month=year_month):
+                    plan, from_cache = load_or_build_plan(args.plan_cache, *plan_args,
+                                                          tile_size=args.tile_size, index=station_index)
+                plan_id = plan_key(*plan_args)
+                print(f"{'已讀取' if from_cache else '已建立'} IDW 權重矩陣: "
+                      f"{plan.weights.shape[0]} 像元 × {plan.weights.shape[1]} 測站")
+
+            # 每個月份只需一次稀疏矩陣乘積；鄰近測站中有缺值 (NaN) 的像元改以有效測站重新查詢
+            with stage('interpolate', month=year_month):
+                grid = plan.interpolate(rainfall_values)
+            with stage('write', month=year_month):
+                write_geotiff(raster_output, grid, grid_spec)
+            count('cells', grid_spec.n_cells)
+            info(f'已成功建立柵格資料: {raster_output} ({grid_spec.n_rows} x {grid_spec.n_cols})')
+            continue
+
+        # 以結構化陣列一次建立點特徵類別 (不再逐點使用 InsertCursor)
+        verbose("創建點特徵類別...")
+        with stage('feature_class', month=year_month):
+            load_points(point_backend, df, point_fc, spatial_ref, rainfall_field)
+
+        verbose(f'已成功建立特徵類別: {point_fc}')
+
+        # 步驟 2: 將點資料插值為柵格
+        verbose(f'開始將點資料插值為柵格...')
+
         try:
             # 使用 IDW 插值法
-            idw_output = Idw(point_fc, z_field, cell_size)
-            
+            if args.radius is not None:
+                search_radius = RadiusVariable(args.neighbors, args.radius)
+            else:
+                search_radius = RadiusVariable(args.neighbors)
+            with stage('idw', month=year_month):
+                idw_output = Idw(point_fc, z_field, cell_size, args.power, search_radius)
+
             # 檢查輸出柵格檔案是否已存在
             if os.path.exists(raster_output):
                 print(f"刪除已存在的柵格檔案: {raster_output}")
                 os.remove(raster_output)
-            
+
             # 儲存柵格結果
-            idw_output.save(raster_output)
-            
-            print(f'已成功建立柵格資料: {raster_output}')
+            with stage('save', month=year_month):
+                idw_output.save(raster_output)
+            count('cells', grid_spec.n_cells)
+
+            info(f'已成功建立柵格資料: {raster_output}')
         except Exception as e:
             print(f"插值過程發生錯誤: {str(e)}")
             import traceback
             traceback.print_exc()
-        
+
     except Exception as e:
-        print(f"處理檔案 {csv_file} 時發生錯誤: {str(e)}")
+        print(f"處理檔案 {source} 時發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
 
 print('\n*** 所有檔案處理完成 ***')
 
 # 釋放 Spatial Analyst 授權
-arcpy.CheckInExtension("Spatial")
-print("已釋放 Spatial Analyst 擴充模組授權")
+if args.backend == 'arcpy':
+    arcpy.CheckInExtension("Spatial")
+    print("已釋放 Spatial Analyst 擴充模組授權")
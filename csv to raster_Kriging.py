@@ -0,0 +1,164 @@
+import argparse
+import numpy
+import os
+from rain_store import STORE_DIR, has_store, month_sources
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GRID_FILE, load_or_create_grid
+from projection import default_cell_size, normalize_crs
+from station_index import index_file, load_or_build_index
+from kriging import VARIOGRAM_MODELS, Variogram, describe_variogram, fit_variogram, kriging_plan, rbf_plan
+from raster_io import LARGE_GRID_CELLS, write_geotiff, write_tiled_geotiff
+from instrument import add_arguments, configure, count, info, stage
+
+# 以普通克利金或薄板樣條 (RBF) 將各月降雨點資料內插為柵格 (NumPy/SciPy，不需 arcpy 授權)
+# 同一組測站的線性系統只分解一次，各批月份以一次求解與區塊矩陣乘積完成
+parser = argparse.ArgumentParser(description='以普通克利金或薄板樣條將各月降雨點資料內插為柵格')
+parser.add_argument('--method', choices=['kriging', 'rbf'], default='kriging',
+                    help='kriging: 普通克利金 (預設)；rbf: 薄板樣條徑向基函數')
+parser.add_argument('--variogram', choices=VARIOGRAM_MODELS, default='spherical',
+                    help='克利金的變異圖模型 (預設 spherical)')
+parser.add_argument('--range', type=float, default=None,
+                    help='變異圖的變程 (與網格座標同單位)；未指定時由所有月份擬合 sill、range 與 nugget')
+parser.add_argument('--sill', type=float, default=1.0, help='指定 --range 時使用的 sill')
+parser.add_argument('--nugget', type=float, default=0.0, help='指定 --range 時使用的塊金值')
+parser.add_argument('--smoothing', type=float, default=0.0,
+                    help='薄板樣條的平滑參數 (預設 0: 通過測站值)')
+parser.add_argument('--batch-size', type=int, default=32, help='每批求解的月份數')
+parser.add_argument('--tile-size', type=int, default=512, help='網格預測的區塊大小 (像元)')
+parser.add_argument('--tiled', action='store_true',
+                    help='逐區塊預測並直接寫入分塊、含金字塔的 GeoTIFF (網格很大時自動啟用)')
+parser.add_argument('--workers', type=int, default=1, help='分塊模式同時計算的區塊數 (預設 1)')
+parser.add_argument('--cube', default=None,
+                    help='將所有月份寫入此多波段 GeoTIFF (每個月份一個波段)，不輸出單月 TIF')
+parser.add_argument('--grid', default=GRID_FILE,
+                    help='共用網格定義檔 (不存在時由完整測站集合建立，預設 grid_spec.json)')
+parser.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                    default=None, help='以指定範圍重新建立網格定義')
+parser.add_argument('--cell-size', type=float, default=None,
+                    help='柵格大小 (預設 0.0083，約 1 公里；公尺座標系統預設 1000)')
+parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS,
+                    help='網格的座標系統 (預設 EPSG:4326；EPSG:3826 為 TWD97 公尺座標，測站經緯度只投影一次)')
+add_arguments(parser)
+args = parser.parse_args()
+configure(args)
+
+# 獲取當前工作目錄的絕對路徑
+current_dir = os.getcwd()
+print(f"當前工作目錄: {current_dir}")
+
+# 定義輸入資料夾路徑 (使用絕對路徑)
+input_folder = os.path.join(current_dir, "month")
+
+# result.py --output store 產生的二進位資料，存在時直接讀取而不需 month 資料夾的 CSV
+store_folder = os.path.join(current_dir, STORE_DIR)
+if not os.path.exists(input_folder) and not has_store(store_folder):
+    print(f"錯誤: 輸入資料夾 '{input_folder}' 不存在!")
+    exit(1)
+
+# 建立輸出柵格資料夾
+raster_folder = os.path.join(current_dir, "raster_Kriging" if args.method == 'kriging' else "raster_RBF")
+if not os.path.exists(raster_folder):
+    os.makedirs(raster_folder)
+    print(f"已建立柵格輸出資料夾: {raster_folder}")
+
+# 取得所有月份的輸入資料 (二進位資料或 rain_*.csv 檔案)
+month_inputs = month_sources(input_folder, store_folder)
+print(f"找到 {len(month_inputs)} 個月份需要處理")
+if len(month_inputs) == 0:
+    print(f"警告: 在 '{input_folder}' 中找不到任何 'rain_*.csv' 檔案")
+    exit(1)
+
+# 所有月份共用的網格: 由完整測站集合 (或 --bbox) 計算一次並存檔，各柵格腳本輸出對齊
+cell_size = args.cell_size if args.cell_size is not None else default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+grid_spec, from_file = load_or_create_grid(args.grid, month_inputs, cell_size, args.bbox, args.crs)
+print(f"{'已讀取' if from_file else '已建立'}網格定義: {args.grid} "
+      f"({grid_spec.n_rows} x {grid_spec.n_cols}, 柵格大小 {grid_spec.cell_size})")
+
+# 依測站座標分組 (通常所有月份的測站相同，只有一組)
+groups = {}
+for year_month, source, load_month in month_inputs:
+    try:
+        with stage('load', month=year_month):
+            month = load_month(arrays=True)
+        count('station_months', len(month.lon))
+        lon_values = numpy.asarray(month.lon, dtype=numpy.float64)
+        lat_values = numpy.asarray(month.lat, dtype=numpy.float64)
+        key = (lon_values.tobytes(), lat_values.tobytes())
+        group = groups.setdefault(key, (lon_values, lat_values, [], []))
+        group[2].append(year_month)
+        group[3].append(numpy.asarray(month.rainfall, dtype=numpy.float64))
+    except Exception as e:
+        print(f"處理檔案 {source} 時發生錯誤: {str(e)}")
+
+# 大範圍或細網格: 逐區塊預測並寫出，不建立整個網格的 (月份, 列, 行) 陣列
+# (立方體模式以批次寫入波段，不使用分塊模式)
+tiled = not args.cube and (args.tiled or grid_spec.n_cells > LARGE_GRID_CELLS)
+if tiled:
+    print(f"分塊模式: 每個區塊 {args.tile_size} x {args.tile_size} 像元，同時計算 {args.workers} 個區塊")
+
+# 立方體模式: 所有月份依年月順序寫入單一多波段 GeoTIFF，不輸出單月 TIF
+cube = None
+if args.cube:
+    from raster_cube import CubeWriter
+    cube_months = sorted(year_month for group in groups.values() for year_month in group[2])
+    band_of = {year_month: band for band, year_month in enumerate(cube_months)}
+    cube = CubeWriter(args.cube, cube_months, grid_spec)
+
+for lon_values, lat_values, year_months, columns in groups.values():
+    try:
+        # 測站座標 (網格為公尺座標時為投影後的座標，與空間索引一併快取)
+        station_index = load_or_build_index(os.path.join(current_dir, index_file(grid_spec.crs)),
+                                            lon_values, lat_values, grid_spec.crs)[0]
+        x, y = station_index.x, station_index.y
+        rainfall_matrix = numpy.column_stack(columns)  # 測站 × 月份
+        print(f"{len(x)} 個測站，{len(year_months)} 個月份")
+
+        if args.method == 'kriging':
+            if args.range is not None:
+                variogram = Variogram(args.variogram, args.sill, args.range, args.nugget)
+            else:
+                # 以這組測站的所有月份擬合一次變異圖，所有月份共用同一個分解
+                with stage('fit_variogram'):
+                    variogram = fit_variogram(x, y, rainfall_matrix, args.variogram)
+            print(f"變異圖: {describe_variogram(variogram)}")
+            plan = kriging_plan(x, y, grid_spec, variogram, args.tile_size)
+        else:
+            plan = rbf_plan(x, y, grid_spec, args.smoothing, args.tile_size)
+
+        if tiled:
+            for year_month, values in zip(year_months, columns):
+                raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
+                with stage('interpolate_write_tiled', month=year_month):
+                    write_tiled_geotiff(raster_output, grid_spec, plan.tile_renderer(values),
+                                        tile_size=args.tile_size, workers=args.workers)
+                count('cells', grid_spec.n_cells)
+                info(f'已成功建立柵格資料: {raster_output} (分塊)')
+        else:
+            for start in range(0, len(year_months), args.batch_size):
+                stop = min(start + args.batch_size, len(year_months))
+                # 每批月份為一次求解與區塊矩陣乘積
+                with stage('interpolate', month=year_months[start]):
+                    grids = plan.interpolate(rainfall_matrix[:, start:stop])
+                count('cells', grids.size)
+                if cube is not None:
+                    with stage('write', month=year_months[start]):
+                        for year_month, grid in zip(year_months[start:stop], grids):
+                            cube.write(band_of[year_month], grid[numpy.newaxis])
+                    info(f"已寫入月份 {year_months[start]} 到 {year_months[stop - 1]}")
+                    continue
+                for year_month, grid in zip(year_months[start:stop], grids):
+                    raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
+                    with stage('write', month=year_month):
+                        write_geotiff(raster_output, grid, grid_spec)
+                    info(f'已成功建立柵格資料: {raster_output}')
+
+        print(f"線性系統分解次數: {plan.factorizations} (缺值測站以 Schur 補數由同一個分解求解)")
+    except Exception as e:
+        print(f"內插過程發生錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+if cube is not None:
+    cube.close()
+    print(f"已成功建立柵格立方體: {args.cube} "
+          f"({len(cube_months)} 個波段, {grid_spec.n_rows} x {grid_spec.n_cols})")
+print('\n*** 所有檔案處理完成 ***')
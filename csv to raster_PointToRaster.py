@@ -1,30 +1,78 @@
-import arcpy
+import argparse
 import numpy
-import pandas as pd
 import os
-import glob
-from arcpy.sa import *
+from rain_store import STORE_DIR, has_store, month_sources
+from point_loader import ArcpyPointBackend, load_points
+from point_raster import CELL_ASSIGNMENTS
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GRID_FILE, load_or_create_grid
+from projection import default_cell_size, epsg_code, normalize_crs
+from station_index import index_file, load_or_build_index
+from instrument import add_arguments, configure, count, info, is_verbose, stage, verbose
 import time  # 引入 time 模組用於生成唯一臨時檔案名稱
 
-# 檢查 Spatial Analyst 授權
-if arcpy.CheckExtension("Spatial") == "Available":
-    arcpy.CheckOutExtension("Spatial")
-    print("已啟用 Spatial Analyst 擴充模組")
-else:
-    print("警告: Spatial Analyst 擴充模組不可用，無法進行柵格處理")
+# 選擇轉換引擎: arcpy (PointToRaster) 或 numpy (直接寫出 GeoTIFF，不需授權)
+parser = argparse.ArgumentParser(description='將各月降雨點資料直接轉換為柵格')
+parser.add_argument('--backend', choices=['arcpy', 'numpy'], default='arcpy',
+                    help='轉換引擎 (預設 arcpy)')
+parser.add_argument('--assignment', choices=CELL_ASSIGNMENTS, default='MEAN',
+                    help='多個點落在同一個柵格時的處理方式 (預設 MEAN)')
+parser.add_argument('--batch-size', type=int, default=64,
+                    help='numpy 引擎每次向量化處理的月份數')
+parser.add_argument('--workers', type=int, default=1,
+                    help='arcpy 引擎同時轉換的月份數 (工作行程數)；numpy 分塊模式同時計算的區塊數 (預設 1)')
+parser.add_argument('--tiled', action='store_true',
+                    help='numpy 引擎: 逐區塊彙整並直接寫入分塊、含金字塔的 GeoTIFF (網格很大時自動啟用)')
+parser.add_argument('--tile-size', type=int, default=512,
+                    help='分塊模式的區塊大小 (像元，需為 16 的倍數)')
+parser.add_argument('--cube', default=None,
+                    help='numpy 引擎: 將所有月份寫入此多波段 GeoTIFF (每個月份一個波段)，不輸出單月 TIF')
+parser.add_argument('--grid', default=GRID_FILE,
+                    help='共用網格定義檔 (不存在時由完整測站集合建立，預設 grid_spec.json)')
+parser.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                    default=None, help='以指定範圍重新建立網格定義')
+parser.add_argument('--cell-size', type=float, default=None,
+                    help='柵格大小 (預設 0.0083，約 1 公里；公尺座標系統預設 1000)')
+parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS,
+                    help='網格的座標系統 (預設 EPSG:4326；EPSG:3826 為 TWD97 公尺座標，測站經緯度只投影一次)')
+add_arguments(parser)
+args = parser.parse_args()
+configure(args)
+
+if args.cube and args.backend != 'numpy':
+    print("錯誤: --cube 僅支援 --backend numpy")
     exit(1)
 
+if args.backend == 'arcpy':
+    import arcpy
+    from arcpy.sa import *
+
+    # 檢查 Spatial Analyst 授權
+    if arcpy.CheckExtension("Spatial") == "Available":
+        arcpy.CheckOutExtension("Spatial")
+        print("已啟用 Spatial Analyst 擴充模組")
+    else:
+        print("警告: Spatial Analyst 擴充模組不可用，無法進行柵格處理")
+        exit(1)
+else:
+    from point_raster import rasterize, tile_renderer
+    from raster_io import LARGE_GRID_CELLS, write_geotiff, write_tiled_geotiff
+    print("使用 NumPy 點轉柵格引擎")
+
 # 獲取當前工作目錄的絕對路徑
 current_dir = os.getcwd()
 print(f"當前工作目錄: {current_dir}")
 
 # 設定環境
-arcpy.env.workspace = "in_memory"  # 使用記憶體工作空間
-arcpy.env.overwriteOutput = True
+if args.backend == 'arcpy':
+    arcpy.env.workspace = "in_memory"  # 使用記憶體工作空間
+    arcpy.env.overwriteOutput = True
 
 # 定義輸入資料夾路徑 (使用絕對路徑)
 input_folder = os.path.join(current_dir, "month")
-if not os.path.exists(input_folder):
+
+# result.py --output store 產生的二進位資料，存在時直接讀取而不需 month 資料夾的 CSV
+store_folder = os.path.join(current_dir, STORE_DIR)
+if not os.path.exists(input_folder) and not has_store(store_folder):
     print(f"錯誤: 輸入資料夾 '{input_folder}' 不存在!")
     # 嘗試列出當前目錄下的所有資料夾
     print("當前目錄下的資料夾和檔案:")
@@ -38,10 +86,10 @@ if not os.path.exists(raster_folder):
     os.makedirs(raster_folder)
     print(f"已建立柵格輸出資料夾: {raster_folder}")
 
-# 取得所有符合格式的 CSV 檔案
-csv_files = glob.glob(os.path.join(input_folder, 'rain_*.csv'))
-print(f"找到 {len(csv_files)} 個 CSV 檔案需要處理")
-if len(csv_files) == 0:
+# 取得所有月份的輸入資料 (二進位資料或 rain_*.csv 檔案)
+month_inputs = month_sources(input_folder, store_folder)
+print(f"找到 {len(month_inputs)} 個月份需要處理")
+if len(month_inputs) == 0:
     print(f"警告: 在 '{input_folder}' 中找不到任何 'rain_*.csv' 檔案")
     # 列出資料夾中的所有檔案
     if os.path.exists(input_folder):
@@ -50,37 +98,134 @@ if len(csv_files) == 0:
             print(f"  - {item}")
     exit(1)
 
-# 使用 WGS 1984 空間參考
+# 所有月份共用的網格: 由完整測站集合 (或 --bbox) 計算一次並存檔，各柵格腳本輸出對齊
+cell_size = args.cell_size if args.cell_size is not None else default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+grid_spec, from_file = load_or_create_grid(args.grid, month_inputs, cell_size, args.bbox, args.crs)
+print(f"{'已讀取' if from_file else '已建立'}網格定義: {args.grid} "
+      f"({grid_spec.n_rows} x {grid_spec.n_cols}, 柵格大小 {grid_spec.cell_size})")
+
+# numpy 引擎: 不建立特徵類別與暫存柵格，同一組測站的像元編號只計算一次，
+# 並以一次向量化呼叫彙整一批月份後直接寫出 GeoTIFF
+if args.backend == 'numpy':
+    # 依測站座標分組 (通常所有月份的測站相同，只有一組)
+    groups = {}
+    for year_month, source, load_month in month_inputs:
+        try:
+            with stage('load', month=year_month):
+                month = load_month(arrays=True)
+            count('station_months', len(month.lon))
+            lon_values = numpy.asarray(month.lon, dtype=numpy.float64)
+            lat_values = numpy.asarray(month.lat, dtype=numpy.float64)
+            key = (lon_values.tobytes(), lat_values.tobytes())
+            group = groups.setdefault(key, (lon_values, lat_values, [], []))
+            group[2].append(year_month)
+            group[3].append(numpy.asarray(month.rainfall, dtype=numpy.float64))
+        except Exception as e:
+            print(f"處理檔案 {source} 時發生錯誤: {str(e)}")
+
+    # 大範圍或細網格: 逐區塊彙整並寫出，不建立整個網格的 (月份, 列, 行) 陣列
+    # (立方體模式以批次寫入波段，不使用分塊模式)
+    tiled = not args.cube and (args.tiled or grid_spec.n_cells > LARGE_GRID_CELLS)
+    if tiled:
+        print(f"分塊模式: 每個區塊 {args.tile_size} x {args.tile_size} 像元，同時計算 {args.workers} 個區塊")
+
+    # 立方體模式: 所有月份依年月順序寫入單一多波段 GeoTIFF，不輸出單月 TIF
+    cube = None
+    if args.cube:
+        from raster_cube import CubeWriter
+        cube_months = sorted(year_month for group in groups.values() for year_month in group[2])
+        band_of = {year_month: band for band, year_month in enumerate(cube_months)}
+        cube = CubeWriter(args.cube, cube_months, grid_spec)
+
+    for lon_values, lat_values, year_months, columns in groups.values():
+        # 各測站在共用網格上所在的像元 (由 result.csv 旁的測站空間索引取得)
+        with stage('index'):
+            station_index = load_or_build_index(os.path.join(current_dir, index_file(grid_spec.crs)),
+                                                lon_values, lat_values, grid_spec.crs)[0]
+            cells = station_index.cells(grid_spec)
+        print(f"{len(lon_values)} 個測站 ({numpy.count_nonzero(cells < 0)} 個在網格外)，"
+              f"{len(year_months)} 個月份")
+
+        if tiled:
+            for year_month, values in zip(year_months, columns):
+                raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
+                render = tile_renderer(cells, values, grid_spec, args.tile_size, args.assignment)
+                with stage('rasterize_write_tiled', month=year_month):
+                    write_tiled_geotiff(raster_output, grid_spec, render, tile_size=args.tile_size,
+                                        workers=args.workers)
+                count('cells', grid_spec.n_cells)
+                info(f'已成功建立柵格資料: {raster_output} (分塊)')
+            continue
+
+        for start in range(0, len(year_months), args.batch_size):
+            stop = min(start + args.batch_size, len(year_months))
+            with stage('rasterize', month=year_months[start]):
+                grids = rasterize(cells, numpy.column_stack(columns[start:stop]),
+                                  grid_spec.n_rows, grid_spec.n_cols, args.assignment)
+            count('cells', grids.size)
+            if cube is not None:
+                with stage('write', month=year_months[start]):
+                    for year_month, grid in zip(year_months[start:stop], grids):
+                        cube.write(band_of[year_month], grid[numpy.newaxis])
+                info(f"已寫入月份 {year_months[start]} 到 {year_months[stop - 1]}")
+                continue
+            for year_month, grid in zip(year_months[start:stop], grids):
+                raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
+                with stage('write', month=year_month):
+                    write_geotiff(raster_output, grid, grid_spec)
+                info(f'已成功建立柵格資料: {raster_output}')
+
+    if cube is not None:
+        cube.close()
+        print(f"已成功建立柵格立方體: {args.cube} "
+              f"({len(cube_months)} 個波段, {grid_spec.n_rows} x {grid_spec.n_cols})")
+    print('\n*** 所有檔案處理完成 ***')
+    exit(0)
+
+# 點資料使用 WGS 1984 經緯度，輸出柵格使用網格的座標系統 (例如 TWD97，由 arcpy 投影)
 spatial_ref = arcpy.SpatialReference(4326)  # WGS 1984
+point_backend = ArcpyPointBackend()
+
+# 輸出範圍與柵格大小只設定一次，不再逐月由點資料範圍計算
+arcpy.env.extent = arcpy.Extent(*grid_spec.extent)
+arcpy.env.cellSize = grid_spec.cell_size
+arcpy.env.outputCoordinateSystem = arcpy.SpatialReference(epsg_code(grid_spec.crs))
 
-# 處理每個 CSV 檔案
-for csv_file in csv_files:
+# 多行程模式: 各工作行程使用自己的暫存資料夾與 arcpy 環境設定，月份平行轉換
+if args.workers > 1:
+    from raster_workers import ArcpyRasterBackend, month_jobs, run_months
+    print(f"使用 {args.workers} 個工作行程平行轉換")
+    raster_backend = ArcpyRasterBackend('point', assignment=args.assignment)
+    with stage('run_months'):
+        failed = run_months(raster_backend, month_jobs(month_inputs, raster_folder), grid_spec,
+                            args.workers, os.path.join(current_dir, "scratch"))
+    print(f'\n*** 所有檔案處理完成 ({len(failed)} 個月份失敗) ***')
+    arcpy.CheckInExtension("Spatial")
+    exit(0)
+
+# 處理每個月份
+for year_month, source, load_month in month_inputs:
     try:
-        # 顯示完整檔案路徑
-        print(f"\n處理檔案: {csv_file}")
+        # 顯示完整資料來源
+        info(f"\n處理檔案: {source}")
         
-        # 從檔名取得年月資訊
-        file_name = os.path.basename(csv_file)
-        year_month = file_name.replace("rain_", "").replace(".csv", "")
+        file_name = f"rain_{year_month}"
         
         # 定義輸出名稱
         point_fc = f"in_memory/rain_{year_month}_pt"
         raster_output = os.path.join(raster_folder, f"rain_{year_month}.tif")
         
-        print(f"輸出點特徵類別: {point_fc}")
-        print(f"輸出柵格檔案: {raster_output}")
-        
-        # 檢查 CSV 檔案是否存在
-        if not os.path.exists(csv_file):
-            print(f"錯誤: CSV 檔案 '{csv_file}' 不存在!")
-            continue
+        verbose(f"輸出點特徵類別: {point_fc}")
+        verbose(f"輸出柵格檔案: {raster_output}")
         
-        # 讀取 CSV 檔案
-        print(f"讀取 CSV 檔案: {csv_file}")
-        df = pd.read_csv(csv_file)
-        print(f"資料形狀: {df.shape}")
-        print("資料前 5 筆:")
-        print(df.head())
+        # 讀取月份資料
+        verbose(f"讀取資料: {source}")
+        with stage('load', month=year_month):
+            df = load_month()
+        count('station_months', len(df))
+        verbose(f"資料形狀: {df.shape}")
+        verbose("資料前 5 筆:")
+        verbose(df.head())
         
         # 確認資料欄位
         if 'LON' not in df.columns or 'LAT' not in df.columns:
@@ -97,53 +242,24 @@ for csv_file in csv_files:
             print(f"錯誤: {file_name} 缺少降雨量欄位，跳過此檔案")
             continue
         
-        print(f"使用降雨量欄位: {rainfall_field}")
+        verbose(f"使用降雨量欄位: {rainfall_field}")
         
-        # 取得 LON 和 LAT 欄位的資料
-        lon_values = df['LON'].tolist()
-        lat_values = df['LAT'].tolist()
-        rainfall_values = df[rainfall_field].tolist()
+        # 以結構化陣列一次建立點特徵類別 (不再逐點使用 InsertCursor)
+        verbose("創建點特徵類別...")
+        with stage('feature_class', month=year_month):
+            load_points(point_backend, df, point_fc, spatial_ref, rainfall_field)
         
-        # 刪除已存在的特徵類別 (如果存在)
-        if arcpy.Exists(point_fc):
-            print(f'刪除已存在的特徵類別: {point_fc}')
-            arcpy.Delete_management(point_fc)
-        
-        # 創建空的點特徵類別
-        print("創建點特徵類別...")
-        arcpy.CreateFeatureclass_management(
-            out_path="in_memory",
-            out_name=f"rain_{year_month}_pt",
-            geometry_type="POINT",
-            spatial_reference=spatial_ref
-        )
-        
-        # 添加降雨量欄位
-        arcpy.AddField_management(point_fc, "RAINFALL", "DOUBLE")
-        
-        # 使用游標添加點
-        print("添加點資料...")
-        with arcpy.da.InsertCursor(point_fc, ["SHAPE@XY", "RAINFALL"]) as cursor:
-            for i in range(len(lon_values)):
-                cursor.insertRow([(lon_values[i], lat_values[i]), rainfall_values[i]])
-        
-        print(f'已成功建立特徵類別: {point_fc}')
+        verbose(f'已成功建立特徵類別: {point_fc}')
         
         # 步驟 2: 直接將點資料轉換為柵格 (不使用插值法)
-        print(f'開始將點資料直接轉換為柵格...')
+        verbose(f'開始將點資料直接轉換為柵格...')
         
         try:
-            # 定義柵格大小
-            cell_size = 0.0083  # 約 1 公里
-            
-            # 計算研究區域範圍 (從點資料中獲取)
-            extent = arcpy.Describe(point_fc).extent
-            
-            # 設定輸出範圍
-            arcpy.env.extent = extent
+            # 柵格大小與輸出範圍使用共用網格定義
+            cell_size = grid_spec.cell_size
             
             # 使用 PointToRaster 工具直接將點轉換為柵格
-            print("使用 PointToRaster 工具將點資料轉換為柵格...")
+            verbose("使用 PointToRaster 工具將點資料轉換為柵格...")
             
             # 使用時間戳記建立唯一的臨時檔案名稱
             timestamp = int(time.time())
@@ -154,14 +270,15 @@ for csv_file in csv_files:
                 arcpy.Delete_management(temp_raster)
                 
             # 執行 PointToRaster
-            arcpy.conversion.PointToRaster(
-                in_features=point_fc,
-                value_field="RAINFALL",
-                out_rasterdataset=temp_raster,
-                cell_assignment="MEAN",  # 使用平均值處理多個點落在同一個柵格的情況
-                priority_field="NONE",
-                cellsize=cell_size
-            )
+            with stage('point_to_raster', month=year_month):
+                arcpy.conversion.PointToRaster(
+                    in_features=point_fc,
+                    value_field="RAINFALL",
+                    out_rasterdataset=temp_raster,
+                    cell_assignment=args.assignment,  # 預設使用平均值處理多個點落在同一個柵格的情況
+                    priority_field="NONE",
+                    cellsize=cell_size
+                )
             
             # 檢查輸出柵格檔案是否已存在
             if os.path.exists(raster_output):
@@ -169,20 +286,23 @@ for csv_file in csv_files:
                 os.remove(raster_output)
             
             # 儲存柵格結果
-            arcpy.management.CopyRaster(temp_raster, raster_output)
+            with stage('copy_raster', month=year_month):
+                arcpy.management.CopyRaster(temp_raster, raster_output)
+            count('cells', grid_spec.n_cells)
             
             # 清理臨時資料
             if arcpy.Exists(temp_raster):
                 arcpy.Delete_management(temp_raster)
             
-            print(f'已成功建立柵格資料: {raster_output}')
+            info(f'已成功建立柵格資料: {raster_output}')
             
-            # 顯示柵格資訊
-            raster_desc = arcpy.Describe(raster_output)
-            print(f"柵格資訊:")
-            print(f"  - 寬度: {raster_desc.width} 像素")
-            print(f"  - 高度: {raster_desc.height} 像素")
-            print(f"  - 像素大小: {arcpy.Raster(raster_output).meanCellWidth} x {arcpy.Raster(raster_output).meanCellHeight}")
+            # 顯示柵格資訊 (需再次開啟柵格，只在 --log-level verbose 時讀取)
+            if is_verbose():
+                raster_desc = arcpy.Describe(raster_output)
+                print(f"柵格資訊:")
+                print(f"  - 寬度: {raster_desc.width} 像素")
+                print(f"  - 高度: {raster_desc.height} 像素")
+                print(f"  - 像素大小: {arcpy.Raster(raster_output).meanCellWidth} x {arcpy.Raster(raster_output).meanCellHeight}")
             
         except Exception as e:
             print(f"柵格轉換過程發生錯誤: {str(e)}")
@@ -190,7 +310,7 @@ for csv_file in csv_files:
             traceback.print_exc()
         
     except Exception as e:
-        print(f"處理檔案 {csv_file} 時發生錯誤: {str(e)}")
+        print(f"處理檔案 {source} 時發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
 
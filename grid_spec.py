@@ -0,0 +1,219 @@
+"""所有柵格輸出共用的網格定義
+
+網格 (左上角原點、像元大小、列數與行數、空間參考) 只由完整的測站集合或指定的範圍計算一次，
+並存為 grid_spec.json，讓所有月份與所有柵格轉換方式都輸出到同一個對齊的網格；
+像元與測站的對應關係因此可以在整個執行過程中重複使用。
+crs 可為公尺座標系統 (例如 TWD97 / EPSG:3826)，此時範圍與像元大小以公尺表示，
+測站經緯度在計算範圍時投影一次 (projection.py)。
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from projection import project_points
+
+# 預設像元大小 (約 1 公里)
+DEFAULT_CELL_SIZE = 0.0083
+
+# 預設空間參考: WGS 1984
+DEFAULT_CRS = 'EPSG:4326'
+
+# 網格定義的預設檔名
+GRID_FILE = 'grid_spec.json'
+
+
+class GridSpec:
+    """柵格網格定義"""
+
+    def __init__(self, origin_x, origin_y, cell_size, n_rows, n_cols, crs=DEFAULT_CRS):
+        self.origin_x = float(origin_x)
+        self.origin_y = float(origin_y)
+        self.cell_size = float(cell_size)
+        self.n_rows = int(n_rows)
+        self.n_cols = int(n_cols)
+        self.crs = crs
+
+    @classmethod
+    def from_bbox(cls, xmin, ymin, xmax, ymax, cell_size=DEFAULT_CELL_SIZE, crs=DEFAULT_CRS):
+        """以範圍建立網格，原點為左上角"""
+        n_cols = max(1, int(math.ceil((xmax - xmin) / cell_size)))
+        n_rows = max(1, int(math.ceil((ymax - ymin) / cell_size)))
+        return cls(xmin, ymax, cell_size, n_rows, n_cols, crs)
+
+    @classmethod
+    def from_points(cls, x, y, cell_size=DEFAULT_CELL_SIZE, crs=DEFAULT_CRS):
+        """以點資料範圍建立網格 (與 ArcGIS 預設輸出範圍相同)"""
+        return cls.from_bbox(float(np.nanmin(x)), float(np.nanmin(y)),
+                             float(np.nanmax(x)), float(np.nanmax(y)), cell_size, crs)
+
+    @property
+    def shape(self):
+        return self.n_rows, self.n_cols
+
+    @property
+    def n_cells(self):
+        return self.n_rows * self.n_cols
+
+    @property
+    def extent(self):
+        """(xmin, ymin, xmax, ymax)"""
+        return (self.origin_x, self.origin_y - self.n_rows * self.cell_size,
+                self.origin_x + self.n_cols * self.cell_size, self.origin_y)
+
+    def cell_centers(self, row0=0, row1=None, col0=0, col1=None):
+        """回傳指定範圍內像元中心的 (x, y) 網格陣列"""
+        row1 = self.n_rows if row1 is None else row1
+        col1 = self.n_cols if col1 is None else col1
+        cx = self.origin_x + (np.arange(col0, col1) + 0.5) * self.cell_size
+        cy = self.origin_y - (np.arange(row0, row1) + 0.5) * self.cell_size
+        return np.meshgrid(cx, cy)
+
+    def tiles(self, tile_size):
+        """依列優先順序產生 tile_size × tile_size 區塊的 (row0, row1, col0, col1)"""
+        for row0 in range(0, self.n_rows, tile_size):
+            row1 = min(row0 + tile_size, self.n_rows)
+            for col0 in range(0, self.n_cols, tile_size):
+                yield row0, row1, col0, min(col0 + tile_size, self.n_cols)
+
+    def cell_index(self, x, y):
+        """將座標轉換為像元編號 (列 × 行數 + 行)；網格外的點為 -1
+
+        落在網格右緣或下緣邊界上的點歸入最後一行或最後一列。
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        col = np.floor((x - self.origin_x) / self.cell_size).astype(np.int64)
+        row = np.floor((self.origin_y - y) / self.cell_size).astype(np.int64)
+
+        xmin, ymin, xmax, ymax = self.extent
+        col[(col == self.n_cols) & np.isclose(x, xmax)] = self.n_cols - 1
+        row[(row == self.n_rows) & np.isclose(y, ymin)] = self.n_rows - 1
+
+        inside = (col >= 0) & (col < self.n_cols) & (row >= 0) & (row < self.n_rows)
+        return np.where(inside, row * self.n_cols + col, -1)
+
+    def to_dict(self):
+        return {
+            'origin_x': self.origin_x,
+            'origin_y': self.origin_y,
+            'cell_size': self.cell_size,
+            'n_rows': self.n_rows,
+            'n_cols': self.n_cols,
+            'crs': self.crs,
+        }
+
+    def covers(self, extent):
+        """網格範圍是否包含 extent (xmin, ymin, xmax, ymax)"""
+        xmin, ymin, xmax, ymax = self.extent
+        tolerance = 1e-9 * self.cell_size
+        return (extent[0] >= xmin - tolerance and extent[1] >= ymin - tolerance
+                and extent[2] <= xmax + tolerance and extent[3] <= ymax + tolerance)
+
+    def save(self, path, bbox=None):
+        """存為 JSON；bbox 為建立網格時指定的範圍 (由測站範圍建立時為 None)"""
+        data = self.to_dict()
+        if bbox is not None:
+            data['bbox'] = [float(v) for v in bbox]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        """讀取 save() 存出的 JSON"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        data.pop('bbox', None)
+        return cls(**data)
+
+    def __eq__(self, other):
+        return isinstance(other, GridSpec) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return (f"GridSpec(origin=({self.origin_x}, {self.origin_y}), cell_size={self.cell_size}, "
+                f"shape=({self.n_rows}, {self.n_cols}), crs={self.crs!r})")
+
+
+def points_extent(lon, lat, crs=DEFAULT_CRS):
+    """測站經緯度在 crs 座標系統中的範圍 (xmin, ymin, xmax, ymax)"""
+    x, y = project_points(lon, lat, crs)
+    return float(np.nanmin(x)), float(np.nanmin(y)), float(np.nanmax(x)), float(np.nanmax(y))
+
+
+def persisted_extent(folder, crs=DEFAULT_CRS):
+    """由 folder 中已存的測站索引 (station_index.npz，記錄完整測站集合的經緯度) 計算測站範圍
+
+    只讀取一個小檔案，不需要逐月讀取月份資料；沒有可用的索引檔時回傳 None。
+    """
+    from station_index import INDEX_FILE
+
+    path = os.path.join(folder, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as f:
+            if str(f['crs']) != DEFAULT_CRS:
+                return None
+            lon, lat = f['x'], f['y']
+    except Exception:
+        return None
+    return points_extent(lon, lat, crs)
+
+
+def station_extent(month_inputs, crs=DEFAULT_CRS):
+    """由所有月份的測站座標計算完整測站集合在 crs 座標系統中的範圍"""
+    xmin = ymin = np.inf
+    xmax = ymax = -np.inf
+    seen = set()
+    for _, _, load_month in month_inputs:
+        month = load_month(arrays=True)
+        lon = np.asarray(month.lon, dtype=np.float64)
+        lat = np.asarray(month.lat, dtype=np.float64)
+        key = (lon.tobytes(), lat.tobytes())
+        if key in seen:
+            continue
+        seen.add(key)
+        lon, lat = project_points(lon, lat, crs)
+        xmin, xmax = min(xmin, np.nanmin(lon)), max(xmax, np.nanmax(lon))
+        ymin, ymax = min(ymin, np.nanmin(lat)), max(ymax, np.nanmax(lat))
+    return xmin, ymin, xmax, ymax
+
+
+def load_or_create_grid(path, month_inputs, cell_size=DEFAULT_CELL_SIZE, bbox=None, crs=DEFAULT_CRS):
+    """讀取已存在的網格定義；沒有時由指定範圍或完整測站集合建立並存檔
+
+    指定 bbox (crs 座標系統的單位)，或 cell_size、crs 與已存的定義不同時重新建立。
+    由測站範圍建立的定義在目前的測站超出其範圍時 (例如新增了範圍外的測站) 也重新建立；
+    以 bbox 建立的定義則沿用，範圍外的測站與當初指定時相同不列入網格。
+    測站範圍優先由網格檔旁的 station_index.npz 計算 (persisted_extent)，
+    沒有索引檔時才逐月讀取 month_inputs。
+    回傳 (GridSpec, 是否由檔案讀取)。
+    """
+    def current_extent():
+        extent = persisted_extent(os.path.dirname(os.path.abspath(path)), crs)
+        return station_extent(month_inputs, crs) if extent is None else extent
+
+    extent = None
+    if bbox is None and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        from_bbox = saved.pop('bbox', None) is not None
+        grid = GridSpec(**saved)
+        if grid.cell_size == float(cell_size) and grid.crs == crs:
+            if from_bbox:
+                return grid, True
+            extent = current_extent()
+            if grid.covers(extent):
+                return grid, True
+
+    if bbox is not None:
+        grid = GridSpec.from_bbox(*bbox, cell_size=cell_size, crs=crs)
+        grid.save(path, bbox)
+        return grid, False
+
+    if extent is None:
+        extent = current_extent()
+    grid = GridSpec.from_bbox(*extent, cell_size=cell_size, crs=crs)
+    grid.save(path)
+    return grid, False
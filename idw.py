@@ -0,0 +1,289 @@
+"""以 NumPy 與 KD-tree 實作的反距離權重 (IDW) 內插
+
+不需要 ArcGIS Spatial Analyst 授權，可在 Linux 上以無介面方式執行。
+參數對應 arcpy.sa.Idw：power (次方)、n_neighbors (搜尋點數) 與 radius (最大搜尋距離)。
+網格以 tile_size × tile_size 的區塊逐塊計算，記憶體用量只與區塊大小有關。
+鄰近測站由 station_index.StationIndex 查詢，可傳入與點轉柵格、測站檢查共用的索引。
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from grid_spec import GridSpec
+from station_index import StationIndex
+
+# 預設參數與 arcpy.sa.Idw 相同: 次方 2、可變搜尋半徑 12 點
+DEFAULT_POWER = 2.0
+DEFAULT_NEIGHBORS = 12
+
+# 缺值標記
+NODATA = -99.9
+
+# 像元中心與測站重合時使用的權重，遠大於一般的 1/d^p，使該測站值主導結果；
+# 若該測站當月缺值，則自然退回由其他鄰近測站加權
+EXACT_WEIGHT = 1e100
+
+
+def idw_points(index, z, qx, qy, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS, radius=None):
+    """對查詢點 (qx, qy) 進行 IDW 內插
+
+    index 為測站的 StationIndex，z 為對應的測站值。
+    搜尋範圍內沒有任何測站的查詢點為 NaN。
+    """
+    dist, idx = index.nearest(qx, qy, n_neighbors, radius)
+
+    # 超出搜尋半徑的鄰近點距離為 inf，索引為 index.n
+    values = z[np.where(np.isfinite(dist), idx, 0)]
+    return idw_weighted(dist, values, power)
+
+
+def idw_weighted(dist, values, power=DEFAULT_POWER):
+    """由鄰近測站的距離與值 (皆為 查詢點 × 鄰近點) 計算 IDW
+
+    距離為 inf 的鄰近點不列入；與測站重合 (距離 0) 的查詢點直接取測站值；沒有鄰近點的查詢點為 NaN。
+    """
+    found = np.isfinite(dist)
+    with np.errstate(divide='ignore'):
+        weights = np.where(found, 1.0 / dist ** power, 0.0)
+
+    # 查詢點與測站重合時直接取測站值
+    exact = found & (dist == 0)
+    has_exact = exact.any(axis=1)
+    weights[has_exact] = exact[has_exact].astype(float)
+
+    total = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (weights * values).sum(axis=1) / total
+    result[total == 0] = np.nan
+    return result
+
+
+def idw_tile_renderer(x, y, z, grid, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS, radius=None,
+                      index=None):
+    """回傳逐區塊計算 IDW 的函式 render(row0, row1, col0, col1) → float32 區塊
+
+    每個區塊各自查詢鄰近測站，不需要整個網格的權重矩陣，供 raster_io.write_tiled_geotiff() 使用。
+    z 為 NaN 或 -99.9 的測站不列入計算；所有測站都有效時直接使用傳入的 index，否則只以有效測站建立索引。
+    """
+    z = np.asarray(z, dtype=np.float64)
+    if index is None:
+        index = StationIndex(x, y)
+    valid = ~np.isnan(z) & (z != NODATA)
+    index = index.subset(valid)
+    z = z[valid]
+
+    def render(row0, row1, col0, col1):
+        if index.n == 0:
+            return np.full((row1 - row0, col1 - col0), np.nan, dtype=np.float32)
+        qx, qy = grid.cell_centers(row0, row1, col0, col1)
+        block = idw_points(index, z, qx, qy, power, n_neighbors, radius)
+        return block.reshape(qx.shape).astype(np.float32)
+
+    return render
+
+
+def idw_grid(x, y, z, grid, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS, radius=None, tile_size=512,
+             index=None):
+    """在網格 (GridSpec) 的各像元中心進行 IDW 內插，回傳 (n_rows, n_cols) 的 float32 陣列
+
+    z 為 NaN 的測站不列入計算。
+    """
+    render = idw_tile_renderer(x, y, z, grid, power, n_neighbors, radius, index)
+    out = np.empty(grid.shape, dtype=np.float32)
+    for row0, row1, col0, col1 in grid.tiles(tile_size):
+        out[row0:row1, col0:col1] = render(row0, row1, col0, col1)
+    return out
+
+
+def idw_brute_force(x, y, z, qx, qy, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS, radius=None):
+    """以暴力法計算所有查詢點到所有測站距離的 IDW，作為驗證基準"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    result = np.full(len(qx), np.nan)
+    for i in range(len(qx)):
+        dist = np.hypot(x - qx[i], y - qy[i])
+        order = np.argsort(dist, kind='stable')[:n_neighbors]
+        if radius is not None:
+            order = order[dist[order] < radius]
+        if len(order) == 0:
+            continue
+        exact = dist[order] == 0
+        if exact.any():
+            result[i] = z[order][exact].mean()
+            continue
+        weights = 1.0 / dist[order] ** power
+        result[i] = np.sum(weights * z[order]) / np.sum(weights)
+    return result
+
+
+def _neighbor_weights(dist, power):
+    """鄰近測站的權重；與測站重合的像元使用 EXACT_WEIGHT"""
+    with np.errstate(divide='ignore'):
+        return np.where(dist == 0, EXACT_WEIGHT, 1.0 / dist ** power)
+
+
+def _cell_centers(grid, cells):
+    """像元編號 (列 × 行數 + 行) 的中心座標"""
+    rows, cols = np.divmod(cells, grid.n_cols)
+    return (grid.origin_x + (cols + 0.5) * grid.cell_size,
+            grid.origin_y - (rows + 0.5) * grid.cell_size)
+
+
+class IdwPlan:
+    """固定測站與網格下的 IDW 權重矩陣 (像元 × 測站 的稀疏矩陣)
+
+    測站網路在各月份之間不變，只有降雨量改變，因此像元到鄰近測站的
+    距離與權重只需計算一次。之後每個月份只是一次稀疏矩陣與向量的乘積，
+    多個月份則為一次稀疏矩陣與矩陣的乘積。
+    缺值測站 (-99.9 或 NaN) 與 idw_tile_renderer 相同，改用 k 個最近的有效測站：
+    只有鄰近測站中有缺值的像元以有效測站重新查詢，缺值測站相同的月份共用重新查詢的結果。
+    """
+
+    def __init__(self, weights, grid, index, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS, radius=None):
+        self.weights = weights.tocsr()
+        self.grid = grid
+        self.index = index
+        self.power = power
+        self.n_neighbors = n_neighbors
+        self.radius = radius
+
+    @classmethod
+    def build(cls, x, y, grid, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS, radius=None, tile_size=512,
+              index=None):
+        """計算網格 (GridSpec) 各像元中心到鄰近測站的權重
+
+        index 為 (x, y) 的 StationIndex (例如 result.csv 旁的 station_index.npz)；未指定時重新建立。
+        """
+        if index is None:
+            index = StationIndex(x, y)
+
+        n_cols = grid.n_cols
+        rows, cols, data = [], [], []
+        for row0, row1, col0, col1 in grid.tiles(tile_size):
+            qx, qy = grid.cell_centers(row0, row1, col0, col1)
+            dist, idx = index.nearest(qx, qy, n_neighbors, radius)
+            k = idx.shape[1]
+
+            # 區塊內的像元編號轉換為整個網格的像元編號
+            r, c = np.meshgrid(np.arange(row0, row1), np.arange(col0, col1), indexing='ij')
+            cell = np.repeat((r * n_cols + c).ravel(), k).reshape(-1, k)
+
+            found = np.isfinite(dist)
+            weight = _neighbor_weights(dist, power)
+            rows.append(cell[found])
+            cols.append(idx[found])
+            data.append(weight[found])
+
+        weights = sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(grid.n_cells, index.n),
+        )
+        return cls(weights, grid, index, power, n_neighbors, radius)
+
+    def nearest_valid(self, cells, valid):
+        """像元 cells 的 k 個最近有效測站，回傳 (距離, 測站編號) 皆為 (像元, k')
+
+        缺值測站不多於 k 個時以原本的索引多查詢缺值測站數個鄰近點再排除缺值測站，
+        否則只以有效測站建立索引查詢。未使用的鄰近點距離為 inf、編號為 0。
+        """
+        qx, qy = _cell_centers(self.grid, cells)
+        n_invalid = int((~valid).sum())
+        if n_invalid > self.n_neighbors:
+            stations = np.flatnonzero(valid)
+            dist, idx = self.index.subset(valid).nearest(qx, qy, self.n_neighbors, self.radius)
+            found = np.isfinite(dist)
+            return dist, np.where(found, stations[np.where(found, idx, 0)], 0)
+
+        dist, idx = self.index.nearest(qx, qy, self.n_neighbors + n_invalid, self.radius)
+        idx = np.where(np.isfinite(dist), idx, 0)
+        use = np.isfinite(dist) & valid[idx]
+        use &= np.cumsum(use, axis=1) <= self.n_neighbors
+        return np.where(use, dist, np.inf), idx
+
+    def interpolate(self, z, tile_size=512):
+        """以權重矩陣內插
+
+        z 為各測站的值 (測站,) 或多個月份 (測站 × 月份)；
+        回傳 (n_rows, n_cols) 或 (月份, n_rows, n_cols) 的 float32 陣列。
+        鄰近測站中有缺值的像元 (包含鄰近測站全部缺值的像元) 以 k 個最近的有效測站重新計算，
+        結果與 idw_tile_renderer 相同。
+        """
+        z = np.asarray(z, dtype=np.float64)
+        values = z if z.ndim == 2 else z[:, None]
+        valid = ~np.isnan(values) & (values != NODATA)
+        filled = np.where(valid, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (self.weights @ filled) / (self.weights @ valid.astype(np.float64))
+
+        # 缺值測站相同的月份共用重新查詢的結果 (例如整年停測的測站)
+        patterns, inverse = np.unique(valid, axis=1, return_inverse=True)
+        inverse = np.ravel(inverse)
+        for p in range(patterns.shape[1]):
+            pattern = patterns[:, p]
+            if pattern.all():
+                continue
+            months = np.flatnonzero(inverse == p)
+            affected = np.flatnonzero(self.weights @ (~pattern).astype(np.float64))
+            for start in range(0, len(affected), tile_size * tile_size):
+                cells = affected[start:start + tile_size * tile_size]
+                dist, idx = self.nearest_valid(cells, pattern)
+                for m in months:
+                    result[cells, m] = idw_weighted(dist, filled[idx, m], self.power)
+
+        result = result.astype(np.float32)
+        if z.ndim == 1:
+            return result[:, 0].reshape(self.grid.shape)
+        return result.T.reshape(z.shape[1], *self.grid.shape)
+
+    def save(self, path):
+        """將權重矩陣與重新查詢所需的測站座標、參數存為 .npz"""
+        w = self.weights
+        np.savez(path, data=w.data, indices=w.indices, indptr=w.indptr, shape=np.array(w.shape),
+                 grid=np.array(json.dumps(self.grid.to_dict())),
+                 x=self.index.x, y=self.index.y, crs=np.array(self.index.crs),
+                 params=np.array(json.dumps([self.power, self.n_neighbors, self.radius])))
+
+    @classmethod
+    def load(cls, path):
+        """讀取 save() 存出的權重矩陣"""
+        with np.load(path) as f:
+            weights = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+            grid = GridSpec(**json.loads(str(f['grid'])))
+            index = StationIndex(f['x'], f['y'], str(f['crs']))
+            power, n_neighbors, radius = json.loads(str(f['params']))
+        return cls(weights, grid, index, power, n_neighbors, radius)
+
+
+def plan_key(x, y, grid, power, n_neighbors, radius):
+    """以測站座標、網格與 IDW 參數計算權重矩陣的快取鍵"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    digest.update(json.dumps(grid.to_dict(), sort_keys=True).encode('utf-8'))
+    digest.update(repr((float(power), int(n_neighbors), radius)).encode('utf-8'))
+    # 快取格式版本 (版本 2 另存測站座標，供缺值月份重新查詢)
+    digest.update(b'v2')
+    return digest.hexdigest()
+
+
+def load_or_build_plan(cache_dir, x, y, grid, power=DEFAULT_POWER, n_neighbors=DEFAULT_NEIGHBORS,
+                       radius=None, tile_size=512, index=None):
+    """由磁碟快取讀取權重矩陣，沒有快取時建立並存檔
+
+    回傳 (IdwPlan, 是否由快取讀取)。
+    """
+    key = plan_key(x, y, grid, power, n_neighbors, radius)
+    path = os.path.join(cache_dir, f'idw_plan_{key}.npz') if cache_dir else None
+    if path and os.path.exists(path):
+        return IdwPlan.load(path), True
+
+    plan = IdwPlan.build(x, y, grid, power, n_neighbors, radius, tile_size, index)
+    if path:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        plan.save(path)
+    return plan, False
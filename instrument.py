@@ -0,0 +1,345 @@
+"""各處理階段的計時、計數與記憶體量測
+
+以 context manager 包住各階段 (讀取 CSV、建立特徵類別、內插、寫出柵格、符號設定…)，
+每個階段結束時記錄耗時、目前與峰值 RSS、(選用) tracemalloc 配置峰值，以及階段內的計數：
+
+    from instrument import add_arguments, configure, count, stage, verbose
+
+    add_arguments(parser)              # --log-level、--trace、--trace-memory、--profile
+    configure(args)
+    with stage('interpolate', month='1960_01'):
+        ...
+        count('cells', grid.n_cells)
+    verbose(f"資料形狀: {df.shape}")    # 只在 --log-level verbose 時輸出
+
+指定 --trace 時每個階段寫一列 JSON 到 trace.jsonl，結束時印出各階段的彙整表；
+未指定時 stage() 不做任何量測。--profile cprofile|pyinstrument 另外輸出整個執行過程的剖析結果。
+巢狀階段各自記錄 (外層的耗時包含內層)；tracemalloc 的峰值為整個行程的配置，
+多執行緒同時執行時只是近似值，子行程 (--workers) 內的工作不列入。
+
+彙整既有的追蹤檔:
+    python instrument.py trace.jsonl --by stage month
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 輸出訊息的詳細程度: quiet 只輸出錯誤與結果摘要，verbose 另外輸出逐檔的檢查訊息
+LOG_LEVELS = ('quiet', 'info', 'verbose')
+
+# --trace 未指定檔名時的預設追蹤檔
+TRACE_FILE = 'trace.jsonl'
+
+# 剖析結果的預設檔名 (依剖析工具加上副檔名)
+PROFILE_FILE = 'profile'
+
+MB = 1024 * 1024
+
+_log_level = LOG_LEVELS.index('info')
+
+
+def set_log_level(level):
+    global _log_level
+    _log_level = LOG_LEVELS.index(level)
+
+
+def is_verbose():
+    return _log_level >= LOG_LEVELS.index('verbose')
+
+
+def info(*args, **kwargs):
+    """一般進度訊息 (--log-level quiet 時不輸出)"""
+    if _log_level >= LOG_LEVELS.index('info'):
+        print(*args, **kwargs)
+
+
+def verbose(*args, **kwargs):
+    """逐檔的檢查訊息 (只在 --log-level verbose 時輸出)"""
+    if _log_level >= LOG_LEVELS.index('verbose'):
+        print(*args, **kwargs)
+
+
+def rss_mb():
+    """目前的常駐記憶體 (MB)；無法取得時為 None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / MB
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """行程啟動以來的峰值常駐記憶體 (MB)；無法取得時為 None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 的單位為 KB，macOS 為 bytes
+        return peak / MB if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / MB
+    return None
+
+
+class _Frame:
+    """執行中的階段"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.counts = {}
+        self.start = time.perf_counter()
+        # 內層階段結束前觀察到的 tracemalloc 峰值 (內層會重設峰值)
+        self.alloc_peak = 0
+
+
+class Tracer:
+    """收集各階段的量測並寫入 JSON lines 追蹤檔
+
+    path 為 None 時只在記憶體中彙整 (仍可印出彙整表)。
+    memory 為 True 時啟用 tracemalloc 量測各階段的 Python 配置峰值 (會使執行變慢)。
+    """
+
+    def __init__(self, path=None, memory=False):
+        self.path = path
+        self.memory = memory
+        self.records = []
+        self.counters = {}
+        self.start = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            self._file = open(path, 'w', encoding='utf-8')
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """量測一個階段；fields (例如 month、file) 一併寫入追蹤檔"""
+        stack = self._stack()
+        if self.memory:
+            if stack:
+                stack[-1].alloc_peak = max(stack[-1].alloc_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        frame = _Frame(fields)
+        stack.append(frame)
+        error = None
+        try:
+            yield frame
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - frame.start
+            stack.pop()
+            record = {'stage': name, **fields, 'seconds': round(seconds, 6),
+                      'start': round(frame.start - self.start, 6)}
+            if threading.current_thread() is not threading.main_thread():
+                record['thread'] = threading.current_thread().name
+            if frame.counts:
+                record['counts'] = frame.counts
+            record['rss_mb'] = _round(rss_mb())
+            record['peak_rss_mb'] = _round(peak_rss_mb())
+            if self.memory:
+                alloc_peak = max(frame.alloc_peak, tracemalloc.get_traced_memory()[1])
+                record['alloc_peak_mb'] = _round(alloc_peak / MB)
+                if stack:
+                    stack[-1].alloc_peak = max(stack[-1].alloc_peak, alloc_peak)
+            if error is not None:
+                record['error'] = error
+            self._write(record)
+
+    def count(self, name, n=1):
+        """累加計數 (例如處理的像元數)；同時計入目前執行中的階段"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        for frame in self._stack():
+            frame.counts[name] = frame.counts.get(name, 0) + n
+
+    def _write(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._file.flush()
+
+    def close(self):
+        """寫入整體計數與總耗時，回傳彙整表"""
+        wall = time.perf_counter() - self.start
+        self._write({'stage': 'total', 'seconds': round(wall, 6), 'counts': dict(self.counters),
+                     'peak_rss_mb': _round(peak_rss_mb())})
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return summarize(self.records)
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def summarize(records, by=('stage',)):
+    """依 by 欄位彙整各階段的次數、耗時與記憶體峰值 (pandas DataFrame，依總耗時排序)"""
+    stages = [r for r in records if r['stage'] != 'total']
+    if not stages:
+        return pd.DataFrame(columns=[*by, 'calls', 'seconds', 'mean', 'max', 'share'])
+    df = pd.DataFrame(stages)
+    for column in by:
+        if column not in df.columns:
+            df[column] = None
+    for column in ('peak_rss_mb', 'alloc_peak_mb'):
+        if column not in df.columns:
+            df[column] = float('nan')
+    totals = [r for r in records if r['stage'] == 'total']
+    wall = totals[-1]['seconds'] if totals else df['seconds'].sum()
+
+    table = df.groupby(list(by), dropna=False, sort=False).agg(
+        calls=('seconds', 'size'), seconds=('seconds', 'sum'), mean=('seconds', 'mean'),
+        max=('seconds', 'max'), peak_rss_mb=('peak_rss_mb', 'max'), alloc_peak_mb=('alloc_peak_mb', 'max'),
+    ).reset_index()
+    table['share'] = table['seconds'] / wall if wall else float('nan')
+    return table.sort_values('seconds', ascending=False).reset_index(drop=True)
+
+
+def print_summary(table, counters=None, wall=None):
+    if wall is not None:
+        print(f"\n總耗時 {wall:.2f} 秒")
+    keys = [c for c in table.columns if c not in ('calls', 'seconds', 'mean', 'max', 'share',
+                                                   'peak_rss_mb', 'alloc_peak_mb')]
+    print(f"{'階段':<28}{'次數':>6}{'總秒數':>10}{'平均':>10}{'最大':>10}{'比例':>8}{'RSS峰值MB':>11}{'配置峰值MB':>11}")
+    for row in table.to_dict('records'):
+        label = ' '.join(str(row[k]) for k in keys if row[k] is not None and row[k] == row[k])
+        print(f"{label:<28}{row['calls']:>6}{row['seconds']:>10.3f}{row['mean']:>10.4f}{row['max']:>10.4f}"
+              f"{row['share']:>8.1%}{_format_mb(row['peak_rss_mb']):>11}{_format_mb(row['alloc_peak_mb']):>11}")
+    for name, n in (counters or {}).items():
+        rate = f"，每秒 {n / wall:,.0f}" if wall else ''
+        print(f"計數 {name}: {n:,}{rate}")
+
+
+def _format_mb(value):
+    return '' if value is None or value != value else f'{value:.1f}'
+
+
+# 各腳本共用的量測物件；未呼叫 configure() 或未指定 --trace 時為 None，stage() 不做任何量測
+_tracer = None
+_profiler = None
+
+
+def stage(name, **fields):
+    """量測一個階段 (未啟用追蹤時為空的 context manager)"""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.stage(name, **fields)
+
+
+def count(name, n=1):
+    if _tracer is not None:
+        _tracer.count(name, n)
+
+
+def add_arguments(parser):
+    """加入 --log-level、--trace、--trace-memory 與 --profile 選項"""
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='info',
+                        help='訊息詳細程度: quiet、info (預設)、verbose (輸出逐檔的資料形狀與前幾筆資料)')
+    parser.add_argument('--trace', nargs='?', const=TRACE_FILE, default=None,
+                        help=f'將各階段的耗時與記憶體寫入 JSON lines 追蹤檔並印出彙整表 (預設檔名 {TRACE_FILE})')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='以 tracemalloc 量測各階段的 Python 配置峰值 (會使執行變慢)')
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None,
+                        help=f'剖析整個執行過程，輸出 {PROFILE_FILE}.prof (cProfile) 或 {PROFILE_FILE}.html (pyinstrument)')
+
+
+def configure(args):
+    """依 add_arguments() 的選項設定訊息層級、追蹤與剖析；結束時 (含 exit()) 自動輸出結果"""
+    global _tracer, _profiler
+    set_log_level(args.log_level)
+    if args.trace or args.trace_memory:
+        _tracer = Tracer(args.trace, args.trace_memory)
+    if args.profile == 'cprofile':
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif args.profile == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("錯誤: --profile pyinstrument 需要安裝 pyinstrument (pip install pyinstrument)")
+            exit(1)
+        _profiler = Profiler()
+        _profiler.start()
+    atexit.register(finish)
+
+
+def finish():
+    """停止剖析、關閉追蹤檔並印出彙整表 (configure() 已註冊於結束時呼叫)"""
+    global _tracer, _profiler
+    if _profiler is not None:
+        profiler, _profiler = _profiler, None
+        if hasattr(profiler, 'dump_stats'):
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(PROFILE_FILE + '.prof')
+            print(f"\n剖析結果 (依累計時間前 20 個函式)，完整結果: {PROFILE_FILE}.prof")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        else:
+            profiler.stop()
+            with open(PROFILE_FILE + '.html', 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            print(f"\n剖析結果已保存到 {PROFILE_FILE}.html")
+    if _tracer is not None:
+        tracer, _tracer = _tracer, None
+        table = tracer.close()
+        print_summary(table, tracer.counters, time.perf_counter() - tracer.start)
+        if tracer.path:
+            print(f"追蹤紀錄已保存到 {tracer.path}")
+
+
+def load_trace(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='彙整 --trace 產生的 JSON lines 追蹤檔')
+    parser.add_argument('trace', nargs='?', default=TRACE_FILE, help=f'追蹤檔 (預設 {TRACE_FILE})')
+    parser.add_argument('--by', nargs='+', default=['stage'],
+                        help='彙整的欄位 (例如 stage month 或 stage file，預設 stage)')
+    args = parser.parse_args()
+
+    try:
+        records = load_trace(args.trace)
+    except Exception as e:
+        print(f"讀取追蹤檔 {args.trace} 時發生錯誤: {str(e)}")
+        exit(1)
+    totals = [r for r in records if r['stage'] == 'total']
+    print_summary(summarize(records, args.by), totals[-1].get('counts') if totals else None,
+                  totals[-1]['seconds'] if totals else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+"""以 NumPy/SciPy 實作的普通克利金 (ordinary kriging) 與薄板樣條 (thin-plate spline) 徑向基函數內插
+
+兩者都寫成對偶形式 z(s) = Σ a_i k(s, s_i) + p(s)，係數由下列線性系統求得：
+
+    [K   P] [a]   [z]
+    [Pᵀ  0] [b] = [0]
+
+K 為 測站 × 測站 的共變異數 (克利金) 或核函數 (RBF) 矩陣，P 為多項式項 (克利金為常數，RBF 為 1, x, y)。
+K 只與測站位置及變異圖有關，同一組測站只需 LU 分解一次；所有月份的右手邊 (測站 × 月份)
+以一次 lu_solve 求解。網格預測逐區塊計算 像元 × 測站 的核矩陣，再與 測站 × 月份 的係數矩陣相乘；
+核矩陣依 KERNEL_CHUNK_ELEMENTS 分段計算，記憶體用量與測站數無關。
+所有測站的系統只分解一次；缺值測站 (NaN 或 -99.9) 依當月的有效測站組合分組，
+每種組合以 Schur 補數由同一個分解求解 (只需對 k 個缺值測站多求解 k 個右手邊)，不重新分解。
+缺值測站的係數為 0，因此所有月份仍共用同一個核矩陣區塊。
+留一交叉驗證 (loo_predictions) 使用閉合解，不需逐一移除測站重新分解。
+"""
+import json
+import os
+import threading
+import warnings
+from collections import namedtuple
+
+import numpy as np
+from scipy.linalg import LinAlgWarning, lu_factor, lu_solve
+from scipy.optimize import curve_fit
+from scipy.spatial.distance import cdist, pdist
+
+# 缺值標記
+NODATA = -99.9
+
+# 變異圖模型 (range 為實際變程: 半變異達到 sill 的 95%)
+VARIOGRAM_MODELS = ('spherical', 'exponential', 'gaussian')
+
+# 變異圖參數；sill 不含塊金值 (nugget)
+Variogram = namedtuple('Variogram', ['model', 'sill', 'range', 'nugget'])
+
+# 擬合變異圖時的距離分組數
+DEFAULT_LAGS = 15
+
+# 擬合變異圖的存檔名 (pipeline.py 放在輸出資料夾)
+VARIOGRAM_FILE = 'variogram.json'
+
+# 網格預測時每段 像元 × 測站 核矩陣的元素數上限 (float64 約 32 MB；核函數的暫存陣列大小相同)
+KERNEL_CHUNK_ELEMENTS = 1 << 22
+
+
+def semivariance(variogram, h):
+    """變異圖在距離 h 的半變異值 (h = 0 時為 0)"""
+    h = np.asarray(h, dtype=np.float64)
+    ratio = h / variogram.range
+    if variogram.model == 'spherical':
+        shape = np.where(ratio < 1, 1.5 * ratio - 0.5 * ratio ** 3, 1.0)
+    elif variogram.model == 'exponential':
+        shape = 1 - np.exp(-3 * ratio)
+    elif variogram.model == 'gaussian':
+        shape = 1 - np.exp(-3 * ratio ** 2)
+    else:
+        raise ValueError(f"不支援的變異圖模型: {variogram.model}")
+    return np.where(h > 0, variogram.nugget + variogram.sill * shape, 0.0)
+
+
+def covariance(variogram, h):
+    """由變異圖換算的共變異數 C(h) = (sill + nugget) - γ(h)"""
+    return variogram.sill + variogram.nugget - semivariance(variogram, h)
+
+
+def thin_plate(h):
+    """薄板樣條核函數 r² log r (r = 0 時為 0)"""
+    h = np.asarray(h, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(h > 0, h ** 2 * np.log(h), 0.0)
+
+
+def valid_mask(z):
+    """非缺值 (NaN 或 -99.9) 的測站"""
+    z = np.asarray(z, dtype=np.float64)
+    return ~np.isnan(z) & (z != NODATA)
+
+
+def empirical_variogram(x, y, z, n_lags=DEFAULT_LAGS, max_lag=None):
+    """合併所有月份的經驗半變異圖，回傳 (各組平均距離, 半變異, 測站組合數)
+
+    z 為 測站 × 月份；各月份先標準化 (減平均、除以標準差)，
+    避免雨季月份的變異主導結果，擬合出的 sill 因此約為 1。
+    """
+    z = np.asarray(z, dtype=np.float64)
+    if z.ndim == 1:
+        z = z[:, None]
+    dist = pdist(np.column_stack([x, y]))
+    if max_lag is None:
+        max_lag = dist.max() / 2
+    lag = np.minimum((dist / max_lag * n_lags).astype(np.int64), n_lags)
+    i, j = np.triu_indices(len(x), k=1)
+
+    gamma_sum = np.zeros(n_lags + 1)
+    count = np.zeros(n_lags + 1)
+    for column in z.T:
+        valid = valid_mask(column)
+        if valid.sum() < 3:
+            continue
+        values = np.where(valid, column, np.nan)
+        std = np.nanstd(values)
+        if std == 0:
+            continue
+        values = (values - np.nanmean(values)) / std
+        diff = values[i] - values[j]
+        pair = ~np.isnan(diff)
+        gamma_sum += np.bincount(lag[pair], weights=0.5 * diff[pair] ** 2, minlength=n_lags + 1)
+        count += np.bincount(lag[pair], minlength=n_lags + 1)
+
+    dist_sum = np.bincount(lag, weights=dist, minlength=n_lags + 1)
+    pairs = np.bincount(lag, minlength=n_lags + 1)
+    # 最後一組為超過 max_lag 的組合，不列入
+    keep = count[:n_lags] > 0
+    with np.errstate(invalid='ignore'):
+        lags = (dist_sum / pairs)[:n_lags][keep]
+    return lags, (gamma_sum / np.maximum(count, 1))[:n_lags][keep], count[:n_lags][keep]
+
+
+def fit_variogram(x, y, z, model='spherical', n_lags=DEFAULT_LAGS, max_lag=None):
+    """以所有月份的經驗半變異圖擬合變異圖 (以組合數加權的最小平方法)"""
+    if model not in VARIOGRAM_MODELS:
+        raise ValueError(f"不支援的變異圖模型: {model}")
+    lags, gamma, count = empirical_variogram(x, y, z, n_lags, max_lag)
+    if max_lag is None:
+        max_lag = pdist(np.column_stack([x, y])).max() / 2
+    if len(lags) < 3:
+        return Variogram(model, 1.0, max_lag, 0.0)
+
+    def curve(h, sill, range_, nugget):
+        return semivariance(Variogram(model, sill, range_, nugget), h)
+
+    initial = (max(gamma.max(), 1e-6), max_lag / 2, min(gamma[0], gamma.max() / 2))
+    try:
+        params, _ = curve_fit(curve, lags, gamma, p0=initial, sigma=1 / np.sqrt(count),
+                              bounds=([1e-9, max_lag / 100, 0.0], [np.inf, max_lag * 10, np.inf]))
+    except (RuntimeError, ValueError):
+        params = initial
+    sill, range_, nugget = (float(p) for p in params)
+    return Variogram(model, sill, range_, nugget)
+
+
+class KernelPlan:
+    """固定測站與網格下的對偶形式內插 (克利金或薄板樣條)
+
+    所有測站的線性系統 A 只做一次 LU 分解，各月份、各批次與各種有效測站組合之間共用。
+    有缺值測站 M 的月份不重新分解，以 Schur 補數求解有效測站 V 的系統 (B = A⁻¹)：
+
+        A_VV⁻¹ = B_VV - B_VM (B_MM)⁻¹ B_MV
+
+    B 的缺值測站欄 (B_VM 與 B_MM) 由既有分解以 k 個右手邊求解，只需再分解 k × k 的 B_MM。
+    所有測站的矩陣為奇異 (例如位置重複的測站且沒有塊金值) 時，改為逐組直接分解有效測站的系統 (不快取)。
+    factorizations 記錄 (N + 多項式項) 大小的分解次數。
+    多個執行緒 (例如 pipeline.py 同時處理多個月份) 共用同一個分解，建立分解與計數以鎖保護；
+    求解與網格預測 (主要的計算量) 只讀取分解，不需要鎖，仍可平行。
+    """
+
+    def __init__(self, x, y, grid, kernel, degree=0, smoothing=0.0, tile_size=512):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.grid = grid
+        self.kernel = kernel
+        self.degree = degree
+        self.smoothing = float(smoothing)
+        self.tile_size = tile_size
+        # 多項式項使用平移與縮放後的座標，避免公尺座標造成數值條件不佳
+        self.center = (self.x.mean(), self.y.mean())
+        self.scale = max(np.ptp(self.x), np.ptp(self.y), 1e-12)
+        self.factorizations = 0
+        self._full = None
+        self._factored = False
+        self._full_inverse_diagonal = None
+        self._lock = threading.Lock()
+
+    @property
+    def n_terms(self):
+        """多項式項數"""
+        return 1 if self.degree == 0 else 3
+
+    def _poly(self, qx, qy):
+        columns = [np.ones(len(qx))]
+        if self.degree >= 1:
+            columns += [(qx - self.center[0]) / self.scale, (qy - self.center[1]) / self.scale]
+        return np.column_stack(columns)
+
+    def _system(self, valid):
+        """有效測站組合的線性系統矩陣"""
+        xs, ys = self.x[valid], self.y[valid]
+        n, p = len(xs), self.n_terms
+        system = np.zeros((n + p, n + p))
+        system[:n, :n] = self.kernel(cdist(np.column_stack([xs, ys]), np.column_stack([xs, ys])))
+        system[:n, :n] += self.smoothing * np.eye(n)
+        poly = self._poly(xs, ys)
+        system[:n, n:] = poly
+        system[n:, :n] = poly.T
+        return system
+
+    def _count_factorization(self):
+        with self._lock:
+            self.factorizations += 1
+
+    def _full_factor(self):
+        """所有測站系統的 LU 分解 (只分解一次)；矩陣奇異時為 None"""
+        with self._lock:
+            if not self._factored:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', LinAlgWarning)
+                    factor = lu_factor(self._system(np.ones(len(self.x), dtype=bool)))
+                self.factorizations += 1
+                pivots = np.abs(np.diag(factor[0]))
+                singular = (not np.all(np.isfinite(pivots))
+                            or pivots.min() <= np.finfo(np.float64).eps * len(pivots) * pivots.max())
+                self._full = None if singular else factor
+                self._factored = True
+        return self._full
+
+    def _keep(self, valid):
+        """線性系統中保留的列: 有效測站與多項式項"""
+        return np.concatenate([valid, np.ones(self.n_terms, dtype=bool)])
+
+    def _missing_columns(self, factor, valid):
+        """A⁻¹ 的缺值測站欄 (B_·M) 與 B_MM 的 LU 分解"""
+        missing = np.flatnonzero(~valid)
+        unit = np.zeros((len(self.x) + self.n_terms, len(missing)))
+        unit[missing, np.arange(len(missing))] = 1.0
+        columns = lu_solve(factor, unit)
+        return missing, columns, lu_factor(columns[missing])
+
+    def _solve(self, valid, rhs):
+        """以有效測站的系統求解；rhs 與解皆為 (測站 + 多項式項) 列，缺值測站的列為 0"""
+        factor = self._full_factor()
+        if factor is None:
+            keep = self._keep(valid)
+            self._count_factorization()
+            solution = np.zeros_like(rhs)
+            solution[keep] = lu_solve(lu_factor(self._system(valid)), rhs[keep])
+            return solution
+
+        solution = lu_solve(factor, rhs)
+        if valid.all():
+            return solution
+        # 扣除缺值測站的 Schur 補數項，缺值測站的解因此為 0
+        missing, columns, inner = self._missing_columns(factor, valid)
+        solution -= columns @ lu_solve(inner, solution[missing])
+        solution[missing] = 0.0
+        return solution
+
+    def coefficients(self, z):
+        """各月份的對偶係數 (a: 測站 × 月份, b: 多項式項 × 月份)
+
+        有效測站數不足以決定多項式項的月份，係數為 NaN (預測結果為無資料)。
+        """
+        z = np.asarray(z, dtype=np.float64)
+        if z.ndim == 1:
+            z = z[:, None]
+        n, n_months = z.shape
+        valid = valid_mask(z)
+        a = np.zeros((n, n_months))
+        b = np.zeros((self.n_terms, n_months))
+
+        # 依有效測站組合分組，每組以共用的分解一次求解該組所有月份
+        patterns, group = np.unique(valid.T, axis=0, return_inverse=True)
+        for g, pattern in enumerate(patterns):
+            columns = np.flatnonzero(group.ravel() == g)
+            if pattern.sum() < self.n_terms + 1:
+                a[:, columns] = np.nan
+                b[:, columns] = np.nan
+                continue
+            rhs = np.zeros((n + self.n_terms, len(columns)))
+            rhs[:n][pattern] = z[pattern][:, columns]
+            solution = self._solve(pattern, rhs)
+            a[:, columns] = solution[:n]
+            b[:, columns] = solution[n:]
+        return a, b
+
+    def predict_points(self, a, b, qx, qy):
+        """以對偶係數預測查詢點的值 (查詢點 × 月份)
+
+        核矩陣每段最多 KERNEL_CHUNK_ELEMENTS 個元素，避免 區塊像元 × 測站 的矩陣與其暫存陣列佔用過多記憶體。
+        """
+        qx = np.ravel(qx)
+        qy = np.ravel(qy)
+        stations = np.column_stack([self.x, self.y])
+        out = np.empty((len(qx), a.shape[1]))
+        chunk = max(1, KERNEL_CHUNK_ELEMENTS // max(1, len(self.x)))
+        for start in range(0, len(qx), chunk):
+            stop = min(start + chunk, len(qx))
+            k = self.kernel(cdist(np.column_stack([qx[start:stop], qy[start:stop]]), stations))
+            out[start:stop] = k @ a + self._poly(qx[start:stop], qy[start:stop]) @ b
+        return out
+
+    def _predict(self, a, b, row0, row1, col0, col1):
+        """區塊內各像元的預測值 (月份, 列, 行)"""
+        qx, qy = self.grid.cell_centers(row0, row1, col0, col1)
+        values = self.predict_points(a, b, qx, qy)
+        return values.T.reshape(a.shape[1], row1 - row0, col1 - col0)
+
+    def _inverse_diagonal(self, valid):
+        """有效測站組合的系統反矩陣對角線 (只取有效測站部分)"""
+        factor = self._full_factor()
+        if factor is None:
+            self._count_factorization()
+            size = int(valid.sum()) + self.n_terms
+            return np.diag(lu_solve(lu_factor(self._system(valid)), np.eye(size)))[:int(valid.sum())]
+
+        with self._lock:
+            if self._full_inverse_diagonal is None:
+                self._full_inverse_diagonal = np.diag(lu_solve(factor, np.eye(len(self.x) + self.n_terms)))
+        diagonal = self._full_inverse_diagonal.copy()
+        if not valid.all():
+            # (A_VV⁻¹)_ii = B_ii - B_iM (B_MM)⁻¹ B_Mi
+            _, columns, inner = self._missing_columns(factor, valid)
+            diagonal -= np.einsum('ij,ji->i', columns, lu_solve(inner, columns.T))
+        return diagonal[:len(self.x)][valid]
+
+    def loo_predictions(self, z):
+        """留一交叉驗證: 各測站被移除後，由其餘測站在該測站位置的預測值 (測站,) 或 (測站 × 月份)
+
+        以閉合解 z_i - a_i / (A⁻¹)_ii 計算 (Dubrule 1983；Rippa 1999)，a 為對偶係數，
+        A⁻¹ 的對角線每種有效測站組合只計算一次，不需重新分解 N 次。缺值測站為 NaN。
+        """
+        z = np.asarray(z, dtype=np.float64)
+        single = z.ndim == 1
+        if single:
+            z = z[:, None]
+        a, _ = self.coefficients(z)
+        valid = valid_mask(z)
+        out = np.full(z.shape, np.nan)
+
+        patterns, group = np.unique(valid.T, axis=0, return_inverse=True)
+        for g, pattern in enumerate(patterns):
+            columns = np.flatnonzero(group.ravel() == g)
+            # 移除一個測站後仍需足以決定多項式項
+            if pattern.sum() < self.n_terms + 2:
+                continue
+            diagonal = self._inverse_diagonal(pattern)
+            block = np.ix_(pattern, columns)
+            out[block] = z[block] - a[block] / diagonal[:, None]
+        return out[:, 0] if single else out
+
+    def interpolate(self, z):
+        """內插一個或多個月份
+
+        z 為各測站的值 (測站,) 或多個月份 (測站 × 月份)；
+        回傳 (n_rows, n_cols) 或 (月份, n_rows, n_cols) 的 float32 陣列。
+        """
+        z = np.asarray(z, dtype=np.float64)
+        a, b = self.coefficients(z)
+        out = np.empty((a.shape[1], *self.grid.shape), dtype=np.float32)
+        for row0, row1, col0, col1 in self.grid.tiles(self.tile_size):
+            out[:, row0:row1, col0:col1] = self._predict(a, b, row0, row1, col0, col1)
+        return out[0] if z.ndim == 1 else out
+
+    def tile_renderer(self, z):
+        """回傳單一月份逐區塊預測的函式 render(row0, row1, col0, col1)，供 raster_io.write_tiled_geotiff() 使用"""
+        a, b = self.coefficients(z)
+
+        def render(row0, row1, col0, col1):
+            return self._predict(a, b, row0, row1, col0, col1)[0].astype(np.float32)
+
+        return render
+
+
+def kriging_plan(x, y, grid, variogram, tile_size=512):
+    """普通克利金: 共變異數核函數與常數項 (權重總和為 1 的限制)"""
+    return KernelPlan(x, y, grid, lambda h: covariance(variogram, h), degree=0, tile_size=tile_size)
+
+
+def rbf_plan(x, y, grid, smoothing=0.0, tile_size=512):
+    """薄板樣條: r² log r 核函數與一次多項式；smoothing > 0 時為平滑樣條 (不再通過測站值)
+
+    距離以測站範圍縮放後再代入核函數 (縮放只改變可被一次多項式吸收的項，結果不變)。
+    """
+    scale = max(np.ptp(np.asarray(x, dtype=np.float64)), np.ptp(np.asarray(y, dtype=np.float64)), 1e-12)
+    return KernelPlan(x, y, grid, lambda h: thin_plate(h / scale), degree=1, smoothing=smoothing,
+                      tile_size=tile_size)
+
+
+def variogram_key(station_key, model, crs):
+    """變異圖存檔的鍵: 測站座標雜湊 (StationIndex.key)、模型與座標系統"""
+    return f'{station_key}:{model}:{crs}'
+
+
+def load_variogram(path):
+    """讀取 save_variogram() 存出的變異圖，回傳 (Variogram, 鍵)"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return Variogram(data['model'], data['sill'], data['range'], data['nugget']), data['key']
+
+
+def save_variogram(path, variogram, key):
+    """存為 JSON (先寫入暫存檔再取代)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, **variogram._asdict()}, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_or_fit_variogram(path, key, fit, refit=False):
+    """讀取存檔的變異圖；不存在、無法讀取、鍵不同或 refit 時以 fit() 重新擬合並存檔
+
+    測站與模型不變時一直沿用同一組參數，只修正部分雨量值不會改變變異圖。
+    回傳 (Variogram, 是否由存檔讀取)。
+    """
+    if not refit and os.path.exists(path):
+        try:
+            variogram, saved_key = load_variogram(path)
+            if saved_key == key:
+                return variogram, True
+        except (OSError, ValueError, KeyError) as e:
+            print(f"無法讀取變異圖 {path}，重新擬合: {str(e)}")
+
+    variogram = fit()
+    save_variogram(path, variogram, key)
+    return variogram, False
+
+
+def describe_variogram(variogram):
+    """變異圖參數的說明文字"""
+    return (f"{variogram.model} (sill {variogram.sill:.4g}, range {variogram.range:.4g}, "
+            f"nugget {variogram.nugget:.4g})")
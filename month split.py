@@ -1,89 +1,82 @@
-import pandas as pd
+import argparse
 import os
-import re
-from datetime import datetime
+
+import pandas as pd
+
+from month_writer import parse_month_columns, split_months
+from rain_store import STORE_DIR, has_store, is_stale, open_store
+from instrument import add_arguments, configure, count, info, stage, verbose
 
 # 設定輸入檔案和輸出資料夾
 input_file = 'result.csv'
 output_folder = 'month'
 
-# 確保輸出資料夾存在
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-    print(f"已建立資料夾: {output_folder}")
 
-# 讀取 result.csv 檔案
-try:
-    print(f"正在讀取檔案: {input_file}")
-    df = pd.read_csv(input_file)
-    
-    # 顯示資料基本資訊
-    print(f"資料形狀: {df.shape}")
-    print(f"資料欄位: {df.columns.tolist()}")
-    
-    # 確認資料中有 LON 和 LAT 欄位
-    if 'LON' not in df.columns or 'LAT' not in df.columns:
-        print("錯誤: 資料中缺少 LON 或 LAT 欄位")
-        exit(1)
-    
-    # 篩選出日期欄位 (假設日期欄位的格式為 YYYY-MM-DD)
-    date_columns = []
-    for col in df.columns:
-        if col not in ['LON', 'LAT']:  # 排除經緯度欄位
-            date_columns.append(col)
-    
-    print(f"找到 {len(date_columns)} 個日期欄位")
-    
-    # 處理每個日期欄位
-    for date_col in date_columns:
-        try:
-            # 嘗試解析日期格式
-            date_obj = datetime.strptime(date_col, '%Y-%m-%d')
-            year = date_obj.year
-            month = date_obj.month
-            
-            # 建立新的 DataFrame，只包含經緯度和當前日期的降雨量
-            month_df = df[['LON', 'LAT', date_col]].copy()
-            
-            # 重新命名欄位，將日期欄位改名為 "RAINFALL"
-            month_df.rename(columns={date_col: 'RAINFALL'}, inplace=True)
-            
-            # 輸出檔案名稱格式: rain_YYYY_MM.csv
-            output_file = os.path.join(output_folder, f'rain_{year}_{month:02d}.csv')
-            
-            # 將資料寫入 CSV 檔案
-            month_df.to_csv(output_file, index=False)
-            print(f"已輸出檔案: {output_file}")
-            
-        except ValueError as e:
-            # 如果無法解析日期格式，嘗試其他可能的格式
-            try:
-                # 嘗試從欄位名稱中提取年月
-                match = re.search(r'(\d{4})-(\d{2})', date_col)
-                if match:
-                    year = int(match.group(1))
-                    month = int(match.group(2))
-                    
-                    # 建立新的 DataFrame，只包含經緯度和當前日期的降雨量
-                    month_df = df[['LON', 'LAT', date_col]].copy()
-                    
-                    # 重新命名欄位，將日期欄位改名為 "RAINFALL"
-                    month_df.rename(columns={date_col: 'RAINFALL'}, inplace=True)
-                    
-                    # 輸出檔案名稱格式: rain_YYYY_MM.csv
-                    output_file = os.path.join(output_folder, f'rain_{year}_{month:02d}.csv')
-                    
-                    # 將資料寫入 CSV 檔案
-                    month_df.to_csv(output_file, index=False)
-                    print(f"已輸出檔案: {output_file}")
-                else:
-                    print(f"無法從欄位名稱 '{date_col}' 中提取年月資訊，跳過此欄位")
-            except Exception as inner_e:
-                print(f"處理欄位 '{date_col}' 時發生錯誤: {str(inner_e)}")
-    
-    print("所有月份資料拆分完成！")
-    
-except Exception as e:
-    print(f"讀取或處理檔案時發生錯誤: {str(e)}")
-    import traceback
-    traceback.print_exc()
+def main():
+    parser = argparse.ArgumentParser(description='將總觀測資料按月份分割為 rain_YYYY_MM.csv')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='寫出檔案的執行緒數 (預設 4)')
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help='比對內容雜湊，略過內容未變動的輸出檔案')
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    try:
+        # 若有 result.py --output store 產生的二進位資料 (且 result.csv 未在之後改寫)，直接由其切片
+        if os.path.exists(STORE_DIR) and is_stale(STORE_DIR):
+            print(f"{STORE_DIR} 早於 result.csv，改為讀取 result.csv")
+        if has_store(STORE_DIR):
+            print(f"正在讀取二進位資料: {STORE_DIR}")
+            store = open_store(STORE_DIR)
+            lon, lat = store.lon, store.lat
+            years = store.months.astype('M8[Y]').astype(int) + 1970
+            months = store.months.astype(int) % 12 + 1
+            # 月份 × 測站 轉為 測站 × 月份 (僅為檢視，不複製資料)
+            values = store.rainfall.T
+        else:
+            # 讀取 result.csv 檔案
+            print(f"正在讀取檔案: {input_file}")
+            with stage('read_csv', file=input_file):
+                df = pd.read_csv(input_file)
+
+            # 顯示資料基本資訊
+            verbose(f"資料形狀: {df.shape}")
+
+            # 確認資料中有 LON 和 LAT 欄位
+            if 'LON' not in df.columns or 'LAT' not in df.columns:
+                print("錯誤: 資料中缺少 LON 或 LAT 欄位")
+                exit(1)
+
+            # 篩選出日期欄位 (排除經緯度欄位)，一次解析所有欄位名稱的年月
+            date_columns = df.columns.drop(['LON', 'LAT'])
+            years, months = parse_month_columns(date_columns)
+            for col in date_columns[years < 0]:
+                print(f"無法從欄位名稱 '{col}' 中提取年月資訊，跳過此欄位")
+
+            lon = df['LON'].to_numpy()
+            lat = df['LAT'].to_numpy()
+            values = df[date_columns].to_numpy()
+
+        print(f"找到 {int((years >= 0).sum())} 個日期欄位")
+
+        with stage('split'):
+            written, skipped = split_months(
+                lon, lat, years, months, values, output_folder,
+                workers=args.workers, skip_unchanged=args.skip_unchanged, log=info,
+            )
+        count('files', written)
+        count('split_station_months', len(lon) * written)
+        if args.skip_unchanged:
+            print(f"略過 {skipped} 個內容未變動的檔案")
+        print(f"已輸出 {written} 個檔案")
+        print("所有月份資料拆分完成！")
+
+    except Exception as e:
+        print(f"讀取或處理檔案時發生錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
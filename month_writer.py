@@ -0,0 +1,152 @@
+"""將 測站 × 月份 的月合計拆分為 month/rain_YYYY_MM.csv
+
+欄位名稱一次以向量化方式解析為 (年, 月)，各月資料直接由同一個 NumPy 陣列切片，
+不再為每個欄位複製與重新命名資料表。輸出以有限大小的執行緒池寫出，
+並可比對內容雜湊跳過未變動的檔案 (清單記錄各檔案寫出時的雜湊、大小與修改時間，
+修改時間不同時重新計算檔案雜湊，以修復在工具之外被改動的檔案)。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# 記錄已輸出檔案內容雜湊、大小與修改時間的清單檔名
+MANIFEST_FILE = '.manifest.json'
+
+
+def parse_month_columns(columns):
+    """將 'YYYY-MM-DD' 或 'YYYY-MM-DD 00:00:00' 格式的欄位名稱解析為 (年, 月)
+
+    回傳 年、月 兩個整數陣列；無法解析的欄位為 -1。
+    """
+    parts = pd.Index(columns, dtype=object).astype(str).str.extract(r'^(\d{4})-(\d{2})')
+    parts = parts.fillna(-1).astype(int)
+    return parts[0].to_numpy(), parts[1].to_numpy()
+
+
+def render_month_csv(lon, lat, values):
+    """產生單月 CSV 內容 (LON, LAT, RAINFALL)"""
+    month_df = pd.DataFrame({'LON': lon, 'LAT': lat, 'RAINFALL': values}, copy=False)
+    return month_df.to_csv(index=False).encode('utf-8')
+
+
+def _digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return _digest(f.read())
+
+
+def load_manifest(output_folder):
+    """讀取輸出資料夾的內容雜湊清單"""
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_folder, manifest):
+    """寫出輸出資料夾的內容雜湊清單"""
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_entry(path, digest):
+    """清單中單一檔案的紀錄: 內容雜湊與目前的大小、修改時間"""
+    stat = os.stat(path)
+    return {'sha256': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_unchanged(output_file, content, digest, manifest):
+    """檢查既有輸出檔案的內容雜湊是否與新內容相同
+
+    大小與修改時間都與清單紀錄相同時直接比對紀錄的雜湊，否則重新計算檔案的雜湊。
+    """
+    if not os.path.exists(output_file):
+        return False
+    stat = os.stat(output_file)
+    if stat.st_size != len(content):
+        return False
+    entry = manifest.get(os.path.basename(output_file))
+    if isinstance(entry, dict) and (entry.get('size'), entry.get('mtime_ns')) == (stat.st_size, stat.st_mtime_ns):
+        return entry.get('sha256') == digest
+    return _file_digest(output_file) == digest
+
+
+def _write_file(output_file, content):
+    with open(output_file, 'wb') as f:
+        f.write(content)
+
+
+def split_months(lon, lat, years, months, values, output_folder,
+                 workers=4, skip_unchanged=False, log=print):
+    """將 測站 × 月份 的 values 拆分輸出為 rain_YYYY_MM.csv
+
+    years, months 為各欄位的年、月 (-1 表示無法解析，略過)。
+    每個檔案實際寫出完成後依輸出順序以 log 記錄。
+    回傳 (寫出檔案數, 略過未變動檔案數)。
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    manifest = load_manifest(output_folder)
+    written = 0
+    skipped = 0
+
+    # 限制尚未寫出的檔案數，避免產生速度快於寫出速度時佔用過多記憶體
+    pending = threading.BoundedSemaphore(max(1, workers) * 2)
+
+    def write_and_release(output_file, content, digest):
+        try:
+            _write_file(output_file, content)
+            return manifest_entry(output_file, digest)
+        finally:
+            pending.release()
+
+    futures = deque()
+
+    def finish(name, output_file, future):
+        manifest[name] = future.result()
+        log(f"已輸出檔案: {output_file}")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for index in np.flatnonzero(years >= 0):
+            name = f'rain_{years[index]}_{months[index]:02d}.csv'
+            output_file = os.path.join(output_folder, name)
+
+            # 各月資料直接由陣列切片，不複製整個資料表
+            content = render_month_csv(lon, lat, values[:, index])
+            digest = _digest(content)
+
+            if skip_unchanged and is_unchanged(output_file, content, digest, manifest):
+                manifest[name] = manifest_entry(output_file, digest)
+                skipped += 1
+                continue
+
+            pending.acquire()
+            futures.append((name, output_file, executor.submit(write_and_release, output_file, content, digest)))
+            written += 1
+
+            # 依輸出順序記錄已寫出完成的檔案
+            while futures and futures[0][2].done():
+                finish(*futures.popleft())
+
+        while futures:
+            finish(*futures.popleft())
+
+    save_manifest(output_folder, manifest)
+    return written, skipped
@@ -0,0 +1,133 @@
+"""逐年檔案月合計結果的磁碟快取
+
+每個輸入檔案的月合計 (MonthlyBlock) 以 .npz 儲存在 result.csv 旁的快取資料夾，
+並以 路徑、檔案大小、修改時間 與 內容雜湊 判斷是否仍然有效。
+只有內容變動的年份需要重新讀取，其餘月份直接由快取合併。
+快取總大小超過上限時，依最近使用時間 (LRU) 淘汰最舊的項目。
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from rain_ingest import MonthlyBlock
+
+# 快取索引檔名
+INDEX_FILE = 'index.json'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """計算檔案內容的 SHA-256 雜湊"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MonthlyCache:
+    """以輸入檔案為單位的月合計快取"""
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.index = {}
+        index_path = os.path.join(cache_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                # 索引損毀時視為空快取
+                self.index = {}
+
+    @staticmethod
+    def _key(in_file):
+        return os.path.abspath(in_file)
+
+    def _entry_path(self, entry):
+        return os.path.join(self.cache_dir, entry['file'])
+
+    def get(self, in_file):
+        """取得檔案的月合計快取；檔案已變動或沒有快取時回傳 None"""
+        key = self._key(in_file)
+        entry = self.index.get(key)
+        if entry is None or not os.path.exists(self._entry_path(entry)):
+            self.misses += 1
+            return None
+
+        stat = os.stat(in_file)
+        if entry['size'] != stat.st_size:
+            self.misses += 1
+            return None
+
+        # 修改時間不同時以內容雜湊確認 (例如檔案被重新複製但內容未變)
+        if entry['mtime'] != stat.st_mtime_ns:
+            if entry['sha256'] != file_digest(in_file):
+                self.misses += 1
+                return None
+            entry['mtime'] = stat.st_mtime_ns
+
+        with np.load(self._entry_path(entry)) as data:
+            # 舊版快取沒有有效日數，視為失效
+            if 'counts' not in data:
+                self.misses += 1
+                return None
+            block = MonthlyBlock(
+                str(data['year']), data['lon'], data['lat'], data['months'], data['sums'],
+                data['counts'], data['days'],
+            )
+        entry['last_used'] = time.time()
+        self.hits += 1
+        return block
+
+    def put(self, in_file, block):
+        """寫入檔案的月合計快取"""
+        key = self._key(in_file)
+        stat = os.stat(in_file)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz'
+        path = os.path.join(self.cache_dir, name)
+
+        np.savez(path, year=np.str_(block.year), lon=block.lon, lat=block.lat,
+                 months=block.months, sums=block.sums, counts=block.counts, days=block.days)
+
+        self.index[key] = {
+            'file': name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'sha256': file_digest(in_file),
+            'bytes': os.path.getsize(path),
+            'last_used': time.time(),
+        }
+        self._evict()
+
+    def _evict(self):
+        """快取超過大小或數量上限時，淘汰最久未使用的項目"""
+        entries = sorted(self.index.items(), key=lambda item: item[1]['last_used'])
+        total = sum(entry['bytes'] for _, entry in entries)
+        while entries and (
+            total > self.max_bytes
+            or (self.max_entries is not None and len(entries) > self.max_entries)
+        ):
+            key, entry = entries.pop(0)
+            total -= entry['bytes']
+            del self.index[key]
+            if os.path.exists(self._entry_path(entry)):
+                os.remove(self._entry_path(entry))
+
+    def save(self):
+        """寫出快取索引"""
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, index_path)
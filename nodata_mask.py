@@ -0,0 +1,142 @@
+"""以 NumPy 將降雨柵格的 -99.9 設為無資料 (取代 SetNull + save)
+
+Raster Symbology_equal interval.py 對每個柵格執行 SetNull(..., "VALUE = -99.9") 並另存一份完整的柵格。
+此處依柵格的狀態選擇最省的做法:
+
+    tag      柵格尚未設定無資料值: 只改寫 GeoTIFF 標頭的 nodata 標籤為 -99.9，不讀寫像元
+    rewrite  柵格已有其他無資料值: 以分塊 (block window) 讀寫，將 -99.9 改為該無資料值
+    skip     柵格的無資料值已是 -99.9、沒有 -99.9 的像元，或為整數柵格
+
+指定輸出資料夾時先複製檔案再處理 (tag 只需複製)；未指定時直接更新原檔
+(rewrite 先寫入暫存檔再取代)。各檔案以執行緒池同時處理 (rasterio 讀寫時會釋放 GIL)。
+
+使用方式:
+    python nodata_mask.py raster_IDW
+    python nodata_mask.py raster_IDW --output-folder "raster_IDW/Raster Symbology" --workers 4
+"""
+import argparse
+import glob
+import os
+import shutil
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+
+# 原始資料的缺值標記 (與 SetNull "VALUE = -99.9" 相同)
+NODATA = -99.9
+
+
+def is_float_raster(path):
+    """是否為浮點數柵格 (連續數值，不需要建立屬性表)"""
+    with rasterio.open(path) as src:
+        return np.issubdtype(np.dtype(src.dtypes[0]), np.floating)
+
+
+def _rewrite_blocks(src_path, dst_path, value):
+    """以分塊讀寫將 value 改為檔案的無資料值，回傳改寫的像元數"""
+    replaced = 0
+    with rasterio.open(src_path) as src:
+        profile = src.profile
+        nodata = src.nodata
+        with rasterio.open(dst_path, 'w', **profile) as dst:
+            for band in range(1, src.count + 1):
+                for _, window in src.block_windows(band):
+                    block = src.read(band, window=window)
+                    hit = np.isclose(block, value)
+                    if hit.any():
+                        block[hit] = nodata
+                        replaced += int(hit.sum())
+                    dst.write(block, band, window=window)
+    return replaced
+
+
+def mask_nodata(raster_path, output_path=None, value=NODATA):
+    """將柵格中的 value 設為無資料，回傳採用的做法 ('tag'、'rewrite' 或 'skip')
+
+    output_path 為 None 時直接更新 raster_path。
+    """
+    with rasterio.open(raster_path) as src:
+        nodata = src.nodata
+        is_float = np.issubdtype(np.dtype(src.dtypes[0]), np.floating)
+
+    target = output_path or raster_path
+    if not is_float or (nodata is not None and np.isclose(nodata, value)):
+        if target != raster_path:
+            shutil.copyfile(raster_path, target)
+        return 'skip'
+
+    if nodata is None:
+        # 只改寫標頭，像元不變
+        if target != raster_path:
+            shutil.copyfile(raster_path, target)
+        with rasterio.open(target, 'r+') as dst:
+            dst.nodata = value
+        return 'tag'
+
+    tmp_path = target + '.tmp.tif'
+    try:
+        replaced = _rewrite_blocks(raster_path, tmp_path, value)
+        if replaced == 0:
+            os.remove(tmp_path)
+            if target != raster_path:
+                shutil.copyfile(raster_path, target)
+            return 'skip'
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return 'rewrite'
+
+
+def _mask_or_error(raster_path, output_path, value):
+    try:
+        return raster_path, mask_nodata(raster_path, output_path, value), None
+    except Exception as e:
+        traceback.print_exc()
+        return raster_path, None, e
+
+
+def mask_folder(raster_folder, output_folder=None, value=NODATA, workers=4, pattern='*.tif', log=print):
+    """以執行緒池處理資料夾中的所有柵格，回傳失敗的檔案清單"""
+    if output_folder is not None and not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    raster_files = sorted(glob.glob(os.path.join(raster_folder, pattern)))
+    log(f"找到 {len(raster_files)} 個柵格檔案")
+    args = [
+        (path, os.path.join(output_folder, os.path.basename(path)) if output_folder else None, value)
+        for path in raster_files
+    ]
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for raster_path, action, error in executor.map(lambda a: _mask_or_error(*a), args):
+            name = os.path.basename(raster_path)
+            if error is not None:
+                log(f"處理柵格 {name} 時發生錯誤: {error}")
+                failed.append(raster_path)
+            else:
+                log(f"{name}: {action}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='將柵格中的 -99.9 設為無資料 (不需 ArcGIS)')
+    parser.add_argument('raster_folder', help='柵格資料夾 (例如 raster_IDW)')
+    parser.add_argument('--output-folder', default=None, help='輸出資料夾 (預設直接更新原檔)')
+    parser.add_argument('--value', type=float, default=NODATA, help='視為無資料的數值 (預設 -99.9)')
+    parser.add_argument('--workers', type=int, default=4, help='同時處理的檔案數 (預設 4)')
+    parser.add_argument('--pattern', default='*.tif', help='柵格檔名樣式 (預設 *.tif)')
+    args = parser.parse_args()
+
+    print(f"正在處理資料夾: {args.raster_folder}")
+    failed = mask_folder(args.raster_folder, args.output_folder, args.value, args.workers, args.pattern)
+    print(f"\n無資料值設定完成 ({len(failed)} 個失敗)")
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""單一入口的增量處理流程
+
+將 result.py → month split.py → 柵格轉換 的步驟建立為以月份為單位的相依關係圖 (task_graph.TaskGraph)：
+
+    result              各年份檔案 → result.csv、result_store/ 與 station_index.npz
+    grid                完整測站集合 → grid_spec.json
+    variogram           result_store/ 的所有月份 → variogram.json (只有 --method kriging)
+    month:YYYY_MM       result_store/ 的單月切片 → month/rain_YYYY_MM.csv
+    raster:YYYY_MM      month/rain_YYYY_MM.csv + grid_spec.json (+ variogram.json) → raster_*/rain_YYYY_MM.tif
+    stats               所有月份柵格 → raster_*/rain_stats.json (raster_stats.py 的整體統計)
+    style:YYYY_MM       柵格 + 共用分界點 → raster_*/Raster Symbology/ 的分級柵格、預覽圖與圖層檔 (symbology.py)
+
+各工作以輸入內容雜湊判斷是否過期，只執行過期的工作，不同月份同時執行。
+新增一個月份的資料時，只會重新產生該月份的 CSV、柵格與圖層檔；
+其餘月份的資料切片內容不變，因此不會重新執行。
+圖層檔的指紋是共用分界點本身，新月份沒有改變整體最小值與最大值時，其他月份的圖層檔也不會重新產生。
+柵格轉換使用不需授權的 NumPy 引擎 (IDW、點轉柵格、普通克利金或薄板樣條)。
+克利金的變異圖由 result_store/ 的所有月份擬合一次並存為 variogram.json (variogram 工作)，
+只在測站座標、--variogram 模型或座標系統改變 (或指定 --refit-variogram) 時重新擬合；
+變異圖檔是克利金柵格工作的輸入，修正部分雨量值時不會讓所有月份的柵格重新產生。
+
+使用方式:
+    python pipeline.py --method idw --workers 4
+    python pipeline.py --dry-run
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from grid_spec import DEFAULT_CELL_SIZE, DEFAULT_CRS, GRID_FILE, GridSpec
+from idw import DEFAULT_NEIGHBORS, DEFAULT_POWER, idw_tile_renderer, load_or_build_plan, plan_key
+from kriging import (VARIOGRAM_FILE, VARIOGRAM_MODELS, fit_variogram, kriging_plan, load_or_fit_variogram,
+                     load_variogram, rbf_plan, variogram_key)
+from month_writer import render_month_csv
+from monthly_cache import MonthlyCache
+from point_raster import CELL_ASSIGNMENTS, rasterize, tile_renderer
+from rain_ingest import DEFAULT_MIN_COVERAGE, find_input_files, read_layout
+from rain_store import STORE_DIR, open_store, year_month
+from raster_io import LARGE_GRID_CELLS, TILE_SIZE, write_geotiff, write_tiled_geotiff
+from result import build_result
+from projection import default_cell_size, normalize_crs, project_points
+from station_index import INDEX_FILE, index_file, load_or_build_index
+from raster_stats import PARTS_FILE, STATS_FILE, compute_stats, load_stats, save_stats
+from symbology import DEFAULT_CLASSES, FORMATS, global_breaks, symbolize
+from instrument import add_arguments, configure, count, stage
+from task_graph import Task, TaskGraph
+
+# 執行狀態檔名 (存放在輸出資料夾)
+STATE_FILE = '.pipeline_state.json'
+
+# 各柵格轉換方式的輸出資料夾 (與 csv to raster_*.py 相同)
+RASTER_FOLDERS = {'idw': 'raster_IDW', 'point': 'raster_PointToRaster',
+                  'kriging': 'raster_Kriging', 'rbf': 'raster_RBF'}
+
+STORE_FILES = ('stations.npy', 'months.npy', 'rainfall.npy')
+
+
+def input_months(input_files):
+    """由各年份檔案的標題列取得所有月份 (不讀取數值)"""
+    months = set()
+    for in_file in input_files:
+        try:
+            dates = read_layout(in_file)[3]
+        except Exception:
+            # 無法解析的檔案由 result 工作回報錯誤
+            continue
+        if len(dates):
+            month = dates.astype('M8[M]')
+            months.update(np.arange(month.min(), month.max() + 1))
+    return sorted(months)
+
+
+def store_matrix(store_dir):
+    """result_store/ 的 (經度, 緯度, 測站 × 月份)，供擬合變異圖"""
+    store = open_store(store_dir)
+    return store.lon, store.lat, np.asarray(store.rainfall).T
+
+
+class StoreView:
+    """在 result 工作完成後才開啟 result_store/，供各月份工作共用"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.lock = threading.Lock()
+        self.store = None
+        self.index = None
+
+    def _open(self):
+        with self.lock:
+            if self.store is None:
+                self.store = open_store(self.store_dir)
+                self.index = {year_month(month): i for i, month in enumerate(self.store.months)}
+        return self.store
+
+    def month(self, ym):
+        """回傳單月的 (經度, 緯度, 降雨量)"""
+        store = self._open()
+        if ym not in self.index:
+            raise KeyError(f"{self.store_dir} 中沒有月份 {ym}")
+        return store.lon, store.lat, store.rainfall[self.index[ym]]
+
+    def month_digest(self, ym):
+        """單月資料切片的內容雜湊，作為月份工作的指紋"""
+        digest = hashlib.sha256()
+        for array in self.month(ym):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+
+class RasterEngine:
+    """以 NumPy 將單月 CSV 轉換為共用網格上的 GeoTIFF
+
+    網格、測站空間索引 (station_index.npz)、IDW 權重矩陣、測站像元編號、克利金變異圖
+    與克利金 / 薄板樣條的 LU 分解在各月份之間共用，只計算一次。
+    tiled 為 True 或網格超過 LARGE_GRID_CELLS 時逐區塊計算並寫出 (raster_io.write_tiled_geotiff)，
+    不建立權重矩陣與整個網格的陣列。
+    fit_source() 回傳擬合變異圖用的 (經度, 緯度, 測站 × 月份)；擬合結果存於 variogram_path。
+    """
+
+    def __init__(self, method, grid_path, plan_cache=None, power=DEFAULT_POWER,
+                 n_neighbors=DEFAULT_NEIGHBORS, radius=None, assignment='MEAN', tiled=False, index_path=None,
+                 variogram_model='spherical', smoothing=0.0, fit_source=None, variogram_path=None):
+        self.method = method
+        self.variogram_model = variogram_model
+        self.variogram_path = variogram_path
+        self.smoothing = smoothing
+        self.fit_source = fit_source
+        self.index_path = index_path
+        self.tiled = tiled
+        self.grid_path = grid_path
+        self.plan_cache = plan_cache
+        self.power = power
+        self.n_neighbors = n_neighbors
+        self.radius = radius
+        self.assignment = assignment
+        self.lock = threading.Lock()
+        self.grid = None
+        self.shared = {}
+
+    def fingerprint(self):
+        if self.method == 'idw':
+            key = repr(('idw', float(self.power), int(self.n_neighbors), self.radius))
+        elif self.method == 'kriging':
+            # 變異圖參數由 variogram_path 輸入檔的內容雜湊涵蓋
+            key = repr(('kriging', self.variogram_model))
+        elif self.method == 'rbf':
+            key = repr(('rbf', float(self.smoothing)))
+        else:
+            key = repr(('point', self.assignment))
+        # 分塊輸出的檔案格式不同 (含金字塔)，切換時需重新產生
+        return key + ' tiled' if self.tiled else key
+
+    def _grid(self):
+        with self.lock:
+            if self.grid is None:
+                self.grid = GridSpec.load(self.grid_path)
+        return self.grid
+
+    def _shared(self, key, build):
+        with self.lock:
+            if key not in self.shared:
+                self.shared[key] = build()
+            return self.shared[key]
+
+    def _index(self, lon, lat):
+        grid = self._grid()
+        return self._shared((lon.tobytes(), lat.tobytes()),
+                            lambda: load_or_build_index(self.index_path, lon, lat, grid.crs)[0])
+
+    def update_variogram(self, refit=False):
+        """測站座標、模型或座標系統改變 (或 refit) 時以所有月份重新擬合變異圖，否則沿用存檔"""
+        lon, lat, z = self.fit_source()
+        index = self._index(lon, lat)
+        key = variogram_key(index.key, self.variogram_model, self._grid().crs)
+        variogram, from_file = load_or_fit_variogram(
+            self.variogram_path, key, lambda: fit_variogram(index.x, index.y, z, self.variogram_model), refit)
+        with self.lock:
+            self.shared['variogram'] = variogram
+        print(f"{'沿用' if from_file else '已擬合'}變異圖: {self.variogram_path}")
+
+    def variogram(self):
+        """variogram 工作存出的變異圖 (座標與網格相同)；只讀取一次"""
+        return self._shared('variogram', lambda: load_variogram(self.variogram_path)[0])
+
+    def _kernel_plan(self, index, grid):
+        """克利金或薄板樣條的內插物件；LU 分解在各月份之間共用"""
+        if self.method == 'kriging':
+            variogram = self.variogram()
+            return self._shared(('kriging', index.key, variogram),
+                                lambda: kriging_plan(index.x, index.y, grid, variogram, TILE_SIZE))
+        return self._shared(('rbf', index.key),
+                            lambda: rbf_plan(index.x, index.y, grid, self.smoothing, TILE_SIZE))
+
+    def render(self, month_csv, raster_output):
+        with stage('load', file=os.path.basename(month_csv)):
+            df = pd.read_csv(month_csv)
+        lon = df['LON'].to_numpy(dtype=np.float64)
+        lat = df['LAT'].to_numpy(dtype=np.float64)
+        rainfall = df['RAINFALL'].to_numpy(dtype=np.float64)
+        grid = self._grid()
+        index = self._index(lon, lat)
+        count('station_months', len(df))
+        count('cells', grid.n_cells)
+
+        if self.tiled or grid.n_cells > LARGE_GRID_CELLS:
+            if self.method == 'idw':
+                render = idw_tile_renderer(lon, lat, rainfall, grid, self.power, self.n_neighbors, self.radius,
+                                           index)
+            elif self.method in ('kriging', 'rbf'):
+                render = self._kernel_plan(index, grid).tile_renderer(rainfall)
+            else:
+                render = tile_renderer(index.cells(grid), rainfall, grid, TILE_SIZE, self.assignment)
+            with stage('interpolate_write_tiled', file=os.path.basename(raster_output)):
+                write_tiled_geotiff(raster_output, grid, render)
+            return
+
+        with stage('interpolate', file=os.path.basename(raster_output)):
+            if self.method == 'idw':
+                key = plan_key(lon, lat, grid, self.power, self.n_neighbors, self.radius)
+                plan = self._shared(key, lambda: load_or_build_plan(
+                    self.plan_cache, lon, lat, grid, self.power, self.n_neighbors, self.radius, index=index)[0])
+                out = plan.interpolate(rainfall)
+            elif self.method in ('kriging', 'rbf'):
+                out = self._kernel_plan(index, grid).interpolate(rainfall)
+            else:
+                out = rasterize(index.cells(grid), rainfall, grid.n_rows, grid.n_cols, self.assignment)
+        with stage('write', file=os.path.basename(raster_output)):
+            write_geotiff(raster_output, out, grid)
+
+
+def _write_bytes(path, content):
+    """先寫入暫存檔再取代，避免中斷時留下不完整的輸出"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build_graph(input_files, output_folder='.', method='idw', ingest_workers=1, chunk_rows=None,
+                cell_size=DEFAULT_CELL_SIZE, bbox=None, power=DEFAULT_POWER,
+                n_neighbors=DEFAULT_NEIGHBORS, radius=None, assignment='MEAN',
+                symbology='equal', n_classes=DEFAULT_CLASSES, scope='global',
+                min_coverage=DEFAULT_MIN_COVERAGE, tiled=False, crs=DEFAULT_CRS,
+                variogram_model='spherical', smoothing=0.0, refit_variogram=False):
+    """建立整個處理流程的相依關係圖；symbology 為 None 時不產生圖層檔
+
+    scope 為 global 時所有月份共用依整體統計計算的分界點；file 時各月份各自分級。
+    crs 為網格的座標系統；公尺座標系統 (例如 EPSG:3826) 時 cell_size 與 bbox 以公尺表示。
+    """
+    graph = TaskGraph(os.path.join(output_folder, STATE_FILE))
+
+    store_dir = os.path.join(output_folder, STORE_DIR)
+    store_files = [os.path.join(store_dir, name) for name in STORE_FILES]
+    result_csv = os.path.join(output_folder, 'result.csv')
+    index_path = os.path.join(output_folder, INDEX_FILE)
+    grid_path = os.path.join(output_folder, GRID_FILE)
+    variogram_path = os.path.join(output_folder, VARIOGRAM_FILE)
+    month_folder = os.path.join(output_folder, 'month')
+    raster_folder = os.path.join(output_folder, RASTER_FOLDERS[method])
+    style_folder = os.path.join(raster_folder, "Raster Symbology")
+    for folder in (month_folder, raster_folder, style_folder):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def run_result():
+        cache = MonthlyCache(os.path.join(output_folder, '.result_cache'))
+        failed = build_result(input_files, output_folder, ingest_workers, cache, chunk_rows, 'both',
+                              min_coverage)
+        if failed:
+            raise RuntimeError(f"{len(failed)} 個年份檔案讀取失敗")
+
+    graph.add(Task('result', run_result, inputs=input_files,
+                   outputs=[result_csv, *store_files, index_path], fingerprint=repr(('result', float(min_coverage)))))
+
+    def run_grid():
+        if bbox is not None:
+            grid = GridSpec.from_bbox(*bbox, cell_size=cell_size, crs=crs)
+        else:
+            store = open_store(store_dir)
+            grid = GridSpec.from_points(*project_points(store.lon, store.lat, crs), cell_size, crs)
+        grid.save(grid_path, bbox)
+
+    graph.add(Task('grid', run_grid, inputs=[store_files[0]], outputs=[grid_path],
+                   deps=['result'], fingerprint=repr((float(cell_size), bbox, crs))))
+
+    store = StoreView(store_dir)
+    engine = RasterEngine(method, grid_path, os.path.join(raster_folder, '.idw_plan'),
+                          power, n_neighbors, radius, assignment, tiled,
+                          os.path.join(output_folder, index_file(crs)), variogram_model, smoothing,
+                          lambda: store_matrix(store_dir), variogram_path)
+    raster_inputs = [grid_path]
+    if method == 'kriging':
+        # 指定 --refit-variogram 時指紋每次不同，variogram 工作一定會執行
+        refit_token = time.time_ns() if refit_variogram else None
+        graph.add(Task('variogram', lambda: engine.update_variogram(refit_variogram),
+                       inputs=[store_files[0], grid_path], outputs=[variogram_path], deps=['result', 'grid'],
+                       fingerprint=repr(('variogram', variogram_model, refit_token))))
+        raster_inputs.append(variogram_path)
+
+    stats_path = os.path.join(raster_folder, STATS_FILE)
+    parts_path = os.path.join(raster_folder, PARTS_FILE)
+    months = [year_month(month) for month in input_months(input_files)]
+    raster_outputs = [os.path.join(raster_folder, f'rain_{ym}.tif') for ym in months]
+
+    def shared_breaks():
+        return global_breaks(load_stats(stats_path), symbology, n_classes)
+
+    if symbology and scope == 'global':
+        # 各柵格的直方圖快取在 parts_path，只重新掃描變動的柵格
+        graph.add(Task('stats', lambda: save_stats(stats_path, compute_stats(raster_outputs, parts_path=parts_path)),
+                       inputs=raster_outputs, outputs=[stats_path],
+                       deps=[f'raster:{ym}' for ym in months], fingerprint='stats'))
+
+    for ym in months:
+        month_csv = os.path.join(month_folder, f'rain_{ym}.csv')
+        raster_output = os.path.join(raster_folder, f'rain_{ym}.tif')
+
+        def run_month(ym=ym, month_csv=month_csv):
+            _write_bytes(month_csv, render_month_csv(*store.month(ym)))
+
+        graph.add(Task(f'month:{ym}', run_month, outputs=[month_csv], deps=['result'],
+                       fingerprint=lambda ym=ym: store.month_digest(ym)))
+        graph.add(Task(f'raster:{ym}', lambda month_csv=month_csv, raster_output=raster_output:
+                       engine.render(month_csv, raster_output),
+                       inputs=[month_csv, *raster_inputs], outputs=[raster_output],
+                       deps=[f'month:{ym}', 'grid', *(['variogram'] if method == 'kriging' else [])],
+                       fingerprint=engine.fingerprint))
+
+        if symbology:
+            style_base = os.path.join(style_folder, f'rain_{ym}')
+            style_outputs = [f'{style_base}.{ext}' for ext in FORMATS]
+            if scope == 'global':
+                graph.add(Task(f'style:{ym}', lambda raster_output=raster_output:
+                               symbolize(raster_output, style_folder, symbology, n_classes,
+                                         FORMATS, *shared_breaks()),
+                               inputs=[raster_output], outputs=style_outputs,
+                               deps=[f'raster:{ym}', 'stats'],
+                               fingerprint=lambda: repr((symbology, n_classes, shared_breaks()))))
+            else:
+                graph.add(Task(f'style:{ym}', lambda raster_output=raster_output:
+                               symbolize(raster_output, style_folder, symbology, n_classes),
+                               inputs=[raster_output], outputs=style_outputs,
+                               deps=[f'raster:{ym}'], fingerprint=repr((symbology, n_classes))))
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以相依關係圖增量執行 result → 月份 CSV → 柵格 的處理流程')
+    parser.add_argument('--input-folder', default='../ClimateData/', help='各年份觀測資料的資料夾')
+    parser.add_argument('--pattern', default='觀測_日資料_宜蘭縣_降雨量_*.csv', help='年份檔案的檔名格式')
+    parser.add_argument('--output-folder', default='.', help='輸出資料夾 (預設目前目錄)')
+    parser.add_argument('--method', choices=sorted(RASTER_FOLDERS), default='idw',
+                        help='柵格轉換方式: idw、point (點轉柵格)、kriging (普通克利金) 或 rbf (薄板樣條)')
+    parser.add_argument('--workers', type=int, default=4, help='同時執行的月份工作數 (預設 4)')
+    parser.add_argument('--ingest-workers', type=int, default=1, help='讀取年份檔案的行程數')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='以串流模式讀取年份檔案')
+    parser.add_argument('--min-coverage', type=float, default=DEFAULT_MIN_COVERAGE,
+                        help='月合計有效所需的有效日數比例 (預設 0: 至少 1 個有效日)')
+    parser.add_argument('--cell-size', type=float, default=None,
+                        help='柵格大小 (預設 0.0083 度；公尺座標系統預設 1000)')
+    parser.add_argument('--crs', type=normalize_crs, default=DEFAULT_CRS,
+                        help='網格的座標系統 (預設 EPSG:4326；EPSG:3826 為 TWD97 公尺座標)')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                        default=None, help='以指定範圍建立網格')
+    parser.add_argument('--power', type=float, default=DEFAULT_POWER, help='IDW 次方')
+    parser.add_argument('--neighbors', type=int, default=DEFAULT_NEIGHBORS, help='IDW 搜尋的鄰近測站數')
+    parser.add_argument('--radius', type=float, default=None, help='IDW 最大搜尋距離 (與網格座標同單位)')
+    parser.add_argument('--variogram', choices=VARIOGRAM_MODELS, default='spherical',
+                        help='克利金的變異圖模型 (由所有月份擬合)')
+    parser.add_argument('--refit-variogram', action='store_true',
+                        help='重新擬合克利金的變異圖 (預設沿用 variogram.json，只在測站或模型改變時重新擬合)')
+    parser.add_argument('--smoothing', type=float, default=0.0, help='薄板樣條的平滑參數')
+    parser.add_argument('--assignment', choices=CELL_ASSIGNMENTS, default='MEAN', help='點轉柵格的像元指定方式')
+    parser.add_argument('--tiled', action='store_true',
+                        help='逐區塊計算並寫入分塊、含金字塔的 GeoTIFF (網格很大時自動啟用)')
+    parser.add_argument('--symbology', choices=['equal', 'quantile', 'manual', 'none'], default='equal',
+                        help='圖層檔的分級方式 (none 為不產生)')
+    parser.add_argument('--symbology-scope', choices=['global', 'file'], default='global',
+                        help='global: 所有月份共用分界點 (預設)；file: 各月份各自分級')
+    parser.add_argument('--classes', type=int, default=DEFAULT_CLASSES, help='等間隔分級的類別數')
+    parser.add_argument('--force', action='store_true', help='忽略執行狀態，重新執行所有工作')
+    parser.add_argument('--dry-run', action='store_true', help='只列出會執行的工作')
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    input_files = find_input_files(args.input_folder, args.pattern)
+    if len(input_files) == 0:
+        print(f"錯誤: 在 '{args.input_folder}' 中找不到符合 '{args.pattern}' 的檔案")
+        exit(1)
+    print(f"找到 {len(input_files)} 個年份檔案")
+
+    cell_size = args.cell_size if args.cell_size is not None else default_cell_size(args.crs, DEFAULT_CELL_SIZE)
+    graph = build_graph(
+        input_files, args.output_folder, args.method, args.ingest_workers, args.chunk_rows,
+        cell_size, args.bbox, args.power, args.neighbors, args.radius, args.assignment,
+        None if args.symbology == 'none' else args.symbology, args.classes, args.symbology_scope,
+        args.min_coverage, args.tiled, args.crs, args.variogram, args.smoothing, args.refit_variogram,
+    )
+    ran, skipped, failed = graph.run(args.workers, force=args.force, dry_run=args.dry_run)
+
+    action = '將執行' if args.dry_run else '已執行'
+    print(f"\n{action} {len(ran)} 個工作，略過 {len(skipped)} 個未過期的工作，失敗 {len(failed)} 個")
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""以 NumPy 結構化陣列一次建立點特徵類別
+
+取代 CreateFeatureclass + AddField + 逐點 InsertCursor 的寫法：
+直接由 DataFrame 欄位填入 ("XY", "<f8", 2) 結構化陣列 (不經過 Python tuple)，
+再以 arcpy.da.NumPyArrayToFeatureClass 一次寫出。
+實際寫出透過 backend 物件進行，可在沒有 arcpy 的環境以 MemoryPointBackend 測試與效能測試。
+"""
+import numpy as np
+
+
+def point_dtype(value_field='RAINFALL'):
+    """點特徵類別的結構化陣列型別"""
+    return np.dtype([("XY", "<f8", 2), (value_field, "<f8")])
+
+
+def point_array(df, value_field, out_field='RAINFALL', lon_field='LON', lat_field='LAT'):
+    """由 DataFrame 欄位直接建立點的結構化陣列"""
+    array = np.empty(len(df), dtype=point_dtype(out_field))
+    array['XY'][:, 0] = df[lon_field].to_numpy(dtype=np.float64)
+    array['XY'][:, 1] = df[lat_field].to_numpy(dtype=np.float64)
+    array[out_field] = df[value_field].to_numpy(dtype=np.float64)
+    return array
+
+
+class PointBackend:
+    """寫出點特徵類別的介面"""
+
+    def exists(self, out_fc):
+        raise NotImplementedError
+
+    def delete(self, out_fc):
+        raise NotImplementedError
+
+    def write(self, array, out_fc, spatial_ref):
+        raise NotImplementedError
+
+
+class ArcpyPointBackend(PointBackend):
+    """以 arcpy.da.NumPyArrayToFeatureClass 寫出"""
+
+    def __init__(self):
+        import arcpy
+        self.arcpy = arcpy
+
+    def exists(self, out_fc):
+        return self.arcpy.Exists(out_fc)
+
+    def delete(self, out_fc):
+        self.arcpy.Delete_management(out_fc)
+
+    def write(self, array, out_fc, spatial_ref):
+        self.arcpy.da.NumPyArrayToFeatureClass(array, out_fc, ["XY"], spatial_ref)
+
+
+class MemoryPointBackend(PointBackend):
+    """將寫出的陣列保存在字典中，供沒有 arcpy 的環境測試使用"""
+
+    def __init__(self):
+        self.feature_classes = {}
+
+    def exists(self, out_fc):
+        return out_fc in self.feature_classes
+
+    def delete(self, out_fc):
+        del self.feature_classes[out_fc]
+
+    def write(self, array, out_fc, spatial_ref):
+        self.feature_classes[out_fc] = (array.copy(), spatial_ref)
+
+
+def load_points(backend, df, out_fc, spatial_ref, value_field, out_field='RAINFALL'):
+    """建立點特徵類別 (已存在時先刪除)，回傳寫出的結構化陣列
+
+    數值為 NaN (缺值) 的測站不建立點，插值與轉換時不會被當成降雨量。
+    """
+    array = point_array(df, value_field, out_field)
+    array = array[~np.isnan(array[out_field])]
+    if backend.exists(out_fc):
+        print(f'刪除已存在的特徵類別: {out_fc}')
+        backend.delete(out_fc)
+    backend.write(array, out_fc, spatial_ref)
+    return array
@@ -0,0 +1,111 @@
+"""以 NumPy 將點資料直接轉換為網格 (取代 arcpy.conversion.PointToRaster)
+
+經緯度先以 GridSpec.cell_index() (或共用的 StationIndex.cells()) 轉換為像元編號，再以 np.bincount / ufunc.at 依 cell_assignment 彙整落在同一像元的點。
+同一組測站的像元編號只需計算一次，多個月份 (點 × 月份) 可在一次向量化呼叫中完成。
+大範圍網格以 tile_renderer() 逐區塊彙整，每個區塊只處理落在其中的點。
+"""
+import numpy as np
+
+# 與 PointToRaster 相同的像元指定方式
+CELL_ASSIGNMENTS = ('MEAN', 'MAXIMUM', 'MINIMUM', 'SUM', 'COUNT', 'MOST_FREQUENT')
+
+
+def _most_frequent(keys, values, n_keys):
+    """各 key 中出現次數最多的值；次數相同時取較小的值"""
+    result = np.full(n_keys, np.nan)
+    if len(keys) == 0:
+        return result
+
+    order = np.lexsort((values, keys))
+    keys = keys[order]
+    values = values[order]
+
+    # 相同 (key, value) 的連續區段
+    starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (values[1:] != values[:-1])])
+    counts = np.diff(np.r_[starts, len(keys)])
+    run_keys = keys[starts]
+    run_values = values[starts]
+
+    # 每個 key 取次數最多 (次數相同取最小值) 的區段
+    best = np.lexsort((run_values, -counts, run_keys))
+    first = np.r_[True, run_keys[best][1:] != run_keys[best][:-1]]
+    result[run_keys[best][first]] = run_values[best][first]
+    return result
+
+
+def rasterize(cells, values, n_rows, n_cols, assignment='MEAN'):
+    """依像元編號彙整點的值
+
+    cells 為 GridSpec.cell_index() 的結果；values 為 (點,) 或 (點 × 月份)。
+    回傳 (n_rows, n_cols) 或 (月份, n_rows, n_cols) 的 float32 陣列，沒有點的像元為 NaN。
+    值為 NaN 的點不列入計算。
+    """
+    assignment = assignment.upper()
+    if assignment not in CELL_ASSIGNMENTS:
+        raise ValueError(f"不支援的像元指定方式: {assignment}")
+
+    values = np.asarray(values, dtype=np.float64)
+    single = values.ndim == 1
+    if single:
+        values = values[:, None]
+    n_points, n_months = values.shape
+    n_cells = n_rows * n_cols
+
+    # 每個月份使用獨立的像元編號區段，讓所有月份在一次呼叫中彙整
+    keys = (np.arange(n_months) * n_cells)[None, :] + np.asarray(cells)[:, None]
+    valid = (np.asarray(cells)[:, None] >= 0) & ~np.isnan(values)
+    keys = keys[valid]
+    vals = values[valid]
+    size = n_cells * n_months
+
+    count = np.bincount(keys, minlength=size).astype(np.float64)
+    if assignment == 'COUNT':
+        result = count
+    elif assignment in ('SUM', 'MEAN'):
+        total = np.bincount(keys, weights=vals, minlength=size)
+        if assignment == 'SUM':
+            result = total
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = total / count
+    elif assignment == 'MAXIMUM':
+        result = np.full(size, -np.inf)
+        np.maximum.at(result, keys, vals)
+    elif assignment == 'MINIMUM':
+        result = np.full(size, np.inf)
+        np.minimum.at(result, keys, vals)
+    else:
+        result = _most_frequent(keys, vals, size)
+
+    # 沒有任何點的像元為 NaN (COUNT 亦同，與 PointToRaster 的 NoData 一致)
+    result[count == 0] = np.nan
+    result = result.astype(np.float32).reshape(n_months, n_rows, n_cols)
+    return result[0] if single else result
+
+
+def tile_renderer(cells, values, grid, tile_size, assignment='MEAN'):
+    """回傳逐區塊彙整點值的函式 render(row0, row1, col0, col1) → float32 區塊
+
+    點依所在區塊排序一次，每個區塊只取出落在其中的點呼叫 rasterize()，
+    供 raster_io.write_tiled_geotiff() 使用；區塊範圍需與 grid.tiles(tile_size) 相同。
+    """
+    cells = np.asarray(cells)
+    values = np.asarray(values, dtype=np.float64)
+    inside = cells >= 0
+    cells = cells[inside]
+    values = values[inside]
+
+    rows = cells // grid.n_cols
+    cols = cells % grid.n_cols
+    n_tile_cols = -(-grid.n_cols // tile_size)
+    tile_key = (rows // tile_size) * n_tile_cols + cols // tile_size
+    order = np.argsort(tile_key, kind='stable')
+    tile_key, rows, cols, values = tile_key[order], rows[order], cols[order], values[order]
+
+    def render(row0, row1, col0, col1):
+        key = (row0 // tile_size) * n_tile_cols + col0 // tile_size
+        start, stop = np.searchsorted(tile_key, [key, key + 1])
+        local = (rows[start:stop] - row0) * (col1 - col0) + (cols[start:stop] - col0)
+        return rasterize(local, values[start:stop], row1 - row0, col1 - col0, assignment)
+
+    return render
@@ -0,0 +1,116 @@
+"""測站座標的投影轉換 (WGS 1984 經緯度 → 公尺座標，例如 TWD97 / EPSG:3826)
+
+在台灣的緯度，經度 1 度約 102 公里、緯度 1 度約 111 公里，直接以經緯度計算 IDW 距離會有方向性偏差。
+測站座標只需在建立空間索引時以向量化方式轉換一次 (station_index.py)，網格也以公尺定義，
+內插時直接使用平面距離。
+
+轉換優先使用 pyproj；未安裝時 TWD97 TM2 (EPSG:3826、EPSG:3825) 以 NumPy 的橫麥卡托公式計算，
+其他座標系統則使用 rasterio (GDAL) 轉換。
+"""
+import numpy as np
+
+# 原始測站座標的空間參考: WGS 1984
+WGS84 = 'EPSG:4326'
+
+# TWD97 TM2 (台灣本島，中央經線 121 度)
+TWD97 = 'EPSG:3826'
+
+# 公尺座標系統的預設像元大小 (1 公里)
+DEFAULT_METRIC_CELL_SIZE = 1000.0
+
+# GRS80 橢球
+GRS80_A = 6378137.0
+GRS80_F = 1 / 298.257222101
+
+# TWD97 TM2 的 (中央經線, 尺度因子, 東偏移, 北偏移)；WGS 1984 與 TWD97 的差異在公分等級，視為相同
+TM_PARAMS = {
+    'EPSG:3826': (121.0, 0.9999, 250000.0, 0.0),
+    'EPSG:3825': (119.0, 0.9999, 250000.0, 0.0),
+}
+
+
+def normalize_crs(crs):
+    """'epsg:3826'、3826 等寫法統一為 'EPSG:3826'"""
+    if isinstance(crs, int) or str(crs).isdigit():
+        return f'EPSG:{int(crs)}'
+    crs = str(crs).strip()
+    if crs.upper().startswith('EPSG:'):
+        return 'EPSG:' + crs[5:]
+    return crs
+
+
+def epsg_code(crs):
+    """EPSG 代碼 (供 arcpy.SpatialReference 使用)"""
+    crs = normalize_crs(crs)
+    if not crs.startswith('EPSG:'):
+        raise ValueError(f"只支援 EPSG 代碼表示的空間參考: {crs}")
+    return int(crs[5:])
+
+
+def is_geographic(crs):
+    """是否為經緯度座標系統"""
+    crs = normalize_crs(crs)
+    if crs == WGS84:
+        return True
+    if crs in TM_PARAMS:
+        return False
+    try:
+        from pyproj import CRS
+        return CRS.from_user_input(crs).is_geographic
+    except ImportError:
+        from rasterio.crs import CRS
+        return CRS.from_user_input(crs).is_geographic
+
+
+def default_cell_size(crs, geographic_cell_size):
+    """座標系統對應的預設像元大小: 經緯度使用 geographic_cell_size，公尺座標為 1 公里"""
+    return geographic_cell_size if is_geographic(crs) else DEFAULT_METRIC_CELL_SIZE
+
+
+def tm_forward(lon, lat, lon0, k0, false_easting, false_northing, a=GRS80_A, f=GRS80_F):
+    """橫麥卡托投影 (Krüger 級數，在中央經線 ±3 度內誤差小於 1 毫米)"""
+    n = f / (2 - f)
+    big_a = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    alpha = (n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16,
+             13 * n ** 2 / 48 - 3 * n ** 3 / 5,
+             61 * n ** 3 / 240)
+
+    phi = np.radians(lat)
+    dlam = np.radians(np.asarray(lon, dtype=np.float64) - lon0)
+    c = 2 * np.sqrt(n) / (1 + n)
+    t = np.sinh(np.arctanh(np.sin(phi)) - c * np.arctanh(c * np.sin(phi)))
+    xi = np.arctan2(t, np.cos(dlam))
+    eta = np.arctanh(np.sin(dlam) / np.sqrt(1 + t ** 2))
+
+    x = eta.copy()
+    y = xi.copy()
+    for j, alpha_j in enumerate(alpha, start=1):
+        x += alpha_j * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        y += alpha_j * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+    return false_easting + k0 * big_a * x, false_northing + k0 * big_a * y
+
+
+def project_points(lon, lat, dst_crs, src_crs=WGS84):
+    """將座標由 src_crs 轉換為 dst_crs，回傳 (x, y) float64 陣列；座標系統相同時直接回傳"""
+    x = np.asarray(lon, dtype=np.float64)
+    y = np.asarray(lat, dtype=np.float64)
+    src_crs = normalize_crs(src_crs)
+    dst_crs = normalize_crs(dst_crs)
+    if src_crs == dst_crs:
+        return x, y
+
+    try:
+        from pyproj import Transformer
+    except ImportError:
+        Transformer = None
+    if Transformer is not None:
+        transformer = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+        px, py = transformer.transform(x, y)
+        return np.asarray(px, dtype=np.float64), np.asarray(py, dtype=np.float64)
+
+    if src_crs == WGS84 and dst_crs in TM_PARAMS:
+        return tm_forward(x, y, *TM_PARAMS[dst_crs])
+
+    from rasterio.warp import transform
+    px, py = transform(src_crs, dst_crs, x.ravel(), y.ravel())
+    return np.reshape(px, x.shape), np.reshape(py, y.shape)
@@ -0,0 +1,335 @@
+"""逐年觀測資料的向量化讀取與月合計引擎
+
+將 觀測_日資料_*_降雨量_YYYY.csv 的寬格式資料 (每列一個測站、每欄一天)
+直接讀成 測站 × 日 的 float32 陣列，再以 np.bincount 依 (測站, 月份) 代碼
+計算每月合計，不再需要 iterrows 與轉置。代碼依列分塊產生，
+不建立整個檔案的 (station, date, value) 長格式複本，記憶體峰值約為數值陣列本身。
+
+-99.9 與空值為缺值。月合計同時記錄每個 測站 × 月份 的有效日數，
+合併時依最低涵蓋率 (min_coverage) 判斷：有效日數不足的月份為 NaN，
+整月降雨為 0 的月份保留 0。NaN 一路傳到 result.csv (空白欄位) 與柵格 (無資料)。
+
+非常大的檔案可改用 ingest_file_streaming()：依列 (測站) 分塊讀取 float32 數值，
+逐塊累加到預先配置的 測站 × 月份 陣列，記憶體用量只與分塊大小有關。
+"""
+import csv
+import glob
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from instrument import stage
+
+# 缺值標記
+NODATA = -99.9
+
+# 日期欄位格式: YYYYMMDD
+DATE_COLUMN_PATTERN = r'\d{8}'
+
+# 串流讀取時每塊的測站數
+DEFAULT_CHUNK_ROWS = 256
+
+# 整檔讀取時，每次以 bincount 計算月合計的測站數 (限制代碼與權重暫存陣列的大小)
+BINCOUNT_BLOCK_ROWS = 1024
+
+# 月合計有效所需的最低涵蓋率 (有效日數 / 該月日數)；至少需要 1 個有效日
+DEFAULT_MIN_COVERAGE = 0.0
+
+# 單一年份檔案的月合計結果
+# lon, lat: 各測站經緯度 (float64)
+# months: 月份 (datetime64[M])
+# sums: 測站 × 月份的有效日合計 (float32)，沒有任何有效日為 NaN
+# counts: 測站 × 月份的有效日數 (uint8)
+# days: 各月份在檔案中的日數 (int16)
+MonthlyBlock = namedtuple('MonthlyBlock', ['year', 'lon', 'lat', 'months', 'sums', 'counts', 'days'])
+
+
+def parse_year(in_file):
+    """從檔名取得年份"""
+    year_match = re.search(r'(\d{4})\.csv$', in_file)
+    if year_match:
+        return year_match.group(1)
+
+    # 嘗試從檔名中提取年份
+    year_match = re.search(r'_(\d{4})', in_file)
+    if year_match:
+        return year_match.group(1)
+    return "unknown"
+
+
+def read_header(in_file):
+    """讀取檔案第一列的欄位名稱"""
+    with open(in_file, encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f))
+
+
+def read_value_block(in_file, usecols, dtype=np.float64):
+    """以 np.loadtxt 讀取指定的數值欄位；遇到空白欄位時改用 pandas 讀取"""
+    try:
+        return np.loadtxt(in_file, delimiter=',', skiprows=1, usecols=usecols, dtype=dtype,
+                          ndmin=2, encoding='utf-8-sig')
+    except ValueError:
+        df = pd.read_csv(in_file, index_col=False, header=None, skiprows=1, usecols=usecols,
+                         dtype={i: dtype for i in usecols})
+        return df[list(usecols)].to_numpy(dtype=dtype)
+
+
+def read_layout(in_file):
+    """由欄位名稱取得 LON、LAT 與日期欄位的位置，以及各日期欄位的日期"""
+    # 有些欄位名稱有空白符號，以去除空白後的名稱判斷
+    names = pd.Index(read_header(in_file)).str.strip()
+    if 'LON' not in names or 'LAT' not in names:
+        raise KeyError("無法找到 LON 或 LAT 欄位，請檢查資料格式")
+
+    date_idx = np.flatnonzero(names.str.fullmatch(DATE_COLUMN_PATTERN))
+
+    # 將 YYYYMMDD 欄位名稱一次轉換為日期
+    dates = pd.to_datetime(names[date_idx], format='%Y%m%d').to_numpy().astype('M8[D]')
+    return names.get_loc('LON'), names.get_loc('LAT'), date_idx, dates
+
+
+def read_daily_file(in_file):
+    """讀取單一年份的寬格式檔案，回傳經緯度、各日期欄位的日期與 測站 × 日 的 float32 數值
+
+    經緯度與日期欄位分開讀取：日期欄位直接以 float32 讀取 (空白欄位為 NaN)，
+    不先建立 float64 的整檔陣列。
+    """
+    lon_idx, lat_idx, date_idx, dates = read_layout(in_file)
+    coords = read_value_block(in_file, [lon_idx, lat_idx])
+    values = read_value_block(in_file, list(date_idx), np.float32)
+    return coords[:, 0].copy(), coords[:, 1].copy(), dates, values
+
+
+def is_valid(values):
+    """有效觀測值 (非空值且非 -99.9)"""
+    return ~np.isnan(values) & (values != np.float32(NODATA))
+
+
+def _finish_sums(sums, counts):
+    """四捨五入並轉為 float32；沒有任何有效日的月份為 NaN
+
+    觀測值為 0.1 mm 精度，先四捨五入消除 float32 累加誤差再轉回 float32。
+    """
+    sums = np.round(sums, 3).astype(np.float32)
+    sums[counts == 0] = np.nan
+    return sums
+
+
+def monthly_sums(values, dates, block_rows=BINCOUNT_BLOCK_ROWS):
+    """以 bincount 依 (測站, 月份) 代碼計算月合計與有效日數
+
+    values 為 測站 × 日 的 float32 數值，dates 為各欄的日期。
+    每次只為 block_rows 個測站產生代碼，暫存陣列不隨檔案大小增加。
+    回傳月份 (datetime64[M])、測站 × 月份 的 float32 月合計、uint8 有效日數與各月份日數。
+    -99.9 與空值視為缺值，不列入合計與有效日數。
+    """
+    month = dates.astype('M8[M]')
+    first = month.min()
+    codes = (month - first).astype(np.int64)
+    n_months = int(codes.max()) + 1
+
+    n_stations = len(values)
+    sums = np.empty((n_stations, n_months))
+    counts = np.empty((n_stations, n_months), dtype=np.uint8)
+
+    for start in range(0, n_stations, block_rows):
+        block = values[start:start + block_rows]
+        n = len(block)
+        valid = is_valid(block)
+        index = (np.arange(n, dtype=np.int64)[:, None] * n_months + codes)[valid]
+        size = n * n_months
+
+        sums[start:start + n] = np.bincount(index, weights=block[valid],
+                                            minlength=size).reshape(n, n_months)
+        counts[start:start + n] = np.bincount(index, minlength=size).reshape(n, n_months)
+
+    sums = _finish_sums(sums, counts)
+
+    # 各月份的日數 (每個測站的日期欄位相同，以日期欄位計算)
+    days = np.bincount(codes, minlength=n_months).astype(np.int16)
+
+    months = first + np.arange(n_months)
+    return months, sums, counts, days
+
+
+def ingest_file(in_file):
+    """讀取單一年份檔案並計算月合計"""
+    name = os.path.basename(in_file)
+    with stage('parse_csv', file=name):
+        lon, lat, dates, values = read_daily_file(in_file)
+    with stage('monthly_sums', file=name):
+        months, sums, counts, days = monthly_sums(values, dates)
+    return MonthlyBlock(parse_year(in_file), lon, lat, months, sums, counts, days)
+
+
+def count_rows(in_file):
+    """計算資料列數 (不含標題列)，不將檔案讀入記憶體"""
+    with open(in_file, 'rb') as f:
+        n_lines = sum(1 for line in f if line.strip())
+    return max(n_lines - 1, 0)
+
+
+def ingest_file_streaming(in_file, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """依列分塊讀取單一年份檔案並計算月合計，結果與 ingest_file() 相同
+
+    每塊只有 chunk_rows 個測站的 float32 數值，月合計直接累加到預先配置的
+    測站 × 月份 陣列，不建立整個檔案的長格式陣列。
+    """
+    lon_idx, lat_idx, date_idx, dates = read_layout(in_file)
+    n_stations = count_rows(in_file)
+
+    month = dates.astype('M8[M]')
+    first = month.min()
+    codes = (month - first).astype(np.int64)
+    n_months = int(codes.max()) + 1
+
+    # 日 × 月 的指示矩陣: 每塊的月合計為一次矩陣乘積
+    day_to_month = np.zeros((len(dates), n_months))
+    day_to_month[np.arange(len(dates)), codes] = 1.0
+
+    lon = np.empty(n_stations)
+    lat = np.empty(n_stations)
+    sums = np.empty((n_stations, n_months))
+    counts = np.empty((n_stations, n_months), dtype=np.uint8)
+
+    dtype = {i: np.float32 for i in date_idx}
+    dtype.update({lon_idx: np.float64, lat_idx: np.float64})
+    reader = pd.read_csv(in_file, header=None, skiprows=1, usecols=[lon_idx, lat_idx, *date_idx],
+                         dtype=dtype, chunksize=chunk_rows, encoding='utf-8-sig')
+
+    start = 0
+    for chunk in reader:
+        stop = start + len(chunk)
+        lon[start:stop] = chunk[lon_idx].to_numpy()
+        lat[start:stop] = chunk[lat_idx].to_numpy()
+
+        values = chunk[list(date_idx)].to_numpy(dtype=np.float32)
+        valid = is_valid(values)
+        sums[start:stop] = np.where(valid, values, 0.0) @ day_to_month
+        counts[start:stop] = valid.astype(np.float32) @ day_to_month
+        start = stop
+
+    # 與 monthly_sums() 相同
+    counts = counts[:start]
+    sums = _finish_sums(sums[:start], counts)
+    days = np.bincount(codes, minlength=n_months).astype(np.int16)
+
+    months = first + np.arange(n_months)
+    return MonthlyBlock(parse_year(in_file), lon[:start], lat[:start], months, sums, counts, days)
+
+
+def _ingest_or_error(in_file, chunk_rows=None):
+    """供行程池使用：回傳 (月合計, 錯誤)，避免單一檔案的錯誤中斷整批處理"""
+    try:
+        if chunk_rows:
+            with stage('ingest_streaming', file=os.path.basename(in_file)):
+                return ingest_file_streaming(in_file, chunk_rows), None
+        return ingest_file(in_file), None
+    except Exception as e:
+        return None, e
+
+
+def _parse_files(input_files, workers, chunk_rows=None):
+    """依輸入順序產生 (檔案, 月合計, 錯誤)"""
+    if workers <= 1:
+        for in_file in input_files:
+            yield (in_file, *_ingest_or_error(in_file, chunk_rows))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(partial(_ingest_or_error, chunk_rows=chunk_rows), input_files)
+        for in_file, (block, error) in zip(input_files, results):
+            yield in_file, block, error
+
+
+def ingest_files(input_files, workers=1, cache=None, chunk_rows=None):
+    """依輸入順序逐一產生 (檔案, 月合計, 錯誤)
+
+    workers > 1 時以 ProcessPoolExecutor 平行讀取各年份檔案；
+    各行程只回傳 NumPy 陣列組成的 MonthlyBlock，結果仍依輸入順序產生，
+    因此合併後的輸出與逐一處理完全相同。
+    指定 cache (MonthlyCache) 時，只有快取失效的檔案會重新讀取。
+    指定 chunk_rows 時以 ingest_file_streaming() 分塊讀取。
+    """
+    if cache is None:
+        yield from _parse_files(input_files, workers, chunk_rows)
+        return
+
+    cached = {in_file: cache.get(in_file) for in_file in input_files}
+    stale = [in_file for in_file in input_files if cached[in_file] is None]
+    parsed = _parse_files(stale, workers, chunk_rows)
+
+    for in_file in input_files:
+        block = cached[in_file]
+        if block is not None:
+            yield in_file, block, None
+            continue
+
+        _, block, error = next(parsed)
+        if error is None:
+            cache.put(in_file, block)
+        yield in_file, block, error
+
+    cache.save()
+
+
+def month_labels(months):
+    """將月份轉換為 result.csv 的欄位名稱 (月底日期)"""
+    month_ends = (months + 1).astype('M8[D]') - np.timedelta64(1, 'D')
+    return pd.DatetimeIndex(month_ends).astype(str) + ' 00:00:00'
+
+
+def apply_coverage(sums, counts, days, min_coverage=DEFAULT_MIN_COVERAGE):
+    """有效日數少於 1 日或少於 min_coverage × 該月日數的月合計設為 NaN"""
+    required = np.maximum(np.ceil(min_coverage * np.asarray(days) - 1e-9), 1)
+    return np.where(counts >= required, sums, np.nan).astype(np.float32)
+
+
+def merge_arrays(blocks, min_coverage=DEFAULT_MIN_COVERAGE):
+    """依序合併各年份的月合計，回傳經緯度、月份與 測站 × 月份 的月合計陣列
+
+    測站以列序對應；經緯度以最後一個檔案為準。
+    缺少的測站月份與有效日數不足 (見 apply_coverage) 的月份為 NaN。
+    """
+    n_stations = max(len(block.lon) for block in blocks)
+    lon = np.full(n_stations, np.nan)
+    lat = np.full(n_stations, np.nan)
+
+    months = np.concatenate([block.months for block in blocks])
+    values = np.full((n_stations, len(months)), np.nan, dtype=np.float32)
+
+    start = 0
+    for block in blocks:
+        n = len(block.lon)
+        lon[:n] = block.lon
+        lat[:n] = block.lat
+
+        stop = start + block.sums.shape[1]
+        values[:n, start:stop] = apply_coverage(block.sums, block.counts, block.days, min_coverage)
+        start = stop
+
+    return lon, lat, months, values
+
+
+def to_result_frame(lon, lat, months, values):
+    """組成 result.csv 的寬格式資料"""
+    merged = pd.DataFrame(values, columns=month_labels(months))
+    merged.insert(0, 'LAT', lat)
+    merged.insert(0, 'LON', lon)
+    return merged
+
+
+def merge_blocks(blocks, min_coverage=DEFAULT_MIN_COVERAGE):
+    """依序合併各年份的月合計，組成 result.csv 的寬格式資料"""
+    return to_result_frame(*merge_arrays(blocks, min_coverage))
+
+
+def find_input_files(input_folder, pattern='觀測_日資料_*_降雨量_*.csv'):
+    """依年份順序取得所有符合格式的檔案"""
+    input_files = glob.glob(os.path.join(input_folder, pattern))
+    return sorted(input_files, key=lambda path: (parse_year(path), path))
@@ -0,0 +1,162 @@
+"""測站 × 月份降雨資料的二進位儲存格式
+
+取代 result.csv 與 month/rain_YYYY_MM.csv 的文字往返：
+資料夾內包含可直接記憶體映射 (memory-map) 的 .npy 檔案
+
+    rainfall.npy  月份 × 測站 的 float32 月合計 (每個月份為連續記憶體)
+    months.npy    月份 (datetime64[M])
+    stations.npy  測站經緯度 (結構化陣列，欄位 LON、LAT)
+    source.json   寫出時同一資料夾中 result.csv 的大小與修改時間
+
+下游腳本以 open_store() 開啟後，可直接切片取得單月資料而不需複製或解析文字：
+month_arrays() 回傳的經緯度與降雨量皆為不複製的檢視；month_frame() 組成的 DataFrame
+則會複製各欄位，只需要陣列的呼叫端 (各 NumPy 引擎) 應以 load(arrays=True) 取得陣列。
+result.csv 在儲存資料夾寫出後被改寫 (例如之後以 --output csv 重新執行 result.py) 時，
+儲存資料夾視為過期，has_store() 回傳 False，下游腳本改為讀取 CSV。
+"""
+import glob
+import json
+import os
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# 預設的儲存資料夾名稱 (與 result.csv 放在同一處)
+STORE_DIR = 'result_store'
+
+# 記錄來源 result.csv 狀態的檔案
+SOURCE_FILE = 'source.json'
+
+STATION_DTYPE = np.dtype([('LON', '<f8'), ('LAT', '<f8')])
+
+# rainfall: 月份 × 測站 (唯讀記憶體映射)
+RainStore = namedtuple('RainStore', ['lon', 'lat', 'months', 'rainfall'])
+
+# 單月的測站經緯度與降雨量陣列
+MonthArrays = namedtuple('MonthArrays', ['lon', 'lat', 'rainfall'])
+
+
+def result_csv_path(store_dir):
+    """與儲存資料夾放在同一處的 result.csv"""
+    return os.path.join(os.path.dirname(os.path.normpath(store_dir)), 'result.csv')
+
+
+def _file_stamp(path):
+    """檔案的 [大小, 修改時間 (ns)]；不存在時為 None"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_store(store_dir, lon, lat, months, values):
+    """寫出儲存資料夾；values 為 測站 × 月份 的月合計
+
+    同時寫出 result.csv 時應先寫出 result.csv，其狀態記錄在 source.json 中。
+    """
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    stations = np.empty(len(lon), dtype=STATION_DTYPE)
+    stations['LON'] = lon
+    stations['LAT'] = lat
+
+    np.save(os.path.join(store_dir, 'stations.npy'), stations)
+    np.save(os.path.join(store_dir, 'months.npy'), np.asarray(months, dtype='M8[M]'))
+    # 轉為 月份 × 測站，讓每個月份的資料在檔案中連續存放
+    np.save(os.path.join(store_dir, 'rainfall.npy'),
+            np.ascontiguousarray(np.asarray(values, dtype=np.float32).T))
+    with open(os.path.join(store_dir, SOURCE_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'result_csv': _file_stamp(result_csv_path(store_dir))}, f)
+
+
+def open_store(store_dir):
+    """以記憶體映射開啟儲存資料夾"""
+    stations = np.load(os.path.join(store_dir, 'stations.npy'))
+    months = np.load(os.path.join(store_dir, 'months.npy'))
+    rainfall = np.load(os.path.join(store_dir, 'rainfall.npy'), mmap_mode='r')
+    return RainStore(stations['LON'], stations['LAT'], months, rainfall)
+
+
+def has_store(store_dir):
+    """檢查儲存資料夾是否完整存在且未過期"""
+    return all(
+        os.path.exists(os.path.join(store_dir, name))
+        for name in ('stations.npy', 'months.npy', 'rainfall.npy')
+    ) and not is_stale(store_dir)
+
+
+def is_stale(store_dir):
+    """result.csv 在儲存資料夾寫出後被改寫時為 True (沒有 result.csv 時儲存資料夾為唯一來源)"""
+    csv_stamp = _file_stamp(result_csv_path(store_dir))
+    if csv_stamp is None:
+        return False
+    try:
+        with open(os.path.join(store_dir, SOURCE_FILE), encoding='utf-8') as f:
+            recorded = json.load(f).get('result_csv')
+    except (OSError, ValueError):
+        # 舊版寫出的儲存資料夾沒有來源紀錄，無法確認是否與 result.csv 一致
+        return True
+    return recorded != csv_stamp
+
+
+def year_month(month):
+    """將 datetime64[M] 轉為 'YYYY_MM' 字串"""
+    return str(month).replace('-', '_')
+
+
+def month_frame(store, index):
+    """取得單月的 LON、LAT、RAINFALL 資料表
+
+    DataFrame 會複製各欄位 (包含記憶體映射的降雨量切片)；只需要陣列時改用 month_arrays()。
+    """
+    return pd.DataFrame({
+        'LON': store.lon,
+        'LAT': store.lat,
+        'RAINFALL': store.rainfall[index],
+    })
+
+
+def month_arrays(store, index):
+    """取得單月的經緯度與降雨量陣列 (皆不複製；rainfall 為記憶體映射的切片)"""
+    return MonthArrays(store.lon, store.lat, store.rainfall[index])
+
+
+def frame_arrays(df):
+    """由月份資料表取得 MonthArrays (降雨量為 RAINFALL 或 Value 欄位)"""
+    rainfall_field = 'RAINFALL' if 'RAINFALL' in df.columns else 'Value'
+    return MonthArrays(df['LON'].to_numpy(), df['LAT'].to_numpy(), df[rainfall_field].to_numpy())
+
+
+def _load_store_month(store, index, arrays=False):
+    return month_arrays(store, index) if arrays else month_frame(store, index)
+
+
+def _load_csv_month(csv_file, arrays=False):
+    df = pd.read_csv(csv_file)
+    return frame_arrays(df) if arrays else df
+
+
+def month_sources(input_folder, store_dir=None):
+    """列出各月份的輸入來源
+
+    回傳 [(year_month, 來源說明, load)]，load() 回傳含 LON、LAT 與降雨量欄位的資料表，
+    load(arrays=True) 則回傳 MonthArrays (由儲存資料夾讀取時不複製)。
+    若 store_dir 存在且未過期則直接由二進位資料切片，否則讀取 input_folder 中的 rain_*.csv。
+    """
+    if store_dir and has_store(store_dir):
+        store = open_store(store_dir)
+        return [
+            (year_month(month), f"{store_dir}[{year_month(month)}]",
+             partial(_load_store_month, store, index))
+            for index, month in enumerate(store.months)
+        ]
+
+    sources = []
+    for csv_file in sorted(glob.glob(os.path.join(input_folder, 'rain_*.csv'))):
+        file_name = os.path.basename(csv_file)
+        ym = file_name.replace("rain_", "").replace(".csv", "")
+        sources.append((ym, csv_file, partial(_load_csv_month, csv_file)))
+    return sources
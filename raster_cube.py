@@ -0,0 +1,130 @@
+"""多波段 (每個月份一個波段) 的降雨柵格立方體
+
+取代每月一個獨立的 rain_YYYY_MM.tif：所有月份寫入同一個分塊 (tiled)、壓縮的 GeoTIFF，
+各波段以描述 rain_YYYY_MM 與 YEAR、MONTH 標籤記錄年月。
+需要單月 TIF 時再以 export_month() 匯出；時間序列分析只需開啟一個檔案。
+
+使用方式:
+    python raster_cube.py export raster_IDW/rain_cube.tif 1960_01 rain_1960_01.tif
+    python raster_cube.py export-all raster_IDW/rain_cube.tif raster_IDW
+"""
+import argparse
+import os
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from raster_io import RASTER_NODATA, grid_from_dataset, grid_transform, write_geotiff
+
+# 立方體的分塊大小 (像元)
+BLOCK_SIZE = 256
+
+
+class CubeWriter:
+    """逐批寫入月份波段的多波段 GeoTIFF"""
+
+    def __init__(self, path, year_months, grid, nodata=RASTER_NODATA, block_size=BLOCK_SIZE):
+        self.year_months = list(year_months)
+        self.nodata = nodata
+        if os.path.exists(path):
+            os.remove(path)
+
+        profile = dict(
+            driver='GTiff',
+            height=grid.n_rows,
+            width=grid.n_cols,
+            count=len(self.year_months),
+            dtype='float32',
+            crs=grid.crs,
+            transform=grid_transform(grid),
+            nodata=nodata,
+            compress='deflate',
+            predictor=3,
+            interleave='band',
+            BIGTIFF='IF_SAFER',
+        )
+        # GeoTIFF 的分塊大小必須是 16 的倍數，且小網格不需分塊
+        if grid.n_rows >= block_size and grid.n_cols >= block_size:
+            profile.update(tiled=True, blockxsize=block_size, blockysize=block_size)
+        self.dst = rasterio.open(path, 'w', **profile)
+
+        for band, year_month in enumerate(self.year_months, start=1):
+            year, month = year_month.split('_')
+            self.dst.set_band_description(band, f'rain_{year_month}')
+            self.dst.update_tags(band, YEAR=year, MONTH=month)
+
+    def write(self, start, stack):
+        """由第 start 個月份 (0 起算) 開始寫入 (月份, 列, 行) 的資料"""
+        data = np.where(np.isnan(stack), self.nodata, stack).astype(np.float32)
+        bands = list(range(start + 1, start + 1 + data.shape[0]))
+        self.dst.write(data, bands)
+
+    def close(self):
+        self.dst.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def band_index(src, year_month):
+    """由 rain_YYYY_MM 描述找出波段編號 (1 起算)"""
+    name = f'rain_{year_month}'
+    for band, description in enumerate(src.descriptions, start=1):
+        if description == name:
+            return band
+    raise KeyError(f"立方體中沒有月份 {year_month}")
+
+
+def export_month(cube_path, year_month, out_path):
+    """將立方體中的單一月份匯出為獨立的 GeoTIFF"""
+    with rasterio.open(cube_path) as src:
+        data = src.read(band_index(src, year_month), masked=True)
+        grid = grid_from_dataset(src)
+        nodata = src.nodata
+    write_geotiff(out_path, data.filled(np.nan), grid, nodata=nodata)
+
+
+def read_pixel_series(cube_path, x, y):
+    """讀取座標 (x, y) 所在像元的所有月份數值，回傳 (月份名稱, 數值陣列)"""
+    with rasterio.open(cube_path) as src:
+        row, col = src.index(x, y)
+        values = src.read(window=Window(col, row, 1, 1), masked=True)[:, 0, 0]
+        names = [description.replace('rain_', '') for description in src.descriptions]
+    return names, values.filled(np.nan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='匯出多波段降雨立方體中的月份')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    one = sub.add_parser('export', help='匯出單一月份')
+    one.add_argument('cube')
+    one.add_argument('year_month', help='例如 1960_01')
+    one.add_argument('output')
+
+    every = sub.add_parser('export-all', help='將所有月份匯出為 rain_YYYY_MM.tif')
+    every.add_argument('cube')
+    every.add_argument('output_folder')
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_month(args.cube, args.year_month, args.output)
+        print(f"已匯出: {args.output}")
+        return
+
+    if not os.path.exists(args.output_folder):
+        os.makedirs(args.output_folder)
+    with rasterio.open(args.cube) as src:
+        names = [description.replace('rain_', '') for description in src.descriptions]
+    for year_month in names:
+        out_path = os.path.join(args.output_folder, f'rain_{year_month}.tif')
+        export_month(args.cube, year_month, out_path)
+        print(f"已匯出: {out_path}")
+
+
+if __name__ == '__main__':
+    main()
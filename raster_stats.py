@@ -0,0 +1,274 @@
+"""所有月份柵格的整體統計 (最小值、最大值、直方圖與分位數)
+
+以分塊 (block window) 方式逐一讀取每個柵格 (或立方體的每個波段)，只掃描一次；
+-99.9 與檔案的無資料值不列入。結果存為柵格資料夾中的 rain_stats.json，
+並記錄各柵格的大小與修改時間，柵格未變動時直接沿用。
+各柵格的直方圖另外快取在 .rain_stats_parts.json，部分柵格變動時只重新掃描這些柵格，
+再與其他柵格的直方圖合併為整體統計。
+symbology.py 由這份統計計算所有月份共用的分界點，不再逐檔重新統計，
+不同月份的地圖因此可以直接比較。
+
+使用方式:
+    python raster_stats.py raster_IDW
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import traceback
+
+import numpy as np
+import rasterio
+
+# 原始資料的缺值標記
+NODATA = -99.9
+
+# 統計檔名 (存放在柵格資料夾)
+STATS_FILE = 'rain_stats.json'
+
+# 各柵格直方圖的快取檔名 (存放在柵格資料夾)
+PARTS_FILE = '.rain_stats_parts.json'
+
+# 直方圖的組距 (mm)
+DEFAULT_BIN_WIDTH = 0.5
+
+# 統計檔中記錄的分位數
+QUANTILES = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+class StreamingHistogram:
+    """固定組距、範圍可隨資料擴展的直方圖
+
+    最小值、最大值、筆數與總和為精確值；分位數在組內以線性內插估計，誤差不超過一個組距。
+    """
+
+    def __init__(self, bin_width=DEFAULT_BIN_WIDTH):
+        self.bin_width = float(bin_width)
+        self.origin = None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        lo, hi = float(values.min()), float(values.max())
+        if self.origin is None:
+            self.origin = math.floor(lo / self.bin_width) * self.bin_width
+
+        # 新資料低於目前範圍時，將直方圖向左擴展
+        if lo < self.origin:
+            shift = int(math.ceil((self.origin - lo) / self.bin_width))
+            self.counts = np.concatenate([np.zeros(shift, dtype=np.int64), self.counts])
+            self.origin -= shift * self.bin_width
+
+        index = np.floor((values - self.origin) / self.bin_width).astype(np.int64)
+        index = np.maximum(index, 0)
+        counts = np.bincount(index)
+        if len(counts) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(counts) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(counts)] += counts
+
+        self.count += values.size
+        self.total += float(values.sum())
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def merge(self, other):
+        """加入另一個相同組距的直方圖 (兩者的原點皆為組距的整數倍)"""
+        if other.count == 0:
+            return
+        if self.origin is None:
+            self.origin = other.origin
+        offset = int(round((other.origin - self.origin) / self.bin_width))
+        if offset < 0:
+            self.counts = np.concatenate([np.zeros(-offset, dtype=np.int64), self.counts])
+            self.origin = other.origin
+            offset = 0
+        end = offset + len(other.counts)
+        if end > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(end - len(self.counts), dtype=np.int64)])
+        self.counts[offset:end] += other.counts
+
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @classmethod
+    def from_dict(cls, stats):
+        """由統計檔內容還原直方圖 (用於計算其他分位數)"""
+        hist = cls(stats['bin_width'])
+        if stats.get('count'):
+            hist.origin = stats['origin']
+            hist.counts = np.asarray(stats['histogram'], dtype=np.int64)
+            hist.count = stats['count']
+            hist.total = stats['mean'] * stats['count']
+            hist.min, hist.max = stats['min'], stats['max']
+        return hist
+
+    def quantile(self, q):
+        """估計分位數 (0 ≤ q ≤ 1)"""
+        if self.count == 0:
+            return math.nan
+        target = q * self.count
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, target, side='left'))
+        i = min(i, len(self.counts) - 1)
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (target - before) / self.counts[i] if self.counts[i] else 0.0
+        value = self.origin + (i + fraction) * self.bin_width
+        return float(min(max(value, self.min), self.max))
+
+    def to_dict(self):
+        return {
+            'count': int(self.count),
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'mean': self.total / self.count if self.count else None,
+            'bin_width': self.bin_width,
+            'origin': self.origin,
+            'histogram': self.counts.tolist(),
+            'quantiles': {f'{q:g}': self.quantile(q) for q in QUANTILES} if self.count else {},
+        }
+
+
+def _file_state(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def valid_values(block, nodata_mask):
+    """排除無資料值、NaN 與 -99.9 的有效數值"""
+    valid = ~nodata_mask & ~np.isnan(block) & ~np.isclose(block, NODATA)
+    return block[valid]
+
+
+def scan_rasters(raster_paths, bin_width=DEFAULT_BIN_WIDTH):
+    """以分塊讀取掃描所有柵格的每個波段一次，回傳 StreamingHistogram"""
+    hist = StreamingHistogram(bin_width)
+    for path in raster_paths:
+        with rasterio.open(path) as src:
+            for band in range(1, src.count + 1):
+                for _, window in src.block_windows(band):
+                    block = src.read(band, window=window, masked=True)
+                    data = np.ma.getdata(block).astype(np.float64)
+                    hist.add(valid_values(data, np.ma.getmaskarray(block)))
+    return hist
+
+
+def load_parts(path, bin_width=DEFAULT_BIN_WIDTH):
+    """讀取各柵格直方圖的快取: {檔名: {'state': [大小, 修改時間], 'stats': 直方圖}}"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        parts = load_stats(path)
+    except (OSError, ValueError):
+        return {}
+    if parts.get('bin_width') != float(bin_width):
+        return {}
+    return parts.get('rasters', {})
+
+
+def merge_parts(raster_paths, parts_path, bin_width=DEFAULT_BIN_WIDTH):
+    """只重新掃描大小或修改時間改變的柵格，與其他柵格快取的直方圖合併，回傳 StreamingHistogram"""
+    cached = load_parts(parts_path, bin_width)
+    parts = {}
+    hist = StreamingHistogram(bin_width)
+    for path in raster_paths:
+        name = os.path.basename(path)
+        state = _file_state(path)
+        part = cached.get(name)
+        if part is None or part['state'] != state:
+            part = {'state': state, 'stats': scan_rasters([path], bin_width).to_dict()}
+        parts[name] = part
+        hist.merge(StreamingHistogram.from_dict(part['stats']))
+    save_stats(parts_path, {'bin_width': float(bin_width), 'rasters': parts})
+    return hist
+
+
+def compute_stats(raster_paths, bin_width=DEFAULT_BIN_WIDTH, parts_path=None):
+    """掃描柵格並組成統計檔內容 (包含各輸入檔的大小與修改時間)
+
+    指定 parts_path 時以 merge_parts() 增量計算，只掃描變動的柵格。
+    """
+    if parts_path is None:
+        stats = scan_rasters(raster_paths, bin_width).to_dict()
+    else:
+        stats = merge_parts(raster_paths, parts_path, bin_width).to_dict()
+    stats['files'] = {os.path.basename(path): _file_state(path) for path in raster_paths}
+    return stats
+
+
+def is_current(stats, raster_paths, bin_width=DEFAULT_BIN_WIDTH):
+    """統計檔是否仍對應目前的柵格 (檔案、大小與修改時間皆相同)"""
+    if stats.get('bin_width') != float(bin_width):
+        return False
+    files = {os.path.basename(path): _file_state(path) for path in raster_paths}
+    return stats.get('files') == files
+
+
+def load_stats(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_stats(path, stats):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def folder_rasters(raster_folder, pattern='*.tif'):
+    return sorted(glob.glob(os.path.join(raster_folder, pattern)))
+
+
+def load_or_compute_stats(raster_folder, pattern='*.tif', bin_width=DEFAULT_BIN_WIDTH, log=print):
+    """讀取柵格資料夾的統計檔；柵格有增減或變動時重新掃描並存檔
+
+    回傳 (統計, 是否由統計檔讀取)。
+    """
+    path = os.path.join(raster_folder, STATS_FILE)
+    raster_paths = folder_rasters(raster_folder, pattern)
+    if os.path.exists(path):
+        try:
+            stats = load_stats(path)
+            if is_current(stats, raster_paths, bin_width):
+                return stats, True
+        except (OSError, ValueError):
+            pass
+
+    log(f"更新 {len(raster_paths)} 個柵格的整體統計...")
+    stats = compute_stats(raster_paths, bin_width, os.path.join(raster_folder, PARTS_FILE))
+    save_stats(path, stats)
+    return stats, False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='計算柵格資料夾中所有月份柵格的整體統計')
+    parser.add_argument('raster_folder', help='柵格資料夾 (例如 raster_IDW)')
+    parser.add_argument('--pattern', default='*.tif', help='柵格檔名樣式 (預設 *.tif)')
+    parser.add_argument('--bin-width', type=float, default=DEFAULT_BIN_WIDTH, help='直方圖組距 (mm，預設 0.5)')
+    args = parser.parse_args()
+
+    try:
+        stats, from_file = load_or_compute_stats(args.raster_folder, args.pattern, args.bin_width)
+    except Exception:
+        traceback.print_exc()
+        exit(1)
+
+    if from_file:
+        print("柵格未變動，沿用既有的統計檔")
+    print(f"有效像元: {stats['count']}")
+    if stats['count']:
+        print(f"最小值: {stats['min']:.1f}  最大值: {stats['max']:.1f}  平均: {stats['mean']:.1f}")
+        print("分位數: " + ', '.join(f"{q}={v:.1f}" for q, v in stats['quantiles'].items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""以多個行程平行將月份點資料轉換為柵格
+
+每個工作行程有自己的暫存資料夾 (scratch workspace) 與自己的 arcpy.env 設定，
+因此暫存的點特徵類別與柵格以月份命名即可，不需要時間戳記，也不會與其他行程衝突。
+ArcGIS 的呼叫集中在 ArcpyRasterBackend；排程本身只依賴 RasterBackend 介面，
+可以在沒有 arcpy 的環境以 FakeRasterBackend 驗證。
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context, util
+
+from idw import DEFAULT_NEIGHBORS, DEFAULT_POWER
+from point_loader import load_points
+from projection import epsg_code
+
+# 各柵格轉換方式
+METHODS = ('idw', 'point', 'feature')
+
+
+class RasterBackend:
+    """在單一工作行程中將月份點資料轉換為柵格的介面"""
+
+    def setup(self, scratch_dir, grid):
+        """工作行程啟動時呼叫一次；scratch_dir 為此行程專用的暫存資料夾"""
+
+    def rasterize(self, year_month, df, rainfall_field, raster_output):
+        raise NotImplementedError
+
+    def teardown(self):
+        """工作行程結束時呼叫一次"""
+
+
+class ArcpyRasterBackend(RasterBackend):
+    """以 ArcGIS 工具轉換 (Idw、PointToRaster 或 FeatureToRaster)"""
+
+    def __init__(self, method='idw', assignment='MEAN', power=DEFAULT_POWER,
+                 n_neighbors=DEFAULT_NEIGHBORS, radius=None):
+        if method not in METHODS:
+            raise ValueError(f"不支援的轉換方式: {method}")
+        self.method = method
+        self.assignment = assignment
+        self.power = power
+        self.n_neighbors = n_neighbors
+        self.radius = radius
+
+    def setup(self, scratch_dir, grid):
+        import arcpy
+        from point_loader import ArcpyPointBackend
+
+        if arcpy.CheckExtension("Spatial") != "Available":
+            raise RuntimeError("Spatial Analyst 擴充模組不可用")
+        arcpy.CheckOutExtension("Spatial")
+
+        # 每個行程各自的工作空間與環境設定
+        arcpy.env.workspace = scratch_dir
+        arcpy.env.scratchWorkspace = scratch_dir
+        arcpy.env.overwriteOutput = True
+        # 點資料為 WGS 1984 經緯度；輸出柵格使用網格的座標系統
+        self.spatial_ref = arcpy.SpatialReference(4326)  # WGS 1984
+        arcpy.env.extent = arcpy.Extent(*grid.extent)
+        arcpy.env.cellSize = grid.cell_size
+        arcpy.env.outputCoordinateSystem = arcpy.SpatialReference(epsg_code(grid.crs))
+
+        self.arcpy = arcpy
+        self.points = ArcpyPointBackend()
+        self.scratch_dir = scratch_dir
+        self.cell_size = grid.cell_size
+
+    def rasterize(self, year_month, df, rainfall_field, raster_output):
+        arcpy = self.arcpy
+        point_fc = os.path.join(self.scratch_dir, f"rain_{year_month}_pt.shp")
+        temp_raster = os.path.join(self.scratch_dir, f"temp_raster_{year_month}.tif")
+        load_points(self.points, df, point_fc, self.spatial_ref, rainfall_field)
+
+        if self.method == 'idw':
+            from arcpy.sa import Idw, RadiusVariable
+            if self.radius is not None:
+                search_radius = RadiusVariable(self.n_neighbors, self.radius)
+            else:
+                search_radius = RadiusVariable(self.n_neighbors)
+            Idw(point_fc, "RAINFALL", self.cell_size, self.power, search_radius).save(temp_raster)
+        elif self.method == 'point':
+            arcpy.conversion.PointToRaster(
+                in_features=point_fc,
+                value_field="RAINFALL",
+                out_rasterdataset=temp_raster,
+                cell_assignment=self.assignment,
+                priority_field="NONE",
+                cellsize=self.cell_size,
+            )
+        else:
+            arcpy.conversion.FeatureToRaster(
+                in_features=point_fc,
+                field="RAINFALL",
+                out_raster=temp_raster,
+                cell_size=self.cell_size,
+            )
+
+        if os.path.exists(raster_output):
+            os.remove(raster_output)
+        arcpy.management.CopyRaster(temp_raster, raster_output)
+
+        # 清理此月份的暫存資料
+        for item in (temp_raster, point_fc):
+            if arcpy.Exists(item):
+                arcpy.Delete_management(item)
+
+    def teardown(self):
+        self.arcpy.CheckInExtension("Spatial")
+
+
+class FakeRasterBackend(RasterBackend):
+    """不需 arcpy 的假引擎，供驗證排程使用
+
+    在暫存資料夾中建立與 ArcpyRasterBackend 相同名稱的暫存檔，
+    並將呼叫紀錄 (行程、暫存資料夾、點數與合計) 以 JSON 寫入輸出檔。
+    暫存檔已存在時表示名稱衝突，直接拋出錯誤。
+    """
+
+    def setup(self, scratch_dir, grid):
+        self.scratch_dir = scratch_dir
+        self.grid = grid
+
+    def rasterize(self, year_month, df, rainfall_field, raster_output):
+        temp_raster = os.path.join(self.scratch_dir, f"temp_raster_{year_month}.tif")
+        with open(temp_raster, 'x') as f:
+            f.write(year_month)
+
+        record = {
+            'year_month': year_month,
+            'pid': os.getpid(),
+            'scratch': self.scratch_dir,
+            'n_points': int(len(df)),
+            'total': float(df[rainfall_field].sum()),
+            'shape': [self.grid.n_rows, self.grid.n_cols],
+        }
+        with open(raster_output, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.remove(temp_raster)
+
+
+# 工作行程內的狀態 (由 _init_worker 設定)
+_worker = {}
+
+
+def _start_backend(backend, grid, run_dir, name):
+    """建立專用暫存資料夾並初始化引擎"""
+    scratch_dir = os.path.join(run_dir, name)
+    os.makedirs(scratch_dir)
+    backend.setup(scratch_dir, grid)
+    _worker.update(backend=backend, scratch_dir=scratch_dir)
+
+
+def _init_worker(backend, grid, run_dir):
+    """工作行程啟動時執行；行程結束時釋放授權"""
+    _start_backend(backend, grid, run_dir, f"worker_{os.getpid()}")
+    util.Finalize(None, backend.teardown, exitpriority=10)
+
+
+def _rasterize_month(year_month, df, rainfall_field, raster_output):
+    """在工作行程中轉換單一月份，回傳 (月份, 輸出檔案, 錯誤訊息)"""
+    try:
+        _worker['backend'].rasterize(year_month, df, rainfall_field, raster_output)
+        return year_month, raster_output, None
+    except Exception as e:
+        traceback.print_exc()
+        return year_month, raster_output, str(e)
+
+
+@contextmanager
+def _script_main_hidden():
+    """暫時隱藏 __main__ 的檔案路徑
+
+    柵格腳本沒有 if __name__ == '__main__' 保護；以 spawn 啟動的工作行程
+    若重新匯入呼叫端腳本會整個重新執行一次。工作行程只需要本模組的函式，
+    因此在行程池存在期間讓 multiprocessing 不匯入 __main__。
+    """
+    main = sys.modules['__main__']
+    saved = {name: main.__dict__[name] for name in ('__file__', '__spec__') if name in main.__dict__}
+    main.__dict__.pop('__file__', None)
+    main.__spec__ = None
+    try:
+        yield
+    finally:
+        main.__dict__.update(saved)
+
+
+def month_jobs(month_inputs, raster_folder):
+    """依序讀取各月份資料，產生 (月份, 資料表, 降雨量欄位, 輸出檔案)"""
+    for year_month, source, load_month in month_inputs:
+        df = load_month()
+        rainfall_field = 'RAINFALL' if 'RAINFALL' in df.columns else 'Value'
+        yield year_month, df, rainfall_field, os.path.join(raster_folder, f"rain_{year_month}.tif")
+
+
+def run_months(backend, jobs, grid, workers=1, scratch_root='scratch', keep_scratch=False, log=print):
+    """將各月份分配給 workers 個工作行程轉換，回傳失敗的 [(月份, 錯誤訊息)]
+
+    jobs 為 month_jobs() 產生的 (月份, 資料表, 降雨量欄位, 輸出檔案)。
+    每次執行在 scratch_root 下建立新的資料夾，各工作行程再各自建立子資料夾。
+    workers 為 1 時在目前行程中依序處理，使用相同的暫存資料夾規則。
+    """
+    if not os.path.exists(scratch_root):
+        os.makedirs(scratch_root)
+    run_dir = tempfile.mkdtemp(prefix='run_', dir=scratch_root)
+
+    failed = []
+
+    def report(result):
+        year_month, raster_output, error = result
+        if error is None:
+            log(f"已成功建立柵格資料: {raster_output}")
+        else:
+            log(f"處理月份 {year_month} 時發生錯誤: {error}")
+            failed.append((year_month, error))
+
+    try:
+        if workers <= 1:
+            _start_backend(backend, grid, run_dir, 'worker_main')
+            try:
+                for job in jobs:
+                    report(_rasterize_month(*job))
+            finally:
+                backend.teardown()
+            return failed
+
+        # arcpy 不支援 fork 後繼續使用，一律以 spawn 啟動工作行程 (與 Windows 相同)
+        with _script_main_hidden(), ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(backend, grid, run_dir),
+        ) as executor:
+            # 限制尚未完成的月份數，避免一次將所有月份資料送入佇列
+            pending = []
+            for job in jobs:
+                pending.append(executor.submit(_rasterize_month, *job))
+                if len(pending) >= workers * 2:
+                    report(pending.pop(0).result())
+            for future in pending:
+                report(future.result())
+        return failed
+    finally:
+        if not keep_scratch:
+            shutil.rmtree(run_dir, ignore_errors=True)
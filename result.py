@@ -1,164 +1,141 @@
-import pandas as pd
-import numpy as np
+import argparse
 import os
-import glob
-import re
+
+import numpy as np
+
+from monthly_cache import MonthlyCache
+from rain_ingest import DEFAULT_MIN_COVERAGE, find_input_files, ingest_files, merge_arrays, to_result_frame
+from rain_store import STORE_DIR, write_store
+from station_index import INDEX_FILE, load_or_build_index, station_report
+from instrument import add_arguments, configure, count, info, stage, verbose
 
 # 設定輸入資料夾路徑
 input_folder = '../ClimateData/'
 output_folder = '.'  # 輸出資料夾路徑
 
-# 取得所有符合格式的檔案
-file_pattern = os.path.join(input_folder, '觀測_日資料_宜蘭縣_降雨量_*.csv')
-input_files = glob.glob(file_pattern)
 
-# 如果沒有找到檔案，直接處理指定的檔案
-if len(input_files) == 0:
-    input_files = ['觀測_日資料_宜蘭縣_降雨量_2020.csv']
+def build_result(input_files, output_folder='.', workers=1, cache=None, chunk_rows=None, output='csv',
+                 min_coverage=DEFAULT_MIN_COVERAGE):
+    """讀取各年份檔案並輸出合併後的 result.csv 及/或 result_store/，以及測站空間索引 station_index.npz
 
-print(f"找到 {len(input_files)} 個檔案需要處理")
+    有效日數不足 min_coverage 的測站月份為缺值 (result.csv 中為空白欄位)。
+    回傳讀取失敗的檔案清單；合併或寫出時的錯誤直接拋出。
+    """
+    # 用於儲存所有年份的月資料
+    all_monthly_data = []
+    failed = []
 
-# 用於儲存所有年份的月資料
-all_monthly_data = []
+    # 讀取檔案並以 bincount 計算每月合計 (結果依年份順序回傳)；
+    # 平行讀取時各檔案的耗時重疊，整體讀取時間記錄在 ingest 階段
+    with stage('ingest'):
+        for in_file, block, error in ingest_files(input_files, workers, cache, chunk_rows):
+            if error is not None:
+                print(f"處理檔案 {in_file} 時發生錯誤: {str(error)}")
+                failed.append(in_file)
+                continue
 
-# 用於儲存測站的經緯度資訊
-station_coordinates = {}
+            info(f"已處理檔案: {os.path.basename(in_file)}")
+            count('files')
+            count('ingested_station_months', len(block.lon) * len(block.months))
 
-for in_file in input_files:
-    try:
-        # 從檔名取得年份
-        year_match = re.search(r'(\d{4})\.csv$', in_file)
-        if year_match:
-            year = year_match.group(1)
-        else:
-            # 嘗試從檔名中提取年份
-            year_match = re.search(r'_(\d{4})', in_file)
-            if year_match:
-                year = year_match.group(1)
-            else:
-                year = "unknown"
-        
-        print(f"正在處理檔案: {os.path.basename(in_file)}")
-        
-        # 讀取 CSV 資料，轉換為 dataframe
-        df = pd.read_csv(in_file, index_col=False)
-        
-        # 有些欄位名稱有空白符號，為使其一致，需修改欄位名稱
-        df.columns = [s.strip() for s in df.columns]
-        
-        # 檢查 dataframe 的大小
-        rows, cols = df.shape
-        print(f'df.shape: ({rows},{cols})')
-        
-        # 增加 ID 欄位，紀錄點的編號
-        df['ID'] = np.arange(rows)
-        
-        # 儲存測站的經緯度資訊
-        # 先確認欄位名稱
-        lon_col = 'LON' if 'LON' in df.columns else ' LON' if ' LON' in df.columns else None
-        lat_col = 'LAT' if 'LAT' in df.columns else ' LAT' if ' LAT' in df.columns else None
-        
-        if lon_col and lat_col:
-            for i, row in df.iterrows():
-                station_name = row['站名'] if '站名' in df.columns else row[' 站名'] if ' 站名' in df.columns else f"Station_{i}"
-                station_coordinates[station_name] = {
-                    'LON': row[lon_col],
-                    'LAT': row[lat_col]
-                }
-        
-        # 轉置矩陣
-        df2 = df.T
-        
-        # 將 -99.9 改為 numpy.NaN
-        df2 = df2.replace(-99.9, np.nan)
-        
-        # 刪除不需要的欄位
-        try:
-            df2 = df2.drop(index=['LON', 'LAT', 'ID'])
-        except KeyError:
-            try:
-                # 嘗試使用可能有空格的欄位名稱
-                df2 = df2.drop(index=[' LON', ' LAT', 'ID'])
-            except KeyError:
-                print("警告: 無法找到 LON、LAT 或 ID 欄位，請檢查資料格式")
-        
-        # 檢查 dataframe 的大小
-        print(f'df2.shape: {df2.shape}')
-        
-        # 檢查 dataframe 的 index
-        print(f'df2.index 前5項: {list(df2.index)[:5]}')
-        
-        # 過濾掉不是日期格式的索引
-        date_pattern = re.compile(r'^\d{8}$')
-        valid_indices = [idx for idx in df2.index if date_pattern.match(str(idx))]
-        df2 = df2.loc[valid_indices]
-        
-        # 將 yymmdd 格式的日期轉會成為 datetime object
-        t = [f'{s[:4]}-{s[4:6]}-{s[6:]}' for s in df2.index]
-        df2.index = pd.to_datetime(t)
-        
-        # 檢查 dataframe 的 index
-        print(f'日期範圍: {df2.index.min()} 到 {df2.index.max()}')
-        print(f'資料期間: {df2.index.max() - df2.index.min()}')
-        
-        # 由 datetime 的 index 計算欄位值的每月合計
-        df3 = df2.resample('ME').sum()
-        
-        # 將 0 改為 -99.9
-        df3 = df3.replace(0, -99.9)
-        
-        # 儲存此年份的月資料，用於後續合併
-        all_monthly_data.append(df3)
-        
-        print('-' * 50)
-        
-    except Exception as e:
-        print(f"處理檔案 {in_file} 時發生錯誤: {str(e)}")
+            # 檢查資料大小
+            verbose(f'測站數: {len(block.lon)}, 月份數: {len(block.months)}')
+            verbose(f'月份範圍: {block.months[0]} 到 {block.months[-1]}')
 
-# 合併所有年份的月資料
-if all_monthly_data:
-    try:
-        # 合併所有年份的資料
-        combined_data = pd.concat(all_monthly_data, axis=0)
-        
-        # 將測站經緯度資訊輸出為暫存資料
-        station_coords_df = pd.DataFrame.from_dict(station_coordinates, orient='index')
-        station_coords_df.reset_index(inplace=True)
-        station_coords_df.rename(columns={'index': 'Station', 'LON': 'LON', 'LAT': 'LAT'}, inplace=True)
-        
-        # 轉置合併後的資料
-        df_transposed = combined_data.T
-        
-        # 添加測站名稱作為欄位
-        df_transposed['Station'] = df_transposed.index
-        
-        # 移除 "Station_" 前綴
-        station_coords_df['Station'] = station_coords_df['Station'].str.replace('Station_', '', regex=True)
-        
-        # 將兩個資料集的 Station 欄位都轉換為字串類型
-        df_transposed['Station'] = df_transposed['Station'].astype(str)
-        station_coords_df['Station'] = station_coords_df['Station'].astype(str)
-        
-        # 合併資料
-        merged_data = pd.merge(
-            station_coords_df,
-            df_transposed,
-            on='Station',
-            how='inner'  # 僅保留兩者都有的測站
-        )
-        
-        # 從合併後的資料中刪除 Station 欄位
-        merged_data = merged_data.drop(columns=['Station'])
-        
-        # 輸出最終合併後的資料，直接命名為 result.csv
+            # 儲存此年份的月資料，用於後續合併
+            all_monthly_data.append(block)
+
+            verbose('-' * 50)
+
+    if cache is not None:
+        print(f"快取命中 {cache.hits} 個檔案，重新讀取 {cache.misses} 個檔案")
+
+    # 合併所有年份的月資料
+    if not all_monthly_data:
+        return failed
+
+    with stage('merge'):
+        lon, lat, months, values = merge_arrays(all_monthly_data, min_coverage)
+    print(f"合併後資料形狀: ({len(lon)}, {len(months)})")
+    no_data = sum(int((block.counts == 0).sum()) for block in all_monthly_data)
+    print(f"缺值測站月份: {int(np.isnan(values).sum())} "
+          f"(整月無觀測 {no_data} 個，其餘為有效日數不足或測站缺少該年份)")
+
+    # 測站空間索引，供 IDW、點轉柵格與測站檢查共用
+    index_path = os.path.join(output_folder, INDEX_FILE)
+    with stage('index'):
+        index, from_file = load_or_build_index(index_path, lon, lat)
+        close_pairs = station_report(index)['close_pairs']
+    print(f"{'沿用' if from_file else '已建立'}測站空間索引 {index_path}，位置重複的測站組合: {len(close_pairs)}")
+
+    # 輸出最終合併後的資料，直接命名為 result.csv
+    if output in ('csv', 'both'):
         final_output_file = os.path.join(output_folder, 'result.csv')
-        merged_data.to_csv(final_output_file, index=False)
+        with stage('write_csv'):
+            merged_data = to_result_frame(lon, lat, months, values)
+            merged_data.to_csv(final_output_file, index=False)
         print(f"已將最終合併後的資料保存到 {final_output_file}")
-        print(f"合併後資料形狀: {merged_data.shape}")
-        
+
+    # 輸出二進位資料，供下游腳本直接切片讀取 (在 result.csv 之後寫出，記錄 result.csv 的狀態；
+    # 之後只重新輸出 result.csv 時，舊的 result_store/ 視為過期)
+    store_folder = os.path.join(output_folder, STORE_DIR)
+    if output in ('store', 'both'):
+        with stage('write_store'):
+            write_store(store_folder, lon, lat, months, values)
+        print(f"已將最終合併後的資料保存到 {store_folder}")
+    elif os.path.exists(store_folder):
+        print(f"{store_folder} 早於新的 result.csv，下游腳本將改為讀取 result.csv")
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='根據各年觀測資料生成總觀測資料 result.csv')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='平行讀取年份檔案的行程數 (預設 1，逐一處理)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用月合計快取，重新讀取所有年份檔案')
+    parser.add_argument('--cache-size', type=int, default=512,
+                        help='月合計快取的大小上限 (MB)')
+    parser.add_argument('--output', choices=['csv', 'store', 'both'], default='csv',
+                        help='輸出格式: csv 為 result.csv；store 為可記憶體映射的 result_store/ 二進位資料')
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help='串流模式: 每次只讀取此數量的測站列，記憶體用量與檔案大小無關')
+    parser.add_argument('--min-coverage', type=float, default=DEFAULT_MIN_COVERAGE,
+                        help='月合計有效所需的有效日數比例 (0-1，預設 0: 至少 1 個有效日)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    # 取得所有符合格式的檔案 (依年份排序)
+    input_files = find_input_files(input_folder, '觀測_日資料_宜蘭縣_降雨量_*.csv')
+
+    # 如果沒有找到檔案，直接處理指定的檔案
+    if len(input_files) == 0:
+        input_files = ['觀測_日資料_宜蘭縣_降雨量_2020.csv']
+
+    print(f"找到 {len(input_files)} 個檔案需要處理")
+    if args.workers > 1:
+        print(f"使用 {args.workers} 個行程平行處理")
+    if args.chunk_rows:
+        print(f"串流模式: 每次讀取 {args.chunk_rows} 個測站")
+
+    # 各年份檔案的月合計快取，存放在 result.csv 旁
+    cache = None
+    if not args.no_cache:
+        cache = MonthlyCache(os.path.join(output_folder, '.result_cache'),
+                             max_bytes=args.cache_size * 1024 * 1024)
+
+    try:
+        build_result(input_files, output_folder, args.workers, cache, args.chunk_rows, args.output,
+                     args.min_coverage)
     except Exception as e:
         print(f"合併或轉置資料時發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()  # 印出詳細的錯誤訊息
 
-print("所有檔案處理完成！最終結果已保存為 result.csv")
+    print("所有檔案處理完成！")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""測站空間索引 (KD-tree)，供 IDW、點轉柵格與測站檢查共用
+
+測站座標只建立一次 KD-tree，並存為 result.csv 旁的 station_index.npz；
+k 個最近測站、搜尋半徑內的測站與各像元內的測站都由同一個索引查詢，
+不再計算所有像元 × 所有測站的距離。索引檔記錄經緯度的雜湊，測站集合改變時重新建立。
+網格使用公尺座標系統 (例如 TWD97 / EPSG:3826) 時，經緯度在建立索引時投影一次 (projection.py)，
+投影後的座標與索引一併存為 station_index_EPSG3826.npz；距離與搜尋半徑使用網格座標的單位。
+
+使用方式:
+    python station_index.py
+    python station_index.py --crs EPSG:3826 --tolerance 10 --grid grid_spec.json
+"""
+import argparse
+import hashlib
+import os
+import traceback
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from grid_spec import DEFAULT_CRS, GRID_FILE, GridSpec
+from projection import is_geographic, normalize_crs, project_points
+
+# 索引檔名 (與 result.csv 放在同一處)
+INDEX_FILE = 'station_index.npz'
+
+# 視為同一位置的測站距離 (經緯度約 10 公尺；公尺座標系統使用 METRIC_TOLERANCE)
+DEFAULT_TOLERANCE = 1e-4
+METRIC_TOLERANCE = 10.0
+
+
+def index_file(crs=DEFAULT_CRS):
+    """座標系統對應的索引檔名；經緯度為 station_index.npz，其他為 station_index_EPSG3826.npz 等"""
+    crs = normalize_crs(crs)
+    if crs == DEFAULT_CRS:
+        return INDEX_FILE
+    name = ''.join(ch for ch in crs if ch.isalnum())
+    return f'station_index_{name}.npz'
+
+
+def coordinate_key(x, y):
+    """測站座標的雜湊，用於判斷索引檔是否仍對應目前的測站集合"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class StationIndex:
+    """測站座標的 KD-tree 索引
+
+    x, y 為 crs 座標系統中的測站座標；key 為原始經緯度的雜湊 (未指定時以 x, y 計算)。
+    查詢結果中的測站編號為建立索引時的座標順序。
+    """
+
+    def __init__(self, x, y, crs=DEFAULT_CRS, key=None):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.crs = normalize_crs(crs)
+        self.tree = cKDTree(np.column_stack([self.x, self.y]))
+        self.key = coordinate_key(self.x, self.y) if key is None else key
+        # 各網格的測站像元編號 (網格定義 → 像元編號)
+        self._cells = {}
+
+    @classmethod
+    def from_lonlat(cls, lon, lat, crs=DEFAULT_CRS):
+        """由經緯度建立 crs 座標系統中的索引 (座標以向量化方式一次投影)"""
+        x, y = project_points(lon, lat, crs)
+        return cls(x, y, crs, coordinate_key(lon, lat))
+
+    @property
+    def n(self):
+        return len(self.x)
+
+    def matches(self, lon, lat):
+        """索引是否對應指定的測站經緯度 (順序也需相同)"""
+        return self.key == coordinate_key(lon, lat)
+
+    def subset(self, mask):
+        """只包含 mask 為 True 的測站的索引；全部為 True 時回傳自己"""
+        mask = np.asarray(mask, dtype=bool)
+        if mask.all():
+            return self
+        return StationIndex(self.x[mask], self.y[mask], self.crs)
+
+    def nearest(self, qx, qy, k=1, radius=None):
+        """各查詢點的 k 個最近測站，回傳 (距離, 測站編號) 皆為 (查詢點, k)
+
+        超出 radius 或測站數不足時距離為 inf、編號為 n。
+        """
+        k = max(1, min(k, self.n))
+        upper = np.inf if radius is None else radius
+        points = np.column_stack([np.ravel(qx), np.ravel(qy)])
+        dist, idx = self.tree.query(points, k=k, distance_upper_bound=upper)
+        if k == 1:
+            dist = dist[:, None]
+            idx = idx[:, None]
+        return dist, idx
+
+    def within(self, qx, qy, radius):
+        """各查詢點搜尋半徑內的測站編號 (依編號排序的陣列清單)"""
+        points = np.column_stack([np.ravel(qx), np.ravel(qy)])
+        found = self.tree.query_ball_point(points, radius, return_sorted=True)
+        return [np.asarray(idx, dtype=np.int64) for idx in found]
+
+    def cells(self, grid):
+        """各測站在網格上的像元編號 (網格外為 -1)；同一網格只計算一次
+
+        網格需與索引使用相同的座標系統。
+        """
+        if normalize_crs(grid.crs) != self.crs:
+            raise ValueError(f"網格座標系統 {grid.crs} 與測站索引 {self.crs} 不同")
+        key = repr(sorted(grid.to_dict().items()))
+        cells = self._cells.get(key)
+        if cells is None:
+            cells = grid.cell_index(self.x, self.y)
+            self._cells[key] = cells
+        return cells
+
+    def cell_members(self, grid):
+        """有測站的像元及其測站編號: {像元編號: 測站編號陣列}"""
+        cells = self.cells(grid)
+        order = np.argsort(cells, kind='stable')
+        order = order[cells[order] >= 0]
+        occupied, starts = np.unique(cells[order], return_index=True)
+        return dict(zip(occupied.tolist(), np.split(order, starts[1:])))
+
+    def close_pairs(self, tolerance=DEFAULT_TOLERANCE):
+        """距離不超過 tolerance 的測站組合 (i < j)，為 (組合數, 2) 陣列"""
+        return self.tree.query_pairs(tolerance, output_type='ndarray')
+
+    def save(self, path):
+        """存為 .npz (先寫入暫存檔再取代)；KD-tree 在讀取時由 (已投影的) 座標重建"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, x=self.x, y=self.y, crs=np.array(self.crs), key=np.array(self.key))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """讀取 save() 存出的索引"""
+        with np.load(path) as f:
+            return cls(f['x'], f['y'], str(f['crs']), str(f['key']))
+
+
+def load_or_build_index(path, lon, lat, crs=DEFAULT_CRS):
+    """讀取索引檔；不存在、無法讀取或測站座標、座標系統已改變時重新建立並存檔
+
+    lon, lat 為測站經緯度；crs 不是經緯度時投影到 crs 後建立索引。
+    path 為 None 時只在記憶體中建立。回傳 (StationIndex, 是否由檔案讀取)。
+    """
+    crs = normalize_crs(crs)
+    if path and os.path.exists(path):
+        try:
+            index = StationIndex.load(path)
+            if index.matches(lon, lat) and index.crs == crs:
+                return index, True
+        except Exception as e:
+            print(f"無法讀取測站索引 {path}，重新建立: {str(e)}")
+
+    index = StationIndex.from_lonlat(lon, lat, crs)
+    if path:
+        index.save(path)
+    return index, False
+
+
+def station_report(index, grid=None, tolerance=DEFAULT_TOLERANCE):
+    """測站檢查: 最近測站距離、位置重複的測站與網格外或共用像元的測站"""
+    report = {'stations': index.n, 'close_pairs': index.close_pairs(tolerance)}
+    if index.n > 1:
+        dist = index.nearest(index.x, index.y, k=2)[0][:, 1]
+        report['nearest'] = (float(dist.min()), float(np.median(dist)), float(dist.max()))
+    if grid is not None:
+        cells = index.cells(grid)
+        members = index.cell_members(grid)
+        report['outside'] = np.flatnonzero(cells < 0)
+        report['shared_cells'] = {cell: idx for cell, idx in members.items() if len(idx) > 1}
+    return report
+
+
+def print_report(index, report, tolerance=DEFAULT_TOLERANCE):
+    print(f"測站數: {report['stations']}")
+    if 'nearest' in report:
+        low, median, high = report['nearest']
+        print(f"最近測站距離: 最小 {low:.6f}, 中位數 {median:.6f}, 最大 {high:.6f}")
+
+    pairs = report['close_pairs']
+    print(f"距離不超過 {tolerance} 的測站組合: {len(pairs)}")
+    for i, j in pairs[:20]:
+        print(f"  - ({index.x[i]:.5f}, {index.y[i]:.5f}) 與 ({index.x[j]:.5f}, {index.y[j]:.5f})")
+
+    if 'outside' in report:
+        print(f"網格外的測站: {len(report['outside'])}")
+        shared = report['shared_cells']
+        print(f"有多個測站的像元: {len(shared)} (共 {sum(len(idx) for idx in shared.values())} 個測站)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='建立測站空間索引並檢查測站位置')
+    parser.add_argument('--folder', default='.', help='result.csv 或 result_store/ 所在的資料夾')
+    parser.add_argument('--grid', default=None,
+                        help=f'同時檢查網格外與共用像元的測站 (例如 {GRID_FILE})')
+    parser.add_argument('--crs', default=DEFAULT_CRS,
+                        help='索引的座標系統 (預設 EPSG:4326；例如 EPSG:3826 為 TWD97 公尺座標)')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='視為同一位置的測站距離 (與座標同單位，預設約 10 公尺)')
+    args = parser.parse_args()
+
+    from rain_store import STORE_DIR, has_store, open_store
+
+    try:
+        store_dir = os.path.join(args.folder, STORE_DIR)
+        if has_store(store_dir):
+            store = open_store(store_dir)
+            lon, lat = store.lon, store.lat
+        else:
+            import pandas as pd
+            df = pd.read_csv(os.path.join(args.folder, 'result.csv'), usecols=['LON', 'LAT'])
+            lon = df['LON'].to_numpy(dtype=np.float64)
+            lat = df['LAT'].to_numpy(dtype=np.float64)
+
+        path = os.path.join(args.folder, index_file(args.crs))
+        index, from_file = load_or_build_index(path, lon, lat, args.crs)
+        print(f"{'已讀取' if from_file else '已建立'}測站索引: {path}")
+
+        tolerance = args.tolerance
+        if tolerance is None:
+            tolerance = DEFAULT_TOLERANCE if is_geographic(args.crs) else METRIC_TOLERANCE
+        grid = GridSpec.load(args.grid) if args.grid else None
+        print_report(index, station_report(index, grid, tolerance), tolerance)
+    except Exception as e:
+        print(f"檢查測站時發生錯誤: {str(e)}")
+        traceback.print_exc()
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
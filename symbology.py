@@ -0,0 +1,365 @@
+"""不需 ArcGIS Pro 的降雨柵格分級與符號設定
+
+取代 Raster Symbology_*.py 中 ArcGISProject("CURRENT") → addDataFromPath → 設定 colorizer → saveACopy 的流程：
+以 NumPy 計算等間隔或手動分界點，對每個柵格輸出
+
+    rain_YYYY_MM.tif   內含色彩表 (colormap) 的 uint8 分級 GeoTIFF，任何 GIS 軟體開啟即為分級顏色
+    rain_YYYY_MM.png   預覽圖 (無資料為透明)
+    rain_YYYY_MM.lyrx  ArcGIS Pro 圖層檔 (CIMRasterClassifyColorizer，指向原始柵格)
+    rain_YYYY_MM.qml   QGIS 樣式檔 (離散色彩的單波段偽彩色)
+
+圖層檔與樣式檔由 templates/ 中的範本產生；色彩為 Yellow-Orange-Brown。
+預設 (--scope global) 由 raster_stats.py 的整體統計計算一組所有月份共用的分界點，
+各柵格只做查表分級；--scope file 則與原腳本相同，依各柵格自己的最小值與最大值分級。
+各柵格互不相依，以行程池平行處理整個資料夾，可在沒有圖形介面的伺服器上執行。
+
+使用方式:
+    python symbology.py raster_IDW --method equal --workers 4
+    python symbology.py raster_IDW --method quantile
+    python symbology.py raster_IDW --method manual --scope file --formats tif lyrx
+"""
+import argparse
+import glob
+import json
+import os
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from string import Template
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+import rasterio
+from rasterio.errors import NotGeoreferencedWarning
+
+from instrument import add_arguments, configure, count, info, stage
+from raster_stats import StreamingHistogram, load_or_compute_stats
+
+# 原始資料的缺值標記 (與 SetNull "VALUE = -99.9" 相同)
+NODATA = -99.9
+
+# 分級柵格中代表無資料的類別
+CLASS_NODATA = 0
+
+# ColorBrewer YlOrBr (9 級)，對應 ArcGIS 的 Yellow-Orange-Brown
+YLORBR = (
+    (255, 255, 229), (255, 247, 188), (254, 227, 145), (254, 196, 79), (254, 153, 41),
+    (236, 112, 20), (204, 76, 2), (153, 52, 4), (102, 37, 6),
+)
+
+# 等間隔分級的預設類別數 (與 breakCount = 9 相同)
+DEFAULT_CLASSES = 9
+
+FORMATS = ('tif', 'png', 'lyrx', 'qml')
+
+# 分級方式對應的 ArcGIS classificationMethod 與 QGIS classificationMode
+CLASSIFICATION_MODES = {
+    'equal': ('EqualInterval', '2'),
+    'quantile': ('Quantile', '3'),
+    'manual': ('Manual', '1'),
+}
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def ramp_colors(n_classes, ramp=YLORBR):
+    """沿色帶線性內插出 n_classes 個 RGB 顏色"""
+    ramp = np.asarray(ramp, dtype=np.float64)
+    if n_classes == 1:
+        return [tuple(int(c) for c in ramp[-1])]
+    position = np.linspace(0, len(ramp) - 1, n_classes)
+    colors = np.column_stack([np.interp(position, np.arange(len(ramp)), ramp[:, i]) for i in range(3)])
+    return [tuple(int(c) for c in row) for row in np.round(colors)]
+
+
+def equal_interval_breaks(min_value, max_value, n_classes=DEFAULT_CLASSES):
+    """等間隔分級的各類別上界"""
+    if max_value <= min_value:
+        return [float(max_value)]
+    return [float(v) for v in np.linspace(min_value, max_value, n_classes + 1)[1:]]
+
+
+def manual_breaks(max_value):
+    """與 Raster Symbology_manual interval.py 相同的手動分界點: -99.9、0 與 最大值 / 8 的倍數"""
+    breaks = [NODATA, 0.0]
+    if max_value > 0:
+        interval = max_value / 8
+        breaks.extend(i * interval for i in range(1, 8))
+    return [float(v) for v in breaks]
+
+
+def quantile_breaks(quantile, max_value, n_classes=DEFAULT_CLASSES):
+    """分位數分級的各類別上界；quantile 為 q → 數值 的函式
+
+    資料集中在少數數值時，重複的分界點只保留一個。
+    """
+    breaks = [quantile(i / n_classes) for i in range(1, n_classes)] + [max_value]
+    return sorted(set(float(v) for v in breaks))
+
+
+def read_values(path):
+    """讀取第一個波段；檔案的無資料值與 -99.9 皆視為無資料 (遮罩陣列)"""
+    with rasterio.open(path) as src:
+        data = src.read(1, masked=True).astype(np.float64)
+        profile = src.profile
+    mask = np.ma.getmaskarray(data) | np.isnan(data.filled(0)) | np.isclose(data.filled(0), NODATA)
+    return np.ma.masked_array(data.filled(0), mask=mask), profile
+
+
+def classify(values, breaks):
+    """依類別上界分級 (上界包含在該類別內，與 ArcGIS 相同)
+
+    回傳 uint8 類別 (1 起算)；無資料為 CLASS_NODATA，超過最後上界的值歸入最後一級。
+    """
+    data = np.ma.getdata(values)
+    classes = np.searchsorted(np.asarray(breaks), data, side='left') + 1
+    classes = np.minimum(classes, len(breaks)).astype(np.uint8)
+    classes[np.ma.getmaskarray(values)] = CLASS_NODATA
+    return classes
+
+
+def class_labels(breaks, min_value):
+    """各類別的標籤 (下界 - 上界)"""
+    lower = [min(min_value, breaks[0]), *breaks[:-1]]
+    return [f"{lo:.1f} - {hi:.1f}" for lo, hi in zip(lower, breaks)]
+
+
+def write_classified(path, classes, profile, colors):
+    """寫出內含色彩表的 uint8 分級 GeoTIFF"""
+    out = profile.copy()
+    out.update(driver='GTiff', dtype='uint8', count=1, nodata=CLASS_NODATA, compress='deflate',
+               photometric='palette')
+    out.pop('blockxsize', None)
+    out.pop('blockysize', None)
+    out.pop('tiled', None)
+    out.pop('predictor', None)
+    if os.path.exists(path):
+        os.remove(path)
+    with rasterio.open(path, 'w', **out) as dst:
+        dst.write(classes, 1)
+        colormap = {CLASS_NODATA: (255, 255, 255, 0)}
+        colormap.update({i + 1: (*color, 255) for i, color in enumerate(colors)})
+        dst.write_colormap(1, colormap)
+
+
+def write_quicklook(path, classes, colors):
+    """寫出 RGBA 預覽圖；無資料為透明"""
+    table = np.zeros((256, 4), dtype=np.uint8)
+    for i, color in enumerate(colors):
+        table[i + 1] = (*color, 255)
+    rgba = table[classes].transpose(2, 0, 1)
+    if os.path.exists(path):
+        os.remove(path)
+    # 預覽圖不含地理參考
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', NotGeoreferencedWarning)
+        with rasterio.open(path, 'w', driver='PNG', width=classes.shape[1], height=classes.shape[0],
+                           count=4, dtype='uint8') as dst:
+            dst.write(rgba)
+
+
+def _template(name):
+    with open(os.path.join(TEMPLATE_DIR, name), encoding='utf-8') as f:
+        return Template(f.read())
+
+
+def _cim_color(color):
+    return {'type': 'CIMRGBColor', 'values': [*color, 100]}
+
+
+def write_lyrx(path, raster_path, breaks, labels, colors, method):
+    """由範本寫出 ArcGIS Pro 圖層檔 (指向原始柵格)"""
+    class_breaks = [
+        {'type': 'CIMRasterClassBreak', 'upperBound': upper, 'label': label, 'color': _cim_color(color)}
+        for upper, label, color in zip(breaks, labels, colors)
+    ]
+    color_ramp = {
+        'type': 'CIMMultipartColorRamp',
+        'colorSpace': {'type': 'CIMICCColorSpace', 'url': 'Default RGB'},
+        'colorRamps': [
+            {'type': 'CIMLinearContinuousColorRamp',
+             'colorSpace': {'type': 'CIMICCColorSpace', 'url': 'Default RGB'},
+             'fromColor': _cim_color(start), 'toColor': _cim_color(stop)}
+            for start, stop in zip(YLORBR[:-1], YLORBR[1:])
+        ],
+        'weights': [1.0 / (len(YLORBR) - 1)] * (len(YLORBR) - 1),
+    }
+    raster_path = os.path.abspath(raster_path)
+    content = _template('rain_classified.lyrx').substitute(
+        layer_name=os.path.splitext(os.path.basename(raster_path))[0],
+        workspace=json.dumps(f"DATABASE={os.path.dirname(raster_path)}", ensure_ascii=False),
+        dataset=json.dumps(os.path.basename(raster_path), ensure_ascii=False),
+        classification_method=CLASSIFICATION_MODES[method][0],
+        class_breaks=json.dumps(class_breaks, indent=2, ensure_ascii=False),
+        color_ramp=json.dumps(color_ramp, indent=2),
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def write_qml(path, breaks, labels, colors, min_value, method):
+    """由範本寫出 QGIS 樣式檔 (離散色彩，上界包含在該類別內)"""
+    items = '\n'.join(
+        f'          <item alpha="255" value="{upper!r}" label={quoteattr(label)} '
+        f'color="#{r:02x}{g:02x}{b:02x}"/>'
+        for upper, label, (r, g, b) in zip(breaks, labels, colors)
+    )
+    content = _template('rain_classified.qml').substitute(
+        classification_min=repr(float(min(min_value, breaks[0]))),
+        classification_max=repr(float(breaks[-1])),
+        classification_mode=CLASSIFICATION_MODES[method][1],
+        items=items,
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def compute_breaks(values, method='equal', n_classes=DEFAULT_CLASSES):
+    """依柵格數值計算分界點，回傳 (分界點, 最小值)"""
+    if values.count() == 0:
+        return [0.0], 0.0
+    min_value, max_value = float(values.min()), float(values.max())
+    if method == 'equal':
+        return equal_interval_breaks(min_value, max_value, n_classes), min_value
+    if method == 'quantile':
+        data = values.compressed()
+        return quantile_breaks(lambda q: np.quantile(data, q), max_value, n_classes), min_value
+    return manual_breaks(max_value), min_value
+
+
+def global_breaks(stats, method='equal', n_classes=DEFAULT_CLASSES):
+    """由 raster_stats 的整體統計計算所有月份共用的分界點，回傳 (分界點, 最小值)"""
+    if not stats.get('count'):
+        return [0.0], 0.0
+    min_value, max_value = stats['min'], stats['max']
+    if method == 'equal':
+        return equal_interval_breaks(min_value, max_value, n_classes), min_value
+    if method == 'quantile':
+        return quantile_breaks(StreamingHistogram.from_dict(stats).quantile, max_value, n_classes), min_value
+    return manual_breaks(max_value), min_value
+
+
+def symbolize(raster_path, output_folder, method='equal', n_classes=DEFAULT_CLASSES,
+              formats=FORMATS, breaks=None, min_value=None):
+    """對單一柵格輸出分級柵格、預覽圖與樣式檔，回傳 (分界點, 輸出檔案清單)
+
+    breaks 為 None 時依此柵格的數值計算；指定時直接使用 (各月份共用同一組分界點)，
+    此時圖層檔與樣式檔以手動分界點記錄，開啟時不會再依單一柵格重新分級。
+    """
+    values, profile = read_values(raster_path)
+    if breaks is None:
+        breaks, min_value = compute_breaks(values, method, n_classes)
+    else:
+        method = 'manual'
+        if min_value is None:
+            min_value = breaks[0]
+    colors = ramp_colors(len(breaks))
+    labels = class_labels(breaks, min_value)
+
+    base = os.path.join(output_folder, os.path.splitext(os.path.basename(raster_path))[0])
+    outputs = []
+    classes = classify(values, breaks) if ('tif' in formats or 'png' in formats) else None
+    if 'tif' in formats:
+        write_classified(base + '.tif', classes, profile, colors)
+        outputs.append(base + '.tif')
+    if 'png' in formats:
+        write_quicklook(base + '.png', classes, colors)
+        outputs.append(base + '.png')
+    if 'lyrx' in formats:
+        write_lyrx(base + '.lyrx', raster_path, breaks, labels, colors, method)
+        outputs.append(base + '.lyrx')
+    if 'qml' in formats:
+        write_qml(base + '.qml', breaks, labels, colors, min_value, method)
+        outputs.append(base + '.qml')
+    return breaks, outputs
+
+
+def _symbolize_or_error(raster_path, output_folder, method, n_classes, formats, breaks, min_value):
+    try:
+        with stage('symbolize', file=os.path.basename(raster_path)):
+            return raster_path, symbolize(raster_path, output_folder, method, n_classes, formats,
+                                          breaks, min_value), None
+    except Exception as e:
+        return raster_path, None, e
+
+
+def symbolize_folder(raster_folder, output_folder=None, method='equal', n_classes=DEFAULT_CLASSES,
+                     formats=FORMATS, workers=4, pattern='*.tif', breaks=None, min_value=None, log=print):
+    """平行處理資料夾中的所有柵格，回傳失敗的檔案清單
+
+    breaks 指定時所有柵格共用同一組分界點 (見 global_breaks)。
+    """
+    if output_folder is None:
+        output_folder = os.path.join(raster_folder, "Raster Symbology")
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    raster_files = sorted(glob.glob(os.path.join(raster_folder, pattern)))
+    log(f"找到 {len(raster_files)} 個柵格檔案")
+
+    failed = []
+    args = [(path, output_folder, method, n_classes, formats, breaks, min_value) for path in raster_files]
+    if workers <= 1:
+        results = (_symbolize_or_error(*a) for a in args)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_symbolize_or_error, *zip(*args)) if args else []
+    try:
+        for raster_path, result, error in results:
+            name = os.path.basename(raster_path)
+            if error is not None:
+                log(f"處理柵格 {name} 時發生錯誤: {error}")
+                failed.append(raster_path)
+                continue
+            used_breaks, outputs = result
+            count('rasters')
+            log(f"{name}: 分界點 {', '.join(f'{b:.1f}' for b in used_breaks)}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='不需 ArcGIS Pro，批次輸出降雨柵格的分級柵格、預覽圖與樣式檔')
+    parser.add_argument('raster_folder', help='柵格資料夾 (例如 raster_IDW)')
+    parser.add_argument('--output-folder', default=None,
+                        help='輸出資料夾 (預設為 <柵格資料夾>/Raster Symbology)')
+    parser.add_argument('--method', choices=['equal', 'quantile', 'manual'], default='equal',
+                        help='equal: 等間隔 (與 Raster Symbology_equal interval.py 相同)；'
+                             'quantile: 分位數 (各類別像元數大致相同)；'
+                             'manual: -99.9、0 與 最大值/8 的倍數')
+    parser.add_argument('--scope', choices=['global', 'file'], default='global',
+                        help='global: 所有柵格共用依整體統計計算的分界點 (預設)；file: 各柵格各自分級')
+    parser.add_argument('--classes', type=int, default=DEFAULT_CLASSES, help='等間隔分級的類別數 (預設 9)')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS), help='輸出格式')
+    parser.add_argument('--workers', type=int, default=4, help='平行處理的行程數 (預設 4)')
+    parser.add_argument('--pattern', default='*.tif', help='柵格檔名樣式 (預設 *.tif)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    print(f"正在處理資料夾: {args.raster_folder}")
+    breaks = min_value = None
+    if args.scope == 'global':
+        try:
+            with stage('stats'):
+                stats, from_file = load_or_compute_stats(args.raster_folder, args.pattern)
+        except Exception:
+            traceback.print_exc()
+            exit(1)
+        breaks, min_value = global_breaks(stats, args.method, args.classes)
+        print(f"{'沿用' if from_file else '已建立'}整體統計: 最小值 {min_value:.1f}，"
+              f"共用分界點 {', '.join(f'{b:.1f}' for b in breaks)}")
+
+    with stage('symbolize_folder'):
+        failed = symbolize_folder(args.raster_folder, args.output_folder, args.method, args.classes,
+                                  args.formats, args.workers, args.pattern, breaks, min_value, log=info)
+    print(f"\n所有柵格符號設定完成 ({len(failed)} 個失敗)")
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
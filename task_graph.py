@@ -0,0 +1,189 @@
+"""以相依關係圖 (DAG) 執行的增量工作排程
+
+每個工作 (Task) 宣告輸入檔案、輸出檔案、上游工作與額外的指紋 (例如參數或資料切片的雜湊)。
+輸入檔案以 大小 + 修改時間 快速判斷是否變動，變動時才重新計算內容雜湊 (SHA-256)；
+上次成功執行時的輸入簽章與輸出雜湊記錄在狀態檔中。
+只有簽章改變、輸出遺失或輸出被修改的工作會重新執行；
+上游重新執行但輸出內容不變時，下游工作不會被牽動。
+彼此沒有相依關係的工作 (例如不同月份) 以執行緒池同時執行。
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrument import stage
+from monthly_cache import file_digest
+
+
+class Task:
+    """單一工作
+
+    action: 不需參數的函式，負責產生 outputs
+    fingerprint: 字串，或在上游完成後才計算的函式 (回傳字串)
+    """
+
+    def __init__(self, name, action, inputs=(), outputs=(), deps=(), fingerprint=''):
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return f"Task({self.name!r})"
+
+
+class TaskGraph:
+    """工作的相依關係圖與執行狀態"""
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.state = {'files': {}, 'tasks': {}}
+        if os.path.exists(state_file):
+            try:
+                with open(state_file, encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise ValueError(f"重複的工作名稱: {task.name}")
+        self.tasks[task.name] = task
+        return task
+
+    def digest(self, path):
+        """檔案內容雜湊；大小與修改時間未變時沿用記錄的雜湊"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.state['files'].get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        sha = file_digest(path)
+        with self.lock:
+            self.state['files'][path] = [stat.st_size, stat.st_mtime_ns, sha]
+        return sha
+
+    def signature(self, task):
+        """由指紋與輸入檔案內容計算工作的輸入簽章"""
+        fingerprint = task.fingerprint() if callable(task.fingerprint) else task.fingerprint
+        sig = hashlib.sha256(str(fingerprint).encode('utf-8'))
+        for path in sorted(task.inputs):
+            sig.update(os.path.abspath(path).encode('utf-8'))
+            sig.update(self.digest(path).encode('utf-8') if os.path.exists(path) else b'missing')
+        return sig.hexdigest()
+
+    def is_stale(self, task, signature):
+        """輸入簽章改變、輸出遺失或輸出被修改時需要重新執行"""
+        with self.lock:
+            record = self.state['tasks'].get(task.name)
+        if record is None or record.get('signature') != signature:
+            return True
+        for path in task.outputs:
+            if not os.path.exists(path):
+                return True
+            if record['outputs'].get(os.path.abspath(path)) != self.digest(path):
+                return True
+        return False
+
+    def _record(self, task, signature):
+        outputs = {os.path.abspath(path): self.digest(path) for path in task.outputs}
+        with self.lock:
+            self.state['tasks'][task.name] = {'signature': signature, 'outputs': outputs}
+
+    def _check(self):
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise KeyError(f"工作 {task.name} 的上游工作 {dep} 不存在")
+
+    def _run_task(self, task, signature):
+        # 追蹤紀錄以工作種類 (名稱冒號前的部分，例如 raster) 為階段
+        with stage(task.name.partition(':')[0], task=task.name):
+            task.action()
+        missing = [path for path in task.outputs if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"工作 {task.name} 未產生輸出: {', '.join(missing)}")
+        self._record(task, signature)
+
+    def run(self, workers=1, force=False, dry_run=False, log=print):
+        """執行所有過期的工作，回傳 (執行, 略過, 失敗) 的工作名稱清單
+
+        dry_run 時只列出會執行的工作；上游會執行的工作其下游一律視為過期。
+        """
+        self._check()
+        pending = dict(self.tasks)
+        done, ran, skipped, failed = set(), [], [], []
+        running = {}
+
+        def ready(task):
+            return all(dep in done for dep in task.deps)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                while pending or running:
+                    progressed = False
+                    for name, task in list(pending.items()):
+                        if any(dep in failed for dep in task.deps):
+                            del pending[name]
+                            failed.append(name)
+                            log(f"略過 {name}: 上游工作失敗")
+                            progressed = True
+                            continue
+                        if not ready(task):
+                            continue
+
+                        del pending[name]
+                        progressed = True
+                        upstream_ran = any(dep in ran for dep in task.deps)
+                        try:
+                            signature = None if (dry_run and upstream_ran) else self.signature(task)
+                            stale = (force or signature is None or self.is_stale(task, signature))
+                        except Exception as e:
+                            failed.append(name)
+                            log(f"工作 {name} 失敗: {e}")
+                            continue
+
+                        if not stale:
+                            skipped.append(name)
+                            done.add(name)
+                        elif dry_run:
+                            log(f"將執行: {name}")
+                            ran.append(name)
+                            done.add(name)
+                        else:
+                            running[executor.submit(self._run_task, task, signature)] = name
+
+                    if not running and not progressed:
+                        raise ValueError(f"工作之間有循環相依: {', '.join(pending)}")
+                    if running and not progressed:
+                        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            name = running.pop(future)
+                            error = future.exception()
+                            if error is None:
+                                ran.append(name)
+                                done.add(name)
+                                log(f"完成: {name}")
+                            else:
+                                failed.append(name)
+                                log(f"工作 {name} 失敗: {error}")
+        finally:
+            if not dry_run:
+                self.save()
+        return ran, skipped, failed
+
+    def save(self):
+        """寫出狀態檔 (先寫入暫存檔再取代，避免中斷時損毀)"""
+        tmp_path = self.state_file + '.tmp'
+        with self.lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+        os.replace(tmp_path, self.state_file)